@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.contrib.admin.forms import AdminPasswordChangeForm
 from django.contrib.auth.forms import UserChangeForm, UserCreationForm
 from django.utils.translation import gettext_lazy as _
-from accounts.models import UserPhoneNumberModel, UserEmailModel, User
+from accounts.models import UserPhoneNumberModel, UserEmailModel, User, SigningKey
 
 
 @admin.register(UserPhoneNumberModel)
@@ -131,3 +131,21 @@ class UserAdminModel(admin.ModelAdmin):
     search_fields = ["id", "username"]
     list_per_page = 50
     save_on_top = True
+
+
+@admin.register(SigningKey)
+class SigningKeyAdminModel(admin.ModelAdmin):
+    list_display = [
+        "kid",
+        "algorithm",
+        "retired_at",
+        "created_at",
+    ]
+    list_filter = [
+        "algorithm",
+        "retired_at",
+    ]
+    exclude = ["private_key"]
+    readonly_fields = ["kid", "algorithm", "public_key"]
+    search_fields = ["kid"]
+    list_per_page = 50
@@ -7,3 +7,6 @@ class AccountsConfig(AppConfig):
 
     def ready(self):
         import accounts.signals  # noqa
+        from accounts.jwks import install_token_backend
+
+        install_token_backend()
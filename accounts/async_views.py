@@ -0,0 +1,205 @@
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from django.views import View
+from phonenumber_field.serializerfields import PhoneNumberField
+from rest_framework import exceptions, serializers, status
+from rest_framework.parsers import FormParser, JSONParser
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from accounts.authentication import ClaimsJWTAuthentication
+from accounts.custom_jwt import CustomToken
+from accounts.exceptions import AccountNotRegisteredException
+from accounts.models import User, UserEmailModel, UserPhoneNumberModel
+from accounts.serializers import UserRegistrationSerializer
+from accounts.tasks import publish_last_login
+from accounts.throttling import CREDENTIAL_THROTTLES
+from accounts.token_families import start_token_family
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncChannelSerializer(serializers.Serializer):
+    phone_number = PhoneNumberField(allow_null=True, required=False)
+    email = serializers.EmailField(allow_null=True, required=False)
+
+    def validate(self, attrs):
+        if not any([attrs.get("phone_number"), attrs.get("email")]):
+            raise serializers.ValidationError(
+                "Please provide either a phone number or an email."
+            )
+        return attrs
+
+
+class AsyncVerifyOTPSerializer(AsyncChannelSerializer):
+    otp = serializers.CharField(
+        max_length=settings.TOKEN_LENGTH, required=True, allow_null=False
+    )
+
+
+class AsyncAPIView(View):
+    """
+    Native async view for the ASGI stack.
+
+    Mirrors the DRF views' request parsing, throttling and error format.
+    Field validation needs no database and runs on the event loop. ORM calls
+    use the async queryset API. Blocking work (password hashing, Redis
+    throttles, broker publishes, the transactional registration) goes through
+    `sync_to_async`.
+    """
+
+    throttle_classes = ()
+    throttle_scope = None
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.drf_request = Request(request, parsers=[JSONParser(), FormParser()])
+        try:
+            await sync_to_async(self.check_throttles)()
+            return await super().dispatch(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return self.handle_exception(exc)
+
+    def check_throttles(self):
+        for throttle_class in self.throttle_classes:
+            throttle = throttle_class()
+            if not throttle.allow_request(self.drf_request, self):
+                raise exceptions.Throttled(throttle.wait())
+
+    def handle_exception(self, exc):
+        detail = exc.detail
+        if not isinstance(detail, (dict, list)):
+            detail = {"detail": detail}
+        response = JsonResponse(detail, status=exc.status_code, safe=False)
+        wait = getattr(exc, "wait", None)
+        if wait:
+            response["Retry-After"] = "%d" % wait
+        return response
+
+    def get_data(self):
+        return self.drf_request.data
+
+    def validate(self, serializer_class):
+        serializer = serializer_class(data=self.get_data())
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+    async def get_channel(self, validated_data):
+        phone_number = validated_data.get("phone_number")
+        try:
+            if phone_number:
+                return await UserPhoneNumberModel.objects.aget(
+                    phone_number=phone_number
+                )
+            return await UserEmailModel.objects.aget(email=validated_data["email"])
+        except (UserPhoneNumberModel.DoesNotExist, UserEmailModel.DoesNotExist):
+            raise AccountNotRegisteredException()
+
+
+class AsyncUserRegistrationView(AsyncAPIView):
+    async def post(self, request):
+        data = await sync_to_async(self.register)()
+        return JsonResponse(data, status=status.HTTP_201_CREATED)
+
+    def register(self):
+        # The sync view's atomic registration, which maps unique violations
+        # to validation errors.
+        serializer = UserRegistrationSerializer(data=self.get_data())
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return serializer.data
+
+
+class AsyncLoginView(AsyncAPIView):
+    throttle_classes = CREDENTIAL_THROTTLES
+    throttle_scope = "login"
+
+    async def post(self, request):
+        data = self.get_data()
+        username = data.get("username")
+        password = data.get("password")
+        user = None
+        if username and password:
+            user = (
+                await User.objects.select_related("email_model", "phone_number_model")
+                .filter(username=username)
+                .afirst()
+            )
+        if user is None:
+            if password:
+                # Keep the timing of unknown users close to wrong passwords.
+                await sync_to_async(User().set_password)(password)
+            return JsonResponse(
+                {"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED
+            )
+        if not (await user.acheck_password(password) and user.is_active):
+            return JsonResponse(
+                {"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED
+            )
+
+        is_phone_number_verified = user.is_phone_number_verified()
+        is_email_verified = user.is_email_verified()
+        if not any([is_email_verified, is_phone_number_verified]):
+            message = "You need to verify your"
+            if is_email_verified is False:
+                message += " email."
+            elif is_phone_number_verified is False:
+                message += " phone number."
+            message += " Kindly generate OTP to verify."
+            return JsonResponse({"error": message}, status=status.HTTP_400_BAD_REQUEST)
+        await sync_to_async(publish_last_login)(user.id, timezone.now())
+        token = await sync_to_async(start_token_family)(CustomToken.for_user(user))
+        return JsonResponse(
+            {
+                "refresh": str(token),
+                "access": str(token.access_token),
+                "first_name": user.first_name,
+                "last_name": user.last_name,
+                "username": user.username,
+            }
+        )
+
+
+class AsyncGenerateOTPView(AsyncAPIView):
+    throttle_classes = CREDENTIAL_THROTTLES
+    throttle_scope = "otp_generate"
+
+    async def post(self, request):
+        channel = await self.get_channel(self.validate(AsyncChannelSerializer))
+        if channel.is_verified:
+            raise exceptions.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [_("This account is verified.")]}
+            )
+        await sync_to_async(channel.send_confirmation_code)()
+        return JsonResponse({"message": _("OTP sent.")})
+
+
+class AsyncVerifyOTPView(AsyncAPIView):
+    throttle_classes = CREDENTIAL_THROTTLES
+    throttle_scope = "otp_verify"
+
+    async def post(self, request):
+        data = self.validate(AsyncVerifyOTPSerializer)
+        channel = await self.get_channel(data)
+        if channel.is_verified:
+            raise exceptions.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [_("This account is verified.")]}
+            )
+        await sync_to_async(channel.check_verification)(data["otp"])
+        return JsonResponse({"message": _("Successfully verified.")})
+
+
+class AsyncProfileView(AsyncAPIView):
+    async def get(self, request):
+        # Claims-only authentication needs no I/O unless the token lacks claims.
+        result = await sync_to_async(ClaimsJWTAuthentication().authenticate)(
+            self.drf_request
+        )
+        if result is None:
+            raise exceptions.NotAuthenticated()
+        user, _token = result
+        return JsonResponse({"username": user.username, "email": user.email})
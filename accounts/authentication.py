@@ -0,0 +1,209 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+logger = logging.getLogger(__name__)
+
+# Claims written by ``CustomToken.for_user`` that are enough to act as the user.
+SNAPSHOT_CLAIMS = (
+    "first_name",
+    "last_name",
+    "username",
+    "email",
+    "phone_number",
+    "is_superuser",
+    "is_staff",
+    "is_active",
+)
+
+
+def get_snapshot_cache():
+    """
+    Returns the shared user-snapshot cache or None when it is disabled.
+    """
+    alias = getattr(settings, "AUTH_USER_SNAPSHOT_CACHE", None)
+    if not alias:
+        return None
+    return caches[alias]
+
+
+def snapshot_cache_key(user_id):
+    return f"accounts:user-snapshot:{user_id}"
+
+
+def build_user_snapshot(user):
+    """
+    Returns the claim-shaped dict of a `User` instance.
+    Expects `email_model` and `phone_number_model` to be selected already.
+    """
+    email = getattr(user, "email_model", None)
+    phone_number = getattr(user, "phone_number_model", None)
+    return {
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "username": user.username,
+        "email": email.email if email else None,
+        "phone_number": str(phone_number.phone_number) if phone_number else None,
+        "is_superuser": user.is_superuser,
+        "is_staff": user.is_staff,
+        "is_active": user.is_active,
+    }
+
+
+def get_user_snapshot(user_id):
+    """
+    Loads a user snapshot from the shared cache, falling back to one joined query.
+    Returns None when the user does not exist.
+    """
+    from accounts.models import User
+
+    cache = get_snapshot_cache()
+    key = snapshot_cache_key(user_id)
+    if cache is not None:
+        try:
+            snapshot = cache.get(key)
+        except Exception as e:
+            # An unreachable cache costs a query per request, not the request.
+            logger.warning(f"User snapshot cache unavailable: {e}")
+            cache = None
+            snapshot = None
+        if snapshot is not None:
+            return snapshot
+    user = (
+        User.objects.select_related("email_model", "phone_number_model")
+        .filter(id=user_id)
+        .first()
+    )
+    if user is None:
+        return None
+    snapshot = build_user_snapshot(user)
+    if cache is not None:
+        try:
+            cache.set(key, snapshot, settings.AUTH_USER_SNAPSHOT_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"User snapshot not cached, cache unavailable: {e}")
+    return snapshot
+
+
+def invalidate_user_snapshots(user_ids):
+    """
+    Drops the cached snapshots. When the cache is unreachable they may stay
+    stale for up to `AUTH_USER_SNAPSHOT_TIMEOUT` seconds.
+    """
+    cache = get_snapshot_cache()
+    user_ids = list(user_ids)
+    if cache is None or not user_ids:
+        return
+    try:
+        cache.delete_many([snapshot_cache_key(user_id) for user_id in user_ids])
+    except Exception as e:
+        logger.warning(f"{len(user_ids)} user snapshots not invalidated: {e}")
+
+
+def invalidate_user_snapshots_on_commit(user_ids, using=None):
+    """
+    Drops the snapshots once the current transaction commits, so a concurrent
+    read cannot cache the old rows again before the change is visible.
+    Outside a transaction they are dropped right away.
+    """
+    user_ids = list(user_ids)
+    transaction.on_commit(lambda: invalidate_user_snapshots(user_ids), using=using)
+
+
+class ClaimsUser(TokenUser):
+    """
+    Lightweight request user built from token claims or a cached snapshot.
+    Use `get_instance()` when the `User` row itself is required.
+    """
+
+    def __init__(self, token, snapshot):
+        super().__init__(token)
+        self.snapshot = snapshot
+
+    def __str__(self):
+        return self.username
+
+    @cached_property
+    def username(self):
+        return self.snapshot.get("username", "")
+
+    @cached_property
+    def first_name(self):
+        return self.snapshot.get("first_name", "")
+
+    @cached_property
+    def last_name(self):
+        return self.snapshot.get("last_name", "")
+
+    @cached_property
+    def email(self):
+        return self.snapshot.get("email")
+
+    @cached_property
+    def phone_number(self):
+        return self.snapshot.get("phone_number")
+
+    @cached_property
+    def is_staff(self):
+        return self.snapshot.get("is_staff", False)
+
+    @cached_property
+    def is_superuser(self):
+        return self.snapshot.get("is_superuser", False)
+
+    @cached_property
+    def is_active(self):
+        return self.snapshot.get("is_active", False)
+
+    def get_instance(self):
+        from accounts.models import User
+
+        return User.objects.get(pk=self.pk)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that builds the request user without a `User` query.
+
+    When the shared snapshot cache is enabled it is authoritative, since it is
+    invalidated once every user or channel save or archive commits. Otherwise
+    token claims are used and the database is only hit for tokens minted
+    without `CustomToken` claims.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        snapshot = self.get_snapshot(user_id, validated_token)
+        if snapshot is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not snapshot.get("is_active"):
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return ClaimsUser(validated_token, snapshot)
+
+    def get_snapshot(self, user_id, validated_token):
+        if get_snapshot_cache() is not None:
+            return get_user_snapshot(user_id)
+        if all(claim in validated_token for claim in SNAPSHOT_CLAIMS):
+            return {claim: validated_token[claim] for claim in SNAPSHOT_CLAIMS}
+        return get_user_snapshot(user_id)
+
+
+def get_model_user(user):
+    """
+    Returns the `User` row behind a request user.
+    """
+    if isinstance(user, ClaimsUser):
+        return user.get_instance()
+    return user
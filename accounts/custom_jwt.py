@@ -1,7 +1,36 @@
-from rest_framework_simplejwt.tokens import RefreshToken
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 
+from accounts.revocation import revocation_keys, revocation_list, revoke_token
+
+
+class RevocationMixin:
+    """
+    Stands in for simplejwt's `BlacklistMixin`, backed by `accounts.revocation`
+    so checking a token that was never revoked needs no per-request query.
+    """
+
+    def verify(self, *args, **kwargs):
+        self.check_blacklist()
+        super().verify(*args, **kwargs)
+
+    def check_blacklist(self):
+        if revocation_list.filter_revoked(revocation_keys(self.payload)):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        revoke_token(self)
+
+
+class CustomAccessToken(RevocationMixin, AccessToken):
+    pass
+
+
+class CustomToken(RevocationMixin, RefreshToken):
+    access_token_class = CustomAccessToken
 
-class CustomToken(RefreshToken):
     @classmethod
     def for_user(cls, user):
         phone_number = getattr(user, "phone_number_model", None)
@@ -9,7 +38,7 @@ class CustomToken(RefreshToken):
         if email:
             email = email.email
         if phone_number:
-            phone_number = phone_number.phone_number
+            phone_number = str(phone_number.phone_number)
         token = super().for_user(user)
         token["first_name"] = user.first_name
         token["last_name"] = user.last_name
@@ -17,6 +46,7 @@ class CustomToken(RefreshToken):
         token["email"] = email
         token["username"] = user.username
         token["is_superuser"] = user.is_superuser
+        token["is_staff"] = user.is_staff
         token["phone_number"] = phone_number
         token["is_active"] = user.is_active
         # You can add more custom data
@@ -1,5 +1,5 @@
 from rest_framework import status
-from rest_framework.exceptions import APIException
+from rest_framework.exceptions import APIException, Throttled
 from django.utils.translation import gettext_lazy as _
 
 
@@ -7,3 +7,16 @@ class AccountNotRegisteredException(APIException):
     status_code = status.HTTP_400_BAD_REQUEST
     default_detail = _("The account is not registered.")
     default_code = "non-registered-account"
+
+
+class HashingUnavailableException(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _("The service is busy, please try again shortly.")
+    default_code = "hashing-unavailable"
+
+
+class OTPAlreadySentException(Throttled):
+    default_detail = _("A code was already sent.")
+    extra_detail_singular = _("Retry in {wait} second.")
+    extra_detail_plural = _("Retry in {wait} seconds.")
+    default_code = "otp-already-sent"
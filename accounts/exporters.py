@@ -0,0 +1,85 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from accounts.models import User
+
+NDJSON = "ndjson"
+CSV = "csv"
+
+CONTENT_TYPES = {NDJSON: "application/x-ndjson", CSV: "text/csv"}
+
+EXPORT_FIELDS = {
+    "id": "id",
+    "username": "username",
+    "first_name": "first_name",
+    "last_name": "last_name",
+    "other_names": "other_names",
+    "id_number": "id_number",
+    "is_active": "is_active",
+    "is_staff": "is_staff",
+    "is_superuser": "is_superuser",
+    "date_joined": "date_joined",
+    "last_login": "last_login",
+    "created_at": "created_at",
+    "updated_at": "updated_at",
+    "email": "email_model__email",
+    "email_verified": "email_model__is_verified",
+    "phone_number": "phone_number_model__phone_number",
+    "phone_number_verified": "phone_number_model__is_verified",
+}
+
+
+def iter_users(chunk_size=2000):
+    """
+    Yields every user joined with its channels as a flat dict.
+
+    Pages are read with keyset pagination over `(created_at, id)`, so every
+    query is bounded and no transaction stays open for the whole export. Each
+    page is streamed through a server-side cursor where the database has one.
+    """
+    queryset = User.objects.order_by("created_at", "id").values(*EXPORT_FIELDS.values())
+    last = None
+    while True:
+        page = queryset
+        if last is not None:
+            page = page.filter(
+                Q(created_at__gt=last["created_at"])
+                | Q(created_at=last["created_at"], id__gt=last["id"])
+            )
+        row = None
+        for row in page[:chunk_size].iterator(chunk_size=chunk_size):
+            user = {name: row[lookup] for name, lookup in EXPORT_FIELDS.items()}
+            if user["phone_number"] is not None:
+                user["phone_number"] = str(user["phone_number"])
+            yield user
+        if row is None:
+            return
+        last = row
+
+
+class Echo:
+    """
+    File-like object handing back whatever `csv.writer` writes to it.
+    """
+
+    def write(self, value):
+        return value
+
+
+def render_users(rows, file_format):
+    """
+    Yields the export one line at a time.
+    """
+    if file_format == CSV:
+        writer = csv.writer(Echo())
+        yield writer.writerow(EXPORT_FIELDS)
+        for row in rows:
+            yield writer.writerow(
+                ["" if value is None else str(value) for value in row.values()]
+            )
+        return
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + "\n"
@@ -0,0 +1,176 @@
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+from accounts.exceptions import HashingUnavailableException
+from base.metrics import (
+    PASSWORD_HASH_QUEUE_SECONDS,
+    PASSWORD_HASH_REJECTED,
+    PASSWORD_HASH_SECONDS,
+    observe,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker(settings_module):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
+    import django
+
+    django.setup()
+
+
+def gevent_patched():
+    """
+    True inside gevent workers, which monkey-patch threads and sockets.
+    """
+    monkey = sys.modules.get("gevent.monkey")
+    return monkey is not None and monkey.is_module_patched("threading")
+
+
+def _make_password(password):
+    return hashers.make_password(password)
+
+
+def _verify_password(password, encoded):
+    return hashers.verify_password(password, encoded)
+
+
+class HashingMetrics:
+    """
+    In-process counters of the hashing executor.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.rejected = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.wait_seconds = 0.0
+        self.hash_seconds = 0.0
+
+    def record(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "failed": self.failed,
+                "in_flight": self.in_flight,
+                "wait_seconds": self.wait_seconds,
+                "hash_seconds": self.hash_seconds,
+            }
+
+
+class HashingExecutor:
+    """
+    Runs password hashing in a pool so CPU-bound PBKDF2 does not block the
+    gevent loop of the web worker.
+
+    Under gevent the pool is gevent's native thread pool: a process pool's
+    result thread and pipes would be monkey-patched and can hang the worker,
+    while hashlib's PBKDF2 releases the GIL. Elsewhere it is a process pool.
+
+    At most `max_pending` jobs are in flight; callers wait up to
+    `queue_timeout` seconds for a slot and get a 503 afterwards. With zero
+    workers hashing runs inline.
+    """
+
+    def __init__(self, workers, max_pending, queue_timeout):
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self.metrics = HashingMetrics()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+
+    def get_pool(self):
+        # The pool is created lazily so every forked web worker gets its own.
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = self.create_pool()
+                self._pid = os.getpid()
+            return self._pool
+
+    def create_pool(self):
+        if gevent_patched():
+            from gevent.threadpool import ThreadPoolExecutor
+
+            return ThreadPoolExecutor(max_workers=self.workers)
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(os.environ["DJANGO_SETTINGS_MODULE"],),
+        )
+
+    def reset_pool(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def run(self, func, *args):
+        operation = func.__name__.lstrip("_")
+        if not self.workers:
+            with observe(PASSWORD_HASH_SECONDS, operation=operation):
+                return func(*args)
+
+        queued_at = time.perf_counter()
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self.metrics.record(rejected=1)
+            PASSWORD_HASH_REJECTED.inc()
+            raise HashingUnavailableException()
+        started = time.perf_counter()
+        self.metrics.record(submitted=1, in_flight=1, wait_seconds=started - queued_at)
+        PASSWORD_HASH_QUEUE_SECONDS.observe(started - queued_at)
+        try:
+            return self.get_pool().submit(func, *args).result()
+        except BrokenProcessPool:
+            self.metrics.record(failed=1)
+            logger.error("Password hashing pool is broken, recreating it.")
+            self.reset_pool()
+            raise HashingUnavailableException()
+        finally:
+            hash_seconds = time.perf_counter() - started
+            self.metrics.record(in_flight=-1, hash_seconds=hash_seconds)
+            PASSWORD_HASH_SECONDS.labels(operation=operation).observe(hash_seconds)
+            self._slots.release()
+
+    def make_password(self, password):
+        if password is None:
+            return hashers.make_password(None)
+        return self.run(_make_password, password)
+
+    def make_passwords(self, passwords, chunksize=64):
+        """
+        Hashes a batch of passwords for bulk jobs, without the pending limit.
+        """
+        if not self.workers:
+            return [hashers.make_password(password) for password in passwords]
+        pool = self.get_pool()
+        return list(pool.map(_make_password, passwords, chunksize=chunksize))
+
+    def verify_password(self, password, encoded):
+        if password is None or not hashers.is_password_usable(encoded):
+            return False, False
+        return self.run(_verify_password, password, encoded)
+
+
+hashing_executor = HashingExecutor(
+    workers=settings.PASSWORD_HASHING_WORKERS,
+    max_pending=settings.PASSWORD_HASHING_MAX_PENDING,
+    queue_timeout=settings.PASSWORD_HASHING_QUEUE_TIMEOUT,
+)
@@ -0,0 +1,266 @@
+import csv
+import itertools
+import json
+import logging
+import os
+from collections import namedtuple
+
+import phonenumbers
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.contrib.auth.base_user import BaseUserManager
+from django.db import transaction
+
+from accounts.exceptions import OTPAlreadySentException
+from accounts.hashing import HashingExecutor
+from accounts.models import User, UserEmailModel, UserPhoneNumberModel
+
+logger = logging.getLogger(__name__)
+
+CSV = "csv"
+JSONL = "jsonl"
+
+TRUE_VALUES = {"1", "true", "t", "yes", "y"}
+
+ChunkResult = namedtuple("ChunkResult", ["position", "created", "skipped", "errors"])
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+def read_records(stream, file_format):
+    """
+    Streams records from a CSV file with a header row or a JSON-lines file.
+    Malformed JSON lines are yielded as None so they keep their position.
+    """
+    if file_format == CSV:
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            yield None
+
+
+def load_checkpoint(path):
+    try:
+        with open(path) as checkpoint:
+            return json.load(checkpoint)
+    except FileNotFoundError:
+        return {}
+
+
+def save_checkpoint(path, state):
+    # Written through a temporary file so a crash never leaves half a checkpoint.
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as checkpoint:
+        json.dump(state, checkpoint)
+    os.replace(temporary_path, path)
+
+
+def to_text(value):
+    return "" if value is None else str(value).strip()
+
+
+def to_bool(value, default=False):
+    if isinstance(value, bool):
+        return value
+    value = to_text(value).lower()
+    if not value:
+        return default
+    return value in TRUE_VALUES
+
+
+def normalize_phone_number(value, region):
+    try:
+        number = phonenumbers.parse(value, region)
+    except phonenumbers.NumberParseException:
+        raise ImportRowError(f"Invalid phone number {value}.")
+    if not phonenumbers.is_valid_number(number):
+        raise ImportRowError(f"Invalid phone number {value}.")
+    return phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164)
+
+
+class UserImporter:
+    """
+    Imports users in chunks, each bulk-inserted in its own transaction.
+
+    Records carry `username`, either a raw `password` or a Django encoded
+    `password_hash`, and an `email` and/or `phone_number`. Optional columns are
+    `first_name`, `last_name`, `other_names`, `id_number`, `is_active`,
+    `email_verified` and `phone_number_verified`.
+
+    Records clashing with an existing username, email or phone number are
+    skipped, so re-running an import over the same input is safe.
+    """
+
+    def __init__(self, chunk_size=1000, workers=0, region=None, send_confirmation=True):
+        self.chunk_size = chunk_size
+        self.region = region or settings.PHONENUMBER_DEFAULT_REGION
+        self.send_confirmation = send_confirmation
+        self.hasher = HashingExecutor(
+            workers=workers, max_pending=1, queue_timeout=None
+        )
+
+    def run(self, records, start=0):
+        """
+        Yields a `ChunkResult` once every chunk is committed. `start` skips the
+        records an earlier run already consumed.
+        """
+        numbered = itertools.islice(enumerate(records, start=1), start, None)
+        try:
+            while chunk := list(itertools.islice(numbered, self.chunk_size)):
+                yield ChunkResult(chunk[-1][0], *self.import_chunk(chunk))
+        finally:
+            self.hasher.reset_pool()
+
+    def normalize_record(self, record):
+        if not isinstance(record, dict):
+            raise ImportRowError("Malformed record.")
+        username = to_text(record.get("username"))
+        if not username:
+            raise ImportRowError("Missing username.")
+        email = to_text(record.get("email"))
+        if email:
+            email = BaseUserManager.normalize_email(email)
+        phone_number = to_text(record.get("phone_number"))
+        if phone_number:
+            phone_number = normalize_phone_number(phone_number, self.region)
+        if not any([email, phone_number]):
+            raise ImportRowError("Please provide either a phone number or an email.")
+
+        password_hash = to_text(record.get("password_hash"))
+        password = record.get("password") or ""
+        if password_hash:
+            try:
+                hashers.identify_hasher(password_hash)
+            except ValueError:
+                raise ImportRowError("Unknown password hash format.")
+        elif not password:
+            raise ImportRowError("Missing password or password_hash.")
+
+        email_verified = bool(email) and to_bool(record.get("email_verified"))
+        phone_number_verified = bool(phone_number) and to_bool(
+            record.get("phone_number_verified")
+        )
+        return {
+            "username": username,
+            "password": password,
+            "password_hash": password_hash,
+            "email": email,
+            "phone_number": phone_number,
+            "first_name": to_text(record.get("first_name")),
+            "last_name": to_text(record.get("last_name")),
+            "other_names": to_text(record.get("other_names")) or None,
+            "id_number": to_text(record.get("id_number")) or None,
+            "email_verified": email_verified,
+            "phone_number_verified": phone_number_verified,
+            # Registration activates a user once one channel is verified.
+            "is_active": to_bool(
+                record.get("is_active"), email_verified or phone_number_verified
+            ),
+        }
+
+    def exclude_duplicates(self, rows):
+        # Archived rows keep their unique values until the archive job moves
+        # them, so they are looked up through the unfiltered base managers.
+        usernames = set(
+            User._base_manager.filter(
+                username__in=[row["username"] for row in rows]
+            ).values_list("username", flat=True)
+        )
+        emails = set(
+            UserEmailModel._base_manager.filter(
+                email__in=[row["email"] for row in rows if row["email"]]
+            ).values_list("email", flat=True)
+        )
+        phone_numbers = {
+            phone_number.as_e164
+            for phone_number in UserPhoneNumberModel._base_manager.filter(
+                phone_number__in=[
+                    row["phone_number"] for row in rows if row["phone_number"]
+                ]
+            ).values_list("phone_number", flat=True)
+        }
+        unique_rows = []
+        for row in rows:
+            if (
+                row["username"] in usernames
+                or row["email"] in emails
+                or row["phone_number"] in phone_numbers
+            ):
+                continue
+            unique_rows.append(row)
+            # Later duplicates inside the same chunk are skipped as well.
+            usernames.add(row["username"])
+            if row["email"]:
+                emails.add(row["email"])
+            if row["phone_number"]:
+                phone_numbers.add(row["phone_number"])
+        return unique_rows
+
+    def hash_passwords(self, rows):
+        raw_rows = [row for row in rows if not row["password_hash"]]
+        hashes = self.hasher.make_passwords([row["password"] for row in raw_rows])
+        for row, password_hash in zip(raw_rows, hashes):
+            row["password_hash"] = password_hash
+
+    def import_chunk(self, chunk):
+        rows, errors = [], []
+        for position, record in chunk:
+            try:
+                rows.append(self.normalize_record(record))
+            except ImportRowError as e:
+                errors.append((position, str(e)))
+
+        unique_rows = self.exclude_duplicates(rows)
+        self.hash_passwords(unique_rows)
+
+        users, emails, phone_numbers = [], [], []
+        for row in unique_rows:
+            user = User(
+                username=row["username"],
+                password=row["password_hash"],
+                first_name=row["first_name"],
+                last_name=row["last_name"],
+                other_names=row["other_names"],
+                id_number=row["id_number"],
+                is_active=row["is_active"],
+            )
+            users.append(user)
+            if row["email"]:
+                emails.append(
+                    UserEmailModel(
+                        user=user, email=row["email"], is_verified=row["email_verified"]
+                    )
+                )
+            if row["phone_number"]:
+                phone_numbers.append(
+                    UserPhoneNumberModel(
+                        user=user,
+                        phone_number=row["phone_number"],
+                        is_verified=row["phone_number_verified"],
+                    )
+                )
+
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+            UserEmailModel.objects.bulk_create(emails)
+            UserPhoneNumberModel.objects.bulk_create(phone_numbers)
+
+        if self.send_confirmation:
+            self.send_confirmation_codes(itertools.chain(phone_numbers, emails))
+        return len(users), len(rows) - len(unique_rows), errors
+
+    def send_confirmation_codes(self, channels):
+        for channel in channels:
+            if channel.is_verified:
+                continue
+            try:
+                channel.send_confirmation_code()
+            except OTPAlreadySentException:
+                logger.info(f"Confirmation code already sent to {channel}")
@@ -0,0 +1,84 @@
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import UntypedToken
+
+from accounts.authentication import get_snapshot_cache, snapshot_cache_key
+from accounts.revocation import revocation_keys, revocation_list
+
+# Registered claims reported at the top level instead of under "claims".
+REGISTERED_CLAIMS = ("token_type", "exp", "iat", "jti")
+
+
+def get_user_statuses(user_ids):
+    """
+    Returns `{user_id: is_active}` for the given ids with one cache and at most
+    one database round trip.
+    """
+    from accounts.models import User
+
+    statuses = {}
+    cache = get_snapshot_cache()
+    if cache is not None:
+        keys = {snapshot_cache_key(user_id): user_id for user_id in user_ids}
+        for key, snapshot in cache.get_many(keys).items():
+            statuses[keys[key]] = snapshot["is_active"]
+    missing = set(user_ids) - set(statuses)
+    if missing:
+        for user_id, is_active in User.objects.filter(id__in=missing).values_list(
+            "id", "is_active"
+        ):
+            statuses[str(user_id)] = is_active
+    return statuses
+
+
+def introspect_tokens(raw_tokens):
+    """
+    Validates access or refresh tokens in bulk.
+    Duplicate tokens are decoded once; user status and revocation are fetched
+    for all tokens together. Results keep the order of `raw_tokens`.
+    """
+    decoded = {}
+    for raw_token in dict.fromkeys(raw_tokens):
+        try:
+            decoded[raw_token] = UntypedToken(raw_token).payload
+        except TokenError as e:
+            decoded[raw_token] = e
+
+    user_ids = {
+        str(payload[api_settings.USER_ID_CLAIM])
+        for payload in decoded.values()
+        if isinstance(payload, dict) and api_settings.USER_ID_CLAIM in payload
+    }
+    statuses = get_user_statuses(user_ids) if user_ids else {}
+    revoked = revocation_list.filter_revoked(
+        [
+            key
+            for payload in decoded.values()
+            if isinstance(payload, dict)
+            for key in revocation_keys(payload)
+        ]
+    )
+
+    results = []
+    for raw_token in raw_tokens:
+        payload = decoded[raw_token]
+        if isinstance(payload, TokenError):
+            results.append({"active": False, "error": str(payload)})
+            continue
+        user_id = str(payload.get(api_settings.USER_ID_CLAIM))
+        result = {
+            "active": bool(statuses.get(user_id)),
+            **{claim: payload.get(claim) for claim in REGISTERED_CLAIMS},
+            "claims": {
+                claim: value
+                for claim, value in payload.items()
+                if claim not in REGISTERED_CLAIMS
+            },
+        }
+        if revoked.intersection(revocation_keys(payload)):
+            result["active"] = False
+            result["error"] = "Token is revoked"
+        elif not result["active"]:
+            result["error"] = "User is inactive or does not exist"
+        results.append(result)
+    return results
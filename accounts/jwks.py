@@ -0,0 +1,235 @@
+import datetime
+import threading
+import time
+
+import jwt
+from django.conf import settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from jwcrypto import jwk
+from jwt import InvalidAlgorithmError, InvalidTokenError
+from rest_framework_simplejwt.backends import TokenBackend
+from rest_framework_simplejwt.exceptions import TokenBackendError
+from rest_framework_simplejwt.settings import api_settings
+
+from base.metrics import JWT_SECONDS, observe
+
+# jwcrypto key parameters for the supported asymmetric algorithms.
+KEY_PARAMS = {
+    "RS256": {"kty": "RSA", "size": 2048},
+    "ES256": {"kty": "EC", "crv": "P-256"},
+}
+
+
+def is_symmetric(algorithm):
+    return algorithm.startswith("HS")
+
+
+def get_publish_delay():
+    """
+    Time a new key is published in the JWKS before it signs tokens: one key ring
+    reload and one JWKS cache lifetime, so verifiers already hold the key.
+    """
+    return datetime.timedelta(
+        seconds=settings.JWT_KEY_RING_REFRESH_SECONDS + settings.JWKS_MAX_AGE
+    )
+
+
+def generate_signing_key(algorithm):
+    """
+    Creates and stores a new `SigningKey`. It is published right away and signs
+    tokens once `get_publish_delay()` has passed.
+    """
+    from accounts.models import SigningKey
+
+    if algorithm not in KEY_PARAMS:
+        raise ValueError(f"Unsupported signing algorithm {algorithm}")
+    key = jwk.JWK.generate(**KEY_PARAMS[algorithm])
+    return SigningKey.objects.create(
+        kid=key.thumbprint(),
+        algorithm=algorithm,
+        private_key=key.export_to_pem(private_key=True, password=None).decode(),
+        public_key=key.export_to_pem().decode(),
+    )
+
+
+def retire_signing_keys(retire_after):
+    """
+    Retires keys superseded for longer than `retire_after`, by then every token
+    they signed has expired. A key is superseded once its successor signs.
+    Returns the number of retired keys.
+    """
+    from accounts.models import SigningKey
+
+    cutoff = timezone.now() - retire_after - get_publish_delay()
+    keys = list(
+        SigningKey.objects.filter(retired_at__isnull=True).order_by("-created_at")
+    )
+    retired = [
+        key.pk
+        for successor, key in zip(keys, keys[1:])
+        if successor.created_at <= cutoff
+    ]
+    return SigningKey.objects.filter(pk__in=retired).update(retired_at=timezone.now())
+
+
+class KeyRing:
+    """
+    Per-process view of the unretired signing keys.
+    Reloaded every `JWT_KEY_RING_REFRESH_SECONDS` and when an unknown `kid` shows up.
+
+    Every key is published and verifies tokens. The newest key past its publish
+    delay signs them; only when no key is, as right after the first one is
+    created, does the oldest key sign.
+    """
+
+    # Minimum seconds between reloads triggered by unknown key ids.
+    MISS_RELOAD_INTERVAL = 5
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = {}
+        # (signing from, kid) of every key, newest first.
+        self._signing_kids = []
+        self._loaded_at = None
+
+    def load(self):
+        from accounts.models import SigningKey
+
+        algorithms = jwt.algorithms.get_default_algorithms()
+        keys = {}
+        signing_kids = []
+        publish_delay = get_publish_delay()
+        for key in SigningKey.objects.filter(retired_at__isnull=True).order_by(
+            "-created_at"
+        ):
+            algorithm = algorithms[key.algorithm]
+            public_jwk = jwk.JWK.from_pem(key.public_key.encode()).export_public(
+                as_dict=True
+            )
+            public_jwk.update({"kid": key.kid, "alg": key.algorithm, "use": "sig"})
+            keys[key.kid] = {
+                "algorithm": key.algorithm,
+                "private_key": algorithm.prepare_key(key.private_key),
+                "public_key": algorithm.prepare_key(key.public_key),
+                "jwk": public_jwk,
+            }
+            signing_kids.append((key.created_at + publish_delay, key.kid))
+        with self._lock:
+            self._keys = keys
+            self._signing_kids = signing_kids
+            self._loaded_at = time.monotonic()
+
+    def _age(self):
+        if self._loaded_at is None:
+            return None
+        return time.monotonic() - self._loaded_at
+
+    def _ensure_fresh(self):
+        age = self._age()
+        if age is None or age > settings.JWT_KEY_RING_REFRESH_SECONDS:
+            self.load()
+
+    def get_signing_key(self):
+        self._ensure_fresh()
+        signing_kids = self._signing_kids
+        if not signing_kids:
+            raise TokenBackendError(_("No signing key configured"))
+        now = timezone.now()
+        kid = next(
+            (kid for signing_from, kid in signing_kids if signing_from <= now),
+            signing_kids[-1][1],
+        )
+        return kid, self._keys[kid]
+
+    def get_verifying_key(self, kid):
+        self._ensure_fresh()
+        if kid not in self._keys and self._age() > self.MISS_RELOAD_INTERVAL:
+            self.load()
+        try:
+            return self._keys[kid]
+        except KeyError:
+            raise TokenBackendError(_("Token is invalid or expired"))
+
+    def get_jwks(self):
+        self._ensure_fresh()
+        return {"keys": [key["jwk"] for key in self._keys.values()]}
+
+
+key_ring = KeyRing()
+
+
+class KeyRingTokenBackend(TokenBackend):
+    """
+    Token backend that signs with the newest `SigningKey` and a `kid` header.
+    HMAC algorithms keep the stock simplejwt behaviour.
+    """
+
+    def encode(self, payload):
+        with observe(JWT_SECONDS, operation="mint", algorithm=self.algorithm):
+            return self._encode(payload)
+
+    def decode(self, token, verify=True):
+        with observe(JWT_SECONDS, operation="verify", algorithm=self.algorithm):
+            return self._decode(token, verify=verify)
+
+    def _encode(self, payload):
+        if is_symmetric(self.algorithm):
+            return super().encode(payload)
+        jwt_payload = payload.copy()
+        if self.audience is not None:
+            jwt_payload["aud"] = self.audience
+        if self.issuer is not None:
+            jwt_payload["iss"] = self.issuer
+        kid, key = key_ring.get_signing_key()
+        token = jwt.encode(
+            jwt_payload,
+            key["private_key"],
+            algorithm=key["algorithm"],
+            headers={"kid": kid},
+            json_encoder=self.json_encoder,
+        )
+        if isinstance(token, bytes):
+            return token.decode("utf-8")
+        return token
+
+    def _decode(self, token, verify=True):
+        if is_symmetric(self.algorithm):
+            return super().decode(token, verify=verify)
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+            key = key_ring.get_verifying_key(kid)
+            return jwt.decode(
+                token,
+                key["public_key"],
+                algorithms=[key["algorithm"]],
+                audience=self.audience,
+                issuer=self.issuer,
+                leeway=self.get_leeway(),
+                options={
+                    "verify_aud": self.audience is not None,
+                    "verify_signature": verify,
+                },
+            )
+        except InvalidAlgorithmError as ex:
+            raise TokenBackendError(_("Invalid algorithm specified")) from ex
+        except InvalidTokenError as ex:
+            raise TokenBackendError(_("Token is invalid or expired")) from ex
+
+
+def install_token_backend():
+    """
+    Replaces simplejwt's module-level backend, which every token class resolves lazily.
+    """
+    from rest_framework_simplejwt import state
+
+    state.token_backend = KeyRingTokenBackend(
+        api_settings.ALGORITHM,
+        api_settings.SIGNING_KEY,
+        api_settings.VERIFYING_KEY,
+        api_settings.AUDIENCE,
+        api_settings.ISSUER,
+        api_settings.JWK_URL,
+        api_settings.LEEWAY,
+        api_settings.JSON_ENCODER,
+    )
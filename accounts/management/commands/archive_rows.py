@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from base.archiving import archivable_models, archive_pending
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves rows flagged as archived to their model's archive table, in "
+        "bounded batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "models",
+            nargs="*",
+            help="Labels of the models to archive, e.g. accounts.User. Defaults to all.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.ARCHIVE_BATCH_SIZE,
+            help="Rows moved per transaction.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=settings.ARCHIVE_BATCH_SLEEP_SECONDS,
+            help="Seconds to sleep between batches.",
+        )
+        parser.add_argument(
+            "--max-batches",
+            type=int,
+            default=None,
+            help="Stop after this many batches per model.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count the rows waiting to be moved.",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+        models = {model._meta.label: model for model in archivable_models()}
+        unknown = set(options["models"]) - set(models)
+        if unknown:
+            raise CommandError(f"Not archivable: {', '.join(sorted(unknown))}.")
+        for label in options["models"] or models:
+            model = models[label]
+            if options["dry_run"]:
+                count = model._default_manager.archived().count()
+                self.stdout.write(f"{label}: {count} rows waiting to be moved.")
+                continue
+            moved = 0
+            for batch in archive_pending(
+                model,
+                batch_size=options["batch_size"],
+                sleep=options["sleep"],
+                max_batches=options["max_batches"],
+            ):
+                moved += batch
+                self.stdout.write(f"{label}: {moved} rows moved so far")
+            self.stdout.write(f"Done: moved {moved} rows from {label}.")
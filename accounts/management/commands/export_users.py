@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from accounts.exporters import CONTENT_TYPES, NDJSON, iter_users, render_users
+
+
+class Command(BaseCommand):
+    help = "Streams every user joined with its email and phone number channels."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format",
+            choices=list(CONTENT_TYPES),
+            default=NDJSON,
+            help="Output format.",
+        )
+        parser.add_argument(
+            "--output",
+            default="-",
+            help="Output file, or - to write to stdout.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Users read per keyset page.",
+        )
+
+    def handle(self, *args, **options):
+        rows = iter_users(chunk_size=options["chunk_size"])
+        lines = render_users(rows, options["format"])
+        if options["output"] == "-":
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+        with open(options["output"], "w", newline="") as stream:
+            stream.writelines(lines)
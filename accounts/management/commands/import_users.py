@@ -0,0 +1,121 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.importers import (
+    CSV,
+    JSONL,
+    UserImporter,
+    load_checkpoint,
+    read_records,
+    save_checkpoint,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams users from a CSV or JSON-lines file and bulk-creates them "
+        "with their email and phone number channels."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Input file, or - to read from stdin.")
+        parser.add_argument(
+            "--format",
+            choices=[CSV, JSONL],
+            default=None,
+            help="Input format. Defaults to the file extension.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Records inserted per transaction.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Processes hashing raw passwords, 0 hashes inline.",
+        )
+        parser.add_argument(
+            "--region",
+            default=None,
+            help="Region of phone numbers without a country code. "
+            "Defaults to PHONENUMBER_DEFAULT_REGION.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            default=None,
+            help="File recording progress after every chunk. "
+            "An existing checkpoint resumes the import.",
+        )
+        parser.add_argument(
+            "--skip-confirmation",
+            action="store_true",
+            help="Do not send confirmation codes to unverified channels.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"]
+        if file_format is None:
+            if path == "-":
+                raise CommandError("--format is required when reading from stdin.")
+            file_format = CSV if path.lower().endswith(".csv") else JSONL
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive.")
+
+        source = path if path == "-" else os.path.abspath(path)
+        checkpoint_path = options["checkpoint"]
+        state = {
+            "source": source,
+            "position": 0,
+            "created": 0,
+            "skipped": 0,
+            "failed": 0,
+        }
+        if checkpoint_path:
+            saved_state = load_checkpoint(checkpoint_path)
+            if saved_state and saved_state["source"] != source:
+                raise CommandError(
+                    f"Checkpoint {checkpoint_path} belongs to {saved_state['source']}."
+                )
+            state.update(saved_state)
+            if state["position"]:
+                self.stdout.write(f"Resuming after record {state['position']}.")
+
+        importer = UserImporter(
+            chunk_size=options["chunk_size"],
+            workers=options["workers"],
+            region=options["region"],
+            send_confirmation=not options["skip_confirmation"],
+        )
+        stream = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+        try:
+            records = read_records(stream, file_format)
+            for result in importer.run(records, start=state["position"]):
+                for position, error in result.errors:
+                    self.stderr.write(f"Record {position}: {error}")
+                state["position"] = result.position
+                state["created"] += result.created
+                state["skipped"] += result.skipped
+                state["failed"] += len(result.errors)
+                if checkpoint_path:
+                    save_checkpoint(checkpoint_path, state)
+                if options["verbosity"] > 1:
+                    self.stdout.write(
+                        f"Imported up to record {result.position}, "
+                        f"{state['created']} created so far."
+                    )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {state['created']} user(s), skipped {state['skipped']} "
+                f"existing and {state['failed']} invalid record(s)."
+            )
+        )
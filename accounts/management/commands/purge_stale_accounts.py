@@ -0,0 +1,90 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from accounts.purge import (
+    ACTIONS,
+    clear_expired_codes,
+    purge_stale_accounts,
+    stale_users,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes or archives accounts never activated nor verified, in bounded "
+        "batches, and blanks expired security codes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.STALE_ACCOUNT_DAYS,
+            help="Purge accounts that joined more than this many days ago.",
+        )
+        parser.add_argument(
+            "--action",
+            choices=ACTIONS,
+            default=settings.STALE_ACCOUNT_ACTION,
+            help="Whether stale accounts are deleted or archived.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.PURGE_BATCH_SIZE,
+            help="Rows handled per transaction.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=settings.PURGE_BATCH_SLEEP_SECONDS,
+            help="Seconds to sleep between batches.",
+        )
+        parser.add_argument(
+            "--max-batches",
+            type=int,
+            default=None,
+            help="Stop after this many batches of each kind.",
+        )
+        parser.add_argument(
+            "--skip-codes",
+            action="store_true",
+            help="Do not blank expired security codes.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count the stale accounts.",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+        if options["action"] not in ACTIONS:
+            raise CommandError(f"Unknown action {options['action']!r}.")
+        cutoff = timezone.now() - datetime.timedelta(days=options["days"])
+        if options["dry_run"]:
+            count = stale_users(cutoff).count()
+            self.stdout.write(f"{count} accounts joined before {cutoff} are stale.")
+            return
+
+        batch_options = {
+            "batch_size": options["batch_size"],
+            "sleep": options["sleep"],
+            "max_batches": options["max_batches"],
+        }
+        users = 0
+        for handled in purge_stale_accounts(cutoff, options["action"], **batch_options):
+            users += handled
+            self.stdout.write(f"{options['action']}: {users} accounts so far")
+        codes = 0
+        if not options["skip_codes"]:
+            for cleared in clear_expired_codes(**batch_options):
+                codes += cleared
+        self.stdout.write(
+            f"Done: {options['action']} {users} stale accounts, "
+            f"cleared {codes} expired security codes."
+        )
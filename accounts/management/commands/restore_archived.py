@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from base.archiving import ArchiveConflict, archivable_models, restore_from_archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves rows back from their model's archive table, along with the rows "
+        "archived with them, and makes them live again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", help="Label of the model, e.g. accounts.User.")
+        parser.add_argument("ids", nargs="+", help="Ids of the rows to restore.")
+
+    def handle(self, *args, **options):
+        models = {model._meta.label: model for model in archivable_models()}
+        if options["model"] not in models:
+            raise CommandError(f"Not archivable: {options['model']}.")
+        try:
+            restored = restore_from_archive(models[options["model"]], options["ids"])
+        except ArchiveConflict as e:
+            raise CommandError(f"Live rows took archived unique values: {e}")
+        self.stdout.write(f"Restored {restored} rows.")
@@ -0,0 +1,61 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.settings import api_settings
+
+from accounts.jwks import (
+    KEY_PARAMS,
+    generate_signing_key,
+    get_publish_delay,
+    retire_signing_keys,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates a new JWT signing key, published before it signs tokens, and "
+        "retires keys whose tokens have all expired."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--algorithm",
+            default=api_settings.ALGORITHM,
+            help="Signing algorithm of the new key (RS256 or ES256).",
+        )
+        parser.add_argument(
+            "--retire-after",
+            type=int,
+            default=None,
+            help="Seconds a superseded key stays published. "
+            "Defaults to the refresh token lifetime.",
+        )
+        parser.add_argument(
+            "--retire-only",
+            action="store_true",
+            help="Only retire expired keys without creating a new one.",
+        )
+
+    def handle(self, *args, **options):
+        if options["retire_after"] is None:
+            retire_after = api_settings.REFRESH_TOKEN_LIFETIME
+        else:
+            retire_after = datetime.timedelta(seconds=options["retire_after"])
+
+        if not options["retire_only"]:
+            algorithm = options["algorithm"]
+            if algorithm not in KEY_PARAMS:
+                raise CommandError(
+                    f"Unsupported algorithm {algorithm}, "
+                    f"choose one of {', '.join(KEY_PARAMS)}."
+                )
+            key = generate_signing_key(algorithm)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Created {algorithm} key {key.kid}, signing tokens from "
+                    f"{key.created_at + get_publish_delay():%Y-%m-%d %H:%M:%S %Z}."
+                )
+            )
+
+        retired = retire_signing_keys(retire_after)
+        self.stdout.write(f"Retired {retired} key(s).")
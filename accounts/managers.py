@@ -1,7 +1,9 @@
 from django.contrib.auth.base_user import BaseUserManager
 
+from base.managers import BaseManager
 
-class UserManager(BaseUserManager):
+
+class UserManager(BaseManager, BaseUserManager):
     use_in_migrations = True
 
     def _create_user(self, username, password, **extra_fields):
@@ -0,0 +1,47 @@
+# Generated by Django 5.0.4 on 2026-10-18 18:37
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "accounts",
+            "0003_rename_is_password_useremailmodel_is_password_reset_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SigningKey",
+            fields=[
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "id",
+                    models.UUIDField(
+                        db_index=True,
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("is_archived", models.BooleanField(default=False)),
+                ("metadata", models.JSONField(blank=True, default=dict, null=True)),
+                ("kid", models.CharField(max_length=64, unique=True)),
+                ("algorithm", models.CharField(max_length=10)),
+                ("private_key", models.TextField()),
+                ("public_key", models.TextField()),
+                ("retired_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "verbose_name": "Signing Key",
+                "verbose_name_plural": "Signing Keys",
+                "ordering": ("-created_at",),
+                "get_latest_by": ("created_at",),
+            },
+        ),
+    ]
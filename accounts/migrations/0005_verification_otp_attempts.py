@@ -0,0 +1,23 @@
+# Generated by Django 5.0.4 on 2026-10-18 18:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0004_signingkey"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="useremailmodel",
+            name="otp_attempts",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="userphonenumbermodel",
+            name="otp_attempts",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.0.4 on 2026-10-18 18:58
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0005_verification_otp_attempts"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RevokedToken",
+            fields=[
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "id",
+                    models.UUIDField(
+                        db_index=True,
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("is_archived", models.BooleanField(default=False)),
+                ("metadata", models.JSONField(blank=True, default=dict, null=True)),
+                ("jti", models.CharField(max_length=255, unique=True)),
+                ("token_type", models.CharField(blank=True, max_length=20)),
+                ("user_id", models.CharField(blank=True, max_length=255, null=True)),
+                ("expires_at", models.DateTimeField(db_index=True)),
+            ],
+            options={
+                "verbose_name": "Revoked Token",
+                "verbose_name_plural": "Revoked Tokens",
+                "ordering": ("-created_at",),
+                "indexes": [
+                    models.Index(
+                        fields=["created_at"], name="accounts_re_created_3f53ee_idx"
+                    )
+                ],
+            },
+        ),
+    ]
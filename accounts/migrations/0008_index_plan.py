@@ -0,0 +1,131 @@
+# Generated by Django 5.0.4 on 2026-10-18 19:09
+
+import uuid
+from django.db import migrations, models
+
+from base.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # The indexes are built concurrently, outside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("accounts", "0007_refreshtokenfamily"),
+        ("auth", "0012_alter_user_first_name_max_length"),
+    ]
+
+    operations = [
+        # The primary key is already indexed, so dropping `db_index` only
+        # changes the state and needs no table rebuild.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name="revokedtoken",
+                    name="id",
+                    field=models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                migrations.AlterField(
+                    model_name="signingkey",
+                    name="id",
+                    field=models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                migrations.AlterField(
+                    model_name="user",
+                    name="id",
+                    field=models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                migrations.AlterField(
+                    model_name="useremailmodel",
+                    name="id",
+                    field=models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                migrations.AlterField(
+                    model_name="userphonenumbermodel",
+                    name="id",
+                    field=models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+            ],
+        ),
+        AddIndexConcurrently(
+            model_name="user",
+            index=models.Index(
+                condition=models.Q(("is_archived", False)),
+                fields=["-date_joined", "id"],
+                name="user_joined_id_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="user",
+            index=models.Index(
+                condition=models.Q(("is_archived", False)),
+                fields=["created_at", "id"],
+                name="user_created_id_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="user",
+            index=models.Index(
+                condition=models.Q(("is_active", False), ("is_archived", False)),
+                fields=["date_joined"],
+                name="user_inactive_joined_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="useremailmodel",
+            index=models.Index(
+                condition=models.Q(("is_archived", False)),
+                fields=["-created_at"],
+                name="email_created_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="useremailmodel",
+            index=models.Index(
+                condition=models.Q(("is_archived", False), ("is_verified", False)),
+                fields=["sent_date"],
+                name="email_unverified_sent_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="userphonenumbermodel",
+            index=models.Index(
+                condition=models.Q(("is_archived", False)),
+                fields=["-created_at"],
+                name="phone_created_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="userphonenumbermodel",
+            index=models.Index(
+                condition=models.Q(("is_archived", False), ("is_verified", False)),
+                fields=["sent_date"],
+                name="phone_unverified_sent_idx",
+            ),
+        ),
+    ]
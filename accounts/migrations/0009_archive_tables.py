@@ -0,0 +1,151 @@
+# Generated by Django 5.0.4 on 2026-10-18 19:14
+
+import django.core.serializers.json
+import django.utils.timezone
+from django.db import migrations, models
+
+from base.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # The indexes are built concurrently, outside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("accounts", "0008_index_plan"),
+        ("auth", "0012_alter_user_first_name_max_length"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserArchive",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(editable=False, primary_key=True, serialize=False),
+                ),
+                (
+                    "data",
+                    models.JSONField(
+                        encoder=django.core.serializers.json.DjangoJSONEncoder
+                    ),
+                ),
+                (
+                    "metadata",
+                    models.JSONField(
+                        blank=True,
+                        default=dict,
+                        encoder=django.core.serializers.json.DjangoJSONEncoder,
+                        null=True,
+                    ),
+                ),
+                ("created_at", models.DateTimeField()),
+                (
+                    "archived_at",
+                    models.DateTimeField(
+                        db_index=True, default=django.utils.timezone.now
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Archived User",
+                "verbose_name_plural": "Archived Users",
+            },
+        ),
+        migrations.CreateModel(
+            name="UserEmailArchive",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(editable=False, primary_key=True, serialize=False),
+                ),
+                (
+                    "data",
+                    models.JSONField(
+                        encoder=django.core.serializers.json.DjangoJSONEncoder
+                    ),
+                ),
+                (
+                    "metadata",
+                    models.JSONField(
+                        blank=True,
+                        default=dict,
+                        encoder=django.core.serializers.json.DjangoJSONEncoder,
+                        null=True,
+                    ),
+                ),
+                ("created_at", models.DateTimeField()),
+                (
+                    "archived_at",
+                    models.DateTimeField(
+                        db_index=True, default=django.utils.timezone.now
+                    ),
+                ),
+                ("user_id", models.UUIDField(db_index=True)),
+            ],
+            options={
+                "verbose_name": "Archived Email",
+                "verbose_name_plural": "Archived Emails",
+            },
+        ),
+        migrations.CreateModel(
+            name="UserPhoneNumberArchive",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(editable=False, primary_key=True, serialize=False),
+                ),
+                (
+                    "data",
+                    models.JSONField(
+                        encoder=django.core.serializers.json.DjangoJSONEncoder
+                    ),
+                ),
+                (
+                    "metadata",
+                    models.JSONField(
+                        blank=True,
+                        default=dict,
+                        encoder=django.core.serializers.json.DjangoJSONEncoder,
+                        null=True,
+                    ),
+                ),
+                ("created_at", models.DateTimeField()),
+                (
+                    "archived_at",
+                    models.DateTimeField(
+                        db_index=True, default=django.utils.timezone.now
+                    ),
+                ),
+                ("user_id", models.UUIDField(db_index=True)),
+            ],
+            options={
+                "verbose_name": "Archived Phone Number",
+                "verbose_name_plural": "Archived Phone Numbers",
+            },
+        ),
+        AddIndexConcurrently(
+            model_name="user",
+            index=models.Index(
+                condition=models.Q(("is_archived", True)),
+                fields=["id"],
+                name="user_archived_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="useremailmodel",
+            index=models.Index(
+                condition=models.Q(("is_archived", True)),
+                fields=["id"],
+                name="email_archived_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="userphonenumbermodel",
+            index=models.Index(
+                condition=models.Q(("is_archived", True)),
+                fields=["id"],
+                name="phone_archived_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.4 on 2026-10-18 19:28
+
+from django.db import migrations, models
+
+from base.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # The indexes are built concurrently, outside a transaction.
+    atomic = False
+
+    dependencies = [
+        ("accounts", "0009_archive_tables"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="useremailmodel",
+            index=models.Index(
+                condition=models.Q(
+                    ("is_archived", False),
+                    models.Q(("security_code", ""), _negated=True),
+                ),
+                fields=["sent_date"],
+                name="email_pending_code_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="userphonenumbermodel",
+            index=models.Index(
+                condition=models.Q(
+                    ("is_archived", False),
+                    models.Q(("security_code", ""), _negated=True),
+                ),
+                fields=["sent_date"],
+                name="phone_pending_code_idx",
+            ),
+        ),
+    ]
@@ -1,19 +1,40 @@
 import logging
+import uuid
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
-from django.utils import timezone
 from phonenumber_field.modelfields import PhoneNumberField
 
+from accounts.exceptions import OTPAlreadySentException
+from accounts.hashing import hashing_executor
 from accounts.managers import UserManager
-from accounts.tasks import send_sms_task, send_email_task
-from base.models import BaseModel, VerificationModel
+from accounts.notifications import dispatcher
+from base.metrics import OTP_SENDS
+from base.models import ArchiveModel, BaseModel, VerificationModel
+from base.otp_store import RESET, VERIFY, acquire_send_slot, get_send_window
 from accounts.helpers import generate_security_code
 
 logger = logging.getLogger(__name__)
 
 
+def reserve_confirmation_send(channel, address, reset_password=False):
+    """
+    Coalesces repeated sends to `address`, returns the dedupe key of the send.
+    """
+    purpose = RESET if reset_password else VERIFY
+    wait = acquire_send_slot(purpose, address)
+    outcome = "coalesced" if wait else "sent"
+    OTP_SENDS.labels(
+        channel=channel.channel_type, purpose=purpose, outcome=outcome
+    ).inc()
+    if wait:
+        raise OTPAlreadySentException(wait=wait)
+    return f"otp:{purpose}:{address}:{get_send_window()}"
+
+
 class User(BaseModel, AbstractUser):
     id_number = models.CharField(max_length=255, null=True)
     other_names = models.CharField(max_length=255, null=True, blank=True)
@@ -21,6 +42,9 @@ class User(BaseModel, AbstractUser):
 
     objects = UserManager()
 
+    archive_model = "accounts.UserArchive"
+    archive_related = ("email_model", "phone_number_model")
+
     EMAIL_FIELD = "username"
     USERNAME_FIELD = "username"
     REQUIRED_FIELDS = []
@@ -30,10 +54,55 @@ class User(BaseModel, AbstractUser):
         verbose_name_plural = _("Users")
         ordering = ["-date_joined"]
         get_latest_by = "-first_name"
+        # Indexes cover live rows only, matching the default manager, so their
+        # size tracks live accounts. Archived rows await the archive job.
+        indexes = [
+            # Default ordering and the cursor-paginated user list.
+            models.Index(
+                fields=["-date_joined", "id"],
+                condition=models.Q(is_archived=False),
+                name="user_joined_id_idx",
+            ),
+            # Keyset pages of the user export.
+            models.Index(
+                fields=["created_at", "id"],
+                condition=models.Q(is_archived=False),
+                name="user_created_id_idx",
+            ),
+            # Accounts never activated, oldest first.
+            models.Index(
+                fields=["date_joined"],
+                condition=models.Q(is_active=False, is_archived=False),
+                name="user_inactive_joined_idx",
+            ),
+            models.Index(
+                fields=["id"],
+                condition=models.Q(is_archived=True),
+                name="user_archived_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.username
 
+    def set_password(self, raw_password):
+        self.password = hashing_executor.make_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        is_correct, must_update = hashing_executor.verify_password(
+            raw_password, self.password
+        )
+        if is_correct and must_update:
+            self.set_password(raw_password)
+            self._password = None
+            self.save(update_fields=["password"])
+        return is_correct
+
+    async def acheck_password(self, raw_password):
+        # Django's acheck_password hashes on the event loop, offload it instead.
+        return await sync_to_async(self.check_password)(raw_password)
+
     def is_email_verified(self):
         if hasattr(self, "email_model"):
             return self.email_model.is_verified
@@ -49,25 +118,53 @@ class UserPhoneNumberModel(BaseModel, VerificationModel):
     )
     phone_number = PhoneNumberField(unique=True)
 
+    channel_type = "phone_number"
+    archive_model = "accounts.UserPhoneNumberArchive"
+
     class Meta:
         ordering = ("-created_at",)
         verbose_name = _("Phone Number")
         verbose_name_plural = _("Phone Numbers")
         get_latest_by = ("-updated_at",)
+        indexes = [
+            models.Index(
+                fields=["-created_at"],
+                condition=models.Q(is_archived=False),
+                name="phone_created_idx",
+            ),
+            # Channels awaiting verification, by when their code was sent.
+            models.Index(
+                fields=["sent_date"],
+                condition=models.Q(is_verified=False, is_archived=False),
+                name="phone_unverified_sent_idx",
+            ),
+            models.Index(
+                fields=["id"],
+                condition=models.Q(is_archived=True),
+                name="phone_archived_idx",
+            ),
+            # Codes left on the row, by when they were sent, for the purge job.
+            models.Index(
+                fields=["sent_date"],
+                condition=models.Q(is_archived=False) & ~models.Q(security_code=""),
+                name="phone_pending_code_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.phone_number.as_e164
 
-    def send_confirmation_code(self, reset_password=False):
+    def send_confirmation_code(self, reset_password=False, issued=False):
         if not self.is_verified or reset_password:
-            self.security_code = generate_security_code()
+            dedupe_key = reserve_confirmation_send(
+                self, self.phone_number.as_e164, reset_password
+            )
+            if not issued:
+                self.security_code = generate_security_code()
+                self.issue_security_code(self.security_code, reset_password)
             logger.info(
                 f"Sending security code {self.security_code} to phone {self.phone_number}"
             )
-            self.sent_date = timezone.now()
-            if reset_password:
-                self.is_password_reset = reset_password
-            self.save()
             if reset_password:
                 message = "Your reset password code is"
             else:
@@ -76,7 +173,12 @@ class UserPhoneNumberModel(BaseModel, VerificationModel):
                 f" {self.security_code}. It will be active "
                 f"for the next {settings.TOKEN_EXPIRE_MINUTES} minutes."
             )
-            send_sms_task.delay(str(self.phone_number), message)
+            phone_number = str(self.phone_number)
+            transaction.on_commit(
+                lambda: dispatcher.send_sms(
+                    phone_number, message, dedupe_key=dedupe_key
+                )
+            )
             return self.security_code
 
 
@@ -86,25 +188,53 @@ class UserEmailModel(BaseModel, VerificationModel):
     )
     email = models.EmailField(unique=True, null=False, blank=False)
 
+    channel_type = "email"
+    archive_model = "accounts.UserEmailArchive"
+
     class Meta:
         ordering = ("-created_at",)
         verbose_name = _("Email")
         verbose_name_plural = _("Emails")
         get_latest_by = ("-updated_at",)
+        indexes = [
+            models.Index(
+                fields=["-created_at"],
+                condition=models.Q(is_archived=False),
+                name="email_created_idx",
+            ),
+            # Channels awaiting verification, by when their code was sent.
+            models.Index(
+                fields=["sent_date"],
+                condition=models.Q(is_verified=False, is_archived=False),
+                name="email_unverified_sent_idx",
+            ),
+            models.Index(
+                fields=["id"],
+                condition=models.Q(is_archived=True),
+                name="email_archived_idx",
+            ),
+            # Codes left on the row, by when they were sent, for the purge job.
+            models.Index(
+                fields=["sent_date"],
+                condition=models.Q(is_archived=False) & ~models.Q(security_code=""),
+                name="email_pending_code_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.email
 
-    def send_confirmation_code(self, reset_password=False):
+    def send_confirmation_code(self, reset_password=False, issued=False):
         if not self.is_verified or reset_password:
-            self.security_code = generate_security_code()
+            dedupe_key = reserve_confirmation_send(
+                self, self.email.lower(), reset_password
+            )
+            if not issued:
+                self.security_code = generate_security_code()
+                self.issue_security_code(self.security_code, reset_password)
             logger.info(
                 f"Sending security code {self.security_code} to email {self.email}"
             )
-            self.sent_date = timezone.now()
-            if reset_password:
-                self.is_password_reset = reset_password
-            self.save()
             if reset_password:
                 message = "Your reset password code is"
                 subject = "Reset Password"
@@ -115,6 +245,88 @@ class UserEmailModel(BaseModel, VerificationModel):
                 f" {self.security_code}. It will "
                 f"be active for the next {settings.TOKEN_EXPIRE_MINUTES} minutes."
             )
-            send_email_task.delay(self.email, subject, message)
+            email = self.email
+            transaction.on_commit(
+                lambda: dispatcher.send_email(
+                    email, subject, message, dedupe_key=dedupe_key
+                )
+            )
 
             return self.security_code
+
+
+class SigningKey(BaseModel):
+    kid = models.CharField(max_length=64, unique=True)
+    algorithm = models.CharField(max_length=10)
+    private_key = models.TextField()
+    public_key = models.TextField()
+    retired_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("-created_at",)
+        verbose_name = _("Signing Key")
+        verbose_name_plural = _("Signing Keys")
+        get_latest_by = ("created_at",)
+
+    def __str__(self):
+        return self.kid
+
+
+class RevokedToken(BaseModel):
+    jti = models.CharField(max_length=255, unique=True)
+    token_type = models.CharField(max_length=20, blank=True)
+    user_id = models.CharField(max_length=255, null=True, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ("-created_at",)
+        verbose_name = _("Revoked Token")
+        verbose_name_plural = _("Revoked Tokens")
+        # Workers sync the rows revoked since their last check.
+        indexes = [models.Index(fields=["created_at"])]
+
+    def __str__(self):
+        return self.jti
+
+
+class RefreshTokenFamily(models.Model):
+    """
+    One row per login session, deliberately without the `BaseModel` columns.
+    Only the refresh token whose jti is `current_jti` may be rotated.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User, related_name="token_families", on_delete=models.CASCADE
+    )
+    current_jti = models.CharField(max_length=64)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = _("Refresh Token Family")
+        verbose_name_plural = _("Refresh Token Families")
+
+    def __str__(self):
+        return str(self.id)
+
+
+class UserArchive(ArchiveModel):
+    class Meta:
+        verbose_name = _("Archived User")
+        verbose_name_plural = _("Archived Users")
+
+
+class UserPhoneNumberArchive(ArchiveModel):
+    user_id = models.UUIDField(db_index=True)
+
+    class Meta:
+        verbose_name = _("Archived Phone Number")
+        verbose_name_plural = _("Archived Phone Numbers")
+
+
+class UserEmailArchive(ArchiveModel):
+    user_id = models.UUIDField(db_index=True)
+
+    class Meta:
+        verbose_name = _("Archived Email")
+        verbose_name_plural = _("Archived Emails")
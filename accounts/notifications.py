@@ -0,0 +1,179 @@
+import json
+import logging
+import uuid
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from base.redis import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+SMS = "sms"
+EMAIL = "email"
+
+SENT = "sent"
+FAILED = "failed"
+
+
+class BaseNotificationProvider:
+    """
+    Sends batches of messages in a single provider call.
+    Every message carries an `id` and the result maps each id to SENT or FAILED.
+    """
+
+    def send_sms_bulk(self, messages):
+        raise NotImplementedError(".send_sms_bulk() must be overridden")
+
+    def send_email_bulk(self, messages):
+        raise NotImplementedError(".send_email_bulk() must be overridden")
+
+    def send_bulk(self, kind, messages):
+        if kind == SMS:
+            return self.send_sms_bulk(messages)
+        return self.send_email_bulk(messages)
+
+
+class LoggingProvider(BaseNotificationProvider):
+    def send_sms_bulk(self, messages):
+        logger.info(f"Send sms batch of {len(messages)}, payload: {messages}")
+        return {message["id"]: SENT for message in messages}
+
+    def send_email_bulk(self, messages):
+        logger.info(f"Send email batch of {len(messages)}, payload: {messages}")
+        return {message["id"]: SENT for message in messages}
+
+
+class StubProvider(BaseNotificationProvider):
+    """
+    Local provider for tests; keeps every batch in `outbox`.
+    Messages whose recipient is listed in `failing_recipients` fail.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.outbox = []
+        self.failing_recipients = set()
+
+    def send_bulk(self, kind, messages):
+        self.outbox.append((kind, messages))
+        return {
+            message["id"]: FAILED if message["to"] in self.failing_recipients else SENT
+            for message in messages
+        }
+
+    def send_sms_bulk(self, messages):
+        return self.send_bulk(SMS, messages)
+
+    def send_email_bulk(self, messages):
+        return self.send_bulk(EMAIL, messages)
+
+
+@lru_cache(maxsize=None)
+def get_notification_provider():
+    return import_string(settings.NOTIFICATION_PROVIDER)()
+
+
+class NotificationDispatcher:
+    """
+    Buffers outgoing messages per kind in Redis and enqueues them as one
+    Celery task once `batch_size` messages are waiting or `batch_window`
+    seconds passed.
+
+    The buffer is shared by all workers and written before `add()` returns, so
+    messages outlive the process that queued them. The first message of a
+    window schedules `flush_notifications_task` after `batch_window` seconds; a
+    full buffer is flushed right away. A window of 0 or an unreachable Redis
+    enqueues every message on its own.
+    """
+
+    buffer_key = "notifications:buffer:%s"
+    window_key = "notifications:window:%s"
+
+    def __init__(self, batch_size, batch_window):
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+
+    def send_sms(self, phone_number, message, dedupe_key=None):
+        return self.add(
+            SMS,
+            {"to": str(phone_number), "message": message, "dedupe_key": dedupe_key},
+        )
+
+    def send_email(self, email_to, subject, message, email_from=None, dedupe_key=None):
+        return self.add(
+            EMAIL,
+            {
+                "to": email_to,
+                "subject": subject,
+                "message": message,
+                "email_from": email_from,
+                "dedupe_key": dedupe_key,
+            },
+        )
+
+    def add(self, kind, payload):
+        payload["id"] = uuid.uuid4().hex
+        if not self.batch_window:
+            self._enqueue(kind, [payload])
+            return payload["id"]
+        try:
+            pending, window_started = self._push(kind, payload)
+        except redis.RedisError as e:
+            logger.warning(f"Notification sent unbatched, redis unavailable: {e}")
+            self._enqueue(kind, [payload])
+            return payload["id"]
+        if pending % self.batch_size == 0:
+            self._schedule_flush(kind, countdown=0)
+        elif window_started:
+            self._schedule_flush(kind, countdown=self.batch_window)
+        return payload["id"]
+
+    def _push(self, kind, payload):
+        pipe = get_redis_client().pipeline()
+        pipe.rpush(self.buffer_key % kind, json.dumps(payload))
+        # Expires with the window so a lost flush task cannot stall batching.
+        pipe.set(self.window_key % kind, 1, px=int(self.batch_window * 1000), nx=True)
+        pending, window_started = pipe.execute()
+        return pending, bool(window_started)
+
+    def _pop(self, kind):
+        pipe = get_redis_client().pipeline()
+        pipe.lrange(self.buffer_key % kind, 0, self.batch_size - 1)
+        pipe.ltrim(self.buffer_key % kind, self.batch_size, -1)
+        messages, _ = pipe.execute()
+        return [json.loads(message) for message in messages]
+
+    def _schedule_flush(self, kind, countdown):
+        from accounts.tasks import flush_notifications_task
+
+        flush_notifications_task.apply_async((kind,), countdown=countdown)
+
+    def _enqueue(self, kind, batch):
+        from accounts.tasks import send_email_batch_task, send_sms_batch_task
+
+        task = send_sms_batch_task if kind == SMS else send_email_batch_task
+        task.delay(batch)
+
+    def flush(self, kind=None):
+        """
+        Enqueues every buffered message, `batch_size` per task.
+        """
+        for buffer_kind in [kind] if kind else [SMS, EMAIL]:
+            # Messages added from now on open a new window and flush.
+            get_redis_client().delete(self.window_key % buffer_kind)
+            while True:
+                batch = self._pop(buffer_kind)
+                if not batch:
+                    break
+                self._enqueue(buffer_kind, batch)
+
+
+dispatcher = NotificationDispatcher(
+    batch_size=settings.NOTIFICATION_BATCH_SIZE,
+    batch_window=settings.NOTIFICATION_BATCH_WINDOW,
+)
@@ -0,0 +1,82 @@
+import time
+
+import requests
+from authlib.integrations.django_client import DjangoOAuth2App, OAuth
+from django.conf import settings
+from django.core.cache import cache
+
+
+def fetch_document(url):
+    response = requests.get(url, timeout=settings.OIDC_FETCH_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+class OIDCDocumentCache:
+    """
+    Provider discovery documents and key sets, kept in the shared cache.
+
+    Entries live for `OIDC_CACHE_TTL` seconds and are reloaded well before that
+    by `refresh_oidc_documents_task`, so SSO callbacks read them without leaving
+    the network. A forced reload, made when an ID token names an unknown `kid`,
+    is skipped while the cached copy is younger than
+    `OIDC_CACHE_MIN_RELOAD_SECONDS`.
+    """
+
+    key_prefix = "oidc"
+
+    def __init__(self, fetch=fetch_document):
+        self.fetch = fetch
+
+    def key(self, url):
+        return f"{self.key_prefix}:{url}"
+
+    def get(self, url, force=False):
+        entry = cache.get(self.key(url))
+        if entry is not None:
+            age = time.time() - entry["fetched_at"]
+            if not force or age < settings.OIDC_CACHE_MIN_RELOAD_SECONDS:
+                return entry["document"]
+        return self.reload(url)
+
+    def reload(self, url):
+        document = self.fetch(url)
+        cache.set(
+            self.key(url),
+            {"document": document, "fetched_at": time.time()},
+            settings.OIDC_CACHE_TTL,
+        )
+        return document
+
+
+oidc_documents = OIDCDocumentCache()
+
+
+def refresh_oidc_documents(metadata_url):
+    """
+    Reloads a provider's metadata and the key set it points to.
+    """
+    metadata = oidc_documents.reload(metadata_url)
+    oidc_documents.reload(metadata["jwks_uri"])
+    return metadata
+
+
+class CachedOIDCApp(DjangoOAuth2App):
+    """
+    OAuth client that reads provider metadata and keys from `oidc_documents`.
+    """
+
+    def load_server_metadata(self):
+        if self._server_metadata_url:
+            self.server_metadata.update(oidc_documents.get(self._server_metadata_url))
+        return self.server_metadata
+
+    def fetch_jwk_set(self, force=False):
+        uri = self.load_server_metadata().get("jwks_uri")
+        if not uri:
+            raise RuntimeError('Missing "jwks_uri" in metadata')
+        return oidc_documents.get(uri, force=force)
+
+
+class CachedOAuth(OAuth):
+    oauth2_client_cls = CachedOIDCApp
@@ -0,0 +1,12 @@
+from rest_framework.pagination import CursorPagination
+
+
+class UserCursorPagination(CursorPagination):
+    """
+    Keyset pagination, so every page costs the same regardless of its depth.
+    """
+
+    ordering = ("-date_joined", "id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
@@ -0,0 +1,121 @@
+import logging
+import time
+
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.authentication import invalidate_user_snapshots_on_commit
+from accounts.models import User, UserEmailModel, UserPhoneNumberModel
+from base.metrics import PURGE_BATCH_SECONDS, PURGED_ROWS, observe
+from base.otp_store import get_otp_store
+
+logger = logging.getLogger(__name__)
+
+DELETE = "delete"
+ARCHIVE = "archive"
+ACTIONS = (DELETE, ARCHIVE)
+
+CHANNEL_MODELS = (UserEmailModel, UserPhoneNumberModel)
+
+
+def stale_users(cutoff):
+    """
+    Accounts joined before `cutoff` that were never activated nor verified.
+    """
+    return (
+        User.objects.filter(
+            is_active=False,
+            is_staff=False,
+            is_archived=False,
+            date_joined__lt=cutoff,
+        )
+        .exclude(email_model__is_verified=True)
+        .exclude(phone_number_model__is_verified=True)
+    )
+
+
+def archive_users(cutoff, ids):
+    """
+    Archives the still stale users among `ids` and clears their channels' codes.
+    """
+    now = timezone.now()
+    archived = (
+        stale_users(cutoff).filter(pk__in=ids).update(is_archived=True, updated_at=now)
+    )
+    for model in CHANNEL_MODELS:
+        model.objects.filter(user__in=ids, user__is_archived=True).update(
+            is_archived=True, security_code="", updated_at=now
+        )
+    # update() skips the User post_save receivers.
+    invalidate_user_snapshots_on_commit(ids)
+    return archived
+
+
+def delete_users(cutoff, ids):
+    """
+    Deletes the still stale users among `ids`, cascading to their rows.
+    """
+    _, deleted = stale_users(cutoff).filter(pk__in=ids).delete()
+    return deleted.get(User._meta.label, 0)
+
+
+def purge_stale_accounts(
+    cutoff, action=DELETE, batch_size=500, sleep=0.0, max_batches=None
+):
+    """
+    Deletes or archives stale accounts `batch_size` at a time, yielding the
+    number of users handled by each batch.
+
+    Each batch runs in its own transaction and the job sleeps `sleep` seconds
+    between batches, so locks stay short and cascades stay bounded. Users are
+    re-checked inside the transaction, so one verifying meanwhile is kept.
+    """
+    handle = archive_users if action == ARCHIVE else delete_users
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with observe(PURGE_BATCH_SECONDS, job="stale_accounts"):
+            ids = list(
+                stale_users(cutoff)
+                .order_by("date_joined")
+                .values_list("pk", flat=True)[:batch_size]
+            )
+            if not ids:
+                return
+            with transaction.atomic():
+                handled = handle(cutoff, ids)
+        PURGED_ROWS.labels(job="stale_accounts", action=action).inc(handled)
+        logger.info(f"Stale accounts: {action} {handled} of {len(ids)} users")
+        yield handled
+        batches += 1
+        if sleep:
+            time.sleep(sleep)
+
+
+def clear_expired_codes(batch_size=500, sleep=0.0, max_batches=None):
+    """
+    Blanks the expired security codes left on channel rows, oldest first,
+    `batch_size` rows at a time and at most `max_batches` batches per table.
+    Cleared rows leave the selection, so every run resumes where the last one
+    stopped. Yields the number of codes cleared by each batch.
+    """
+    expired_before = timezone.now() - get_otp_store().ttl
+    for model in CHANNEL_MODELS:
+        expired = (
+            model.objects.filter(sent_date__lt=expired_before)
+            .exclude(security_code="")
+            .order_by("sent_date")
+        )
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            with observe(PURGE_BATCH_SECONDS, job="expired_codes"):
+                ids = list(expired.values_list("pk", flat=True)[:batch_size])
+                if not ids:
+                    break
+                cleared = expired.filter(pk__in=ids).update(
+                    security_code="", is_password_reset=False
+                )
+            PURGED_ROWS.labels(job="expired_codes", action="clear").inc(cleared)
+            yield cleared
+            batches += 1
+            if sleep:
+                time.sleep(sleep)
@@ -0,0 +1,214 @@
+import datetime
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+# Claim carrying the id of the `RefreshTokenFamily` a token belongs to. Access
+# tokens inherit it from their refresh token.
+FAMILY_CLAIM = "family"
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter of strings, sized for `capacity` items at `error_rate`.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(math.ceil(self.size / 8))
+
+    def positions(self, value):
+        # Double hashing over one 128-bit digest gives every probe position.
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:], "big") | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, value):
+        for position in self.positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self.positions(value)
+        )
+
+
+class RevocationList:
+    """
+    Per-process Bloom filter of the revoked `jti`s stored in `RevokedToken`.
+
+    Tokens missing from the filter, the common case, are accepted without any
+    I/O. Filter hits are confirmed against the database. Rows revoked since the
+    last sync are added every `TOKEN_REVOCATION_SYNC_SECONDS`, which bounds how
+    long other workers keep accepting a revoked token. The filter is rebuilt
+    every `TOKEN_REVOCATION_REBUILD_SECONDS` to drop expired entries.
+    """
+
+    # Rows committed late with an earlier `created_at` are picked up by re-reading
+    # this many seconds before the last sync.
+    SYNC_OVERLAP = 5
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filter = None
+        self._synced_at = None
+        self._checked_at = None
+        self._built_at = None
+
+    def new_filter(self):
+        return BloomFilter(
+            settings.TOKEN_REVOCATION_BLOOM_CAPACITY,
+            settings.TOKEN_REVOCATION_BLOOM_ERROR_RATE,
+        )
+
+    def rebuild(self):
+        from accounts.models import RevokedToken
+
+        started = timezone.now()
+        bloom = self.new_filter()
+        for jti in (
+            RevokedToken.objects.filter(expires_at__gt=started)
+            .values_list("jti", flat=True)
+            .iterator()
+        ):
+            bloom.add(jti)
+        self._filter = bloom
+        self._synced_at = started
+        self._checked_at = self._built_at = time.monotonic()
+
+    def sync(self):
+        from accounts.models import RevokedToken
+
+        started = timezone.now()
+        since = self._synced_at - datetime.timedelta(seconds=self.SYNC_OVERLAP)
+        for jti in RevokedToken.objects.filter(created_at__gte=since).values_list(
+            "jti", flat=True
+        ):
+            self._filter.add(jti)
+        self._synced_at = started
+        self._checked_at = time.monotonic()
+
+    def refresh(self):
+        now = time.monotonic()
+        if (
+            self._filter is not None
+            and now - self._checked_at < settings.TOKEN_REVOCATION_SYNC_SECONDS
+        ):
+            return
+        with self._lock:
+            if self._filter is None or (
+                now - self._built_at > settings.TOKEN_REVOCATION_REBUILD_SECONDS
+            ):
+                self.rebuild()
+            elif now - self._checked_at >= settings.TOKEN_REVOCATION_SYNC_SECONDS:
+                self.sync()
+
+    def add(self, jti):
+        self.refresh()
+        self._filter.add(jti)
+
+    def filter_revoked(self, jtis):
+        """
+        Returns the revoked ones among `jtis` with at most one query.
+        """
+        from accounts.models import RevokedToken
+
+        self.refresh()
+        candidates = [jti for jti in jtis if jti and jti in self._filter]
+        if not candidates:
+            return set()
+        return set(
+            RevokedToken.objects.filter(
+                jti__in=candidates, expires_at__gt=timezone.now()
+            ).values_list("jti", flat=True)
+        )
+
+    def is_revoked(self, jti):
+        return bool(self.filter_revoked([jti]))
+
+
+revocation_list = RevocationList()
+
+
+def revoke_token(token):
+    """
+    Revokes a validated token until it expires.
+    """
+    from accounts.models import RevokedToken
+
+    jti = token[api_settings.JTI_CLAIM]
+    RevokedToken.objects.get_or_create(
+        jti=jti,
+        defaults={
+            "token_type": token.get(api_settings.TOKEN_TYPE_CLAIM, ""),
+            "user_id": token.get(api_settings.USER_ID_CLAIM),
+            "expires_at": datetime_from_epoch(token["exp"]),
+        },
+    )
+    revocation_list.add(jti)
+
+
+def family_revocation_key(family_id):
+    return f"family:{family_id}"
+
+
+def revocation_keys(payload):
+    """
+    Returns the keys a token is revoked under: its jti and its family.
+    """
+    keys = [payload.get(api_settings.JTI_CLAIM)]
+    family_id = payload.get(FAMILY_CLAIM)
+    if family_id:
+        keys.append(family_revocation_key(family_id))
+    return keys
+
+
+def revoke_token_family(family_id, user_id=None):
+    """
+    Revokes every token of a refresh token family, access tokens included.
+    The family stops issuing tokens now, so its access tokens all expire
+    within `ACCESS_TOKEN_LIFETIME`.
+    """
+    from accounts.models import RevokedToken
+
+    key = family_revocation_key(family_id)
+    RevokedToken.objects.get_or_create(
+        jti=key,
+        defaults={
+            "token_type": FAMILY_CLAIM,
+            "user_id": user_id,
+            "expires_at": timezone.now() + api_settings.ACCESS_TOKEN_LIFETIME,
+        },
+    )
+    revocation_list.add(key)
+
+
+def purge_revoked_tokens(batch_size, max_batches=None):
+    """
+    Deletes revocations of expired tokens `batch_size` rows at a time and
+    returns the count. Expired tokens fail validation on their own.
+    """
+    from accounts.models import RevokedToken
+
+    now = timezone.now()
+    deleted = batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = list(
+            RevokedToken.objects.filter(expires_at__lte=now).values_list(
+                "pk", flat=True
+            )[:batch_size]
+        )
+        if not ids:
+            break
+        deleted += RevokedToken.objects.filter(pk__in=ids).delete()[0]
+        batches += 1
+    return deleted
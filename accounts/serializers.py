@@ -1,16 +1,36 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.db import IntegrityError, transaction
 from phonenumber_field.serializerfields import PhoneNumberField
-from rest_framework import serializers
+from rest_framework import exceptions, serializers
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_api_settings
+from rest_framework_simplejwt.tokens import UntypedToken
 from django.utils.translation import gettext_lazy as _
 
+from accounts.authentication import get_model_user
+from accounts.custom_jwt import CustomToken
 from accounts.exceptions import AccountNotRegisteredException
+from accounts.helpers import generate_security_code
 from accounts.models import UserPhoneNumberModel, UserEmailModel
+from accounts.revocation import revoke_token
+from accounts.token_families import rotate_refresh_token
 
 User = get_user_model()
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
+    """
+    Registers a user and its channels in one transaction.
+
+    Uniqueness is left to the database constraints instead of checked upfront,
+    so concurrent registrations cannot both pass validation. A violation is
+    mapped back to the usual validation messages.
+    """
+
     email = serializers.EmailField(
         required=False, allow_blank=True, source="email_model"
     )
@@ -21,26 +41,76 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ["username", "email", "phone_number", "password", "id_number"]
-        extra_kwargs = {"password": {"write_only": True}}
+        extra_kwargs = {
+            "password": {"write_only": True},
+            # Drops the UniqueValidator query, the unique constraint covers it.
+            "username": {"validators": [UnicodeUsernameValidator()]},
+        }
 
     def create(self, validated_data):
         phone_number = validated_data.pop("phone_number_model", None)
         email = validated_data.pop("email_model", None)
-        user = User.objects.create_user(
-            username=validated_data.pop("username"),
-            password=validated_data.pop("password"),
-            **validated_data
+        password = validated_data.pop("password")
+        user = User(
+            is_staff=False, is_superuser=False, is_active=False, **validated_data
         )
+        # Hashed before the transaction so no locks are held meanwhile.
+        user.set_password(password)
+        channels = []
         if phone_number:
-            UserPhoneNumberModel.objects.create(
-                user=user, phone_number=phone_number
-            ).send_confirmation_code()
+            channels.append(UserPhoneNumberModel(user=user, phone_number=phone_number))
+        else:
+            # Rendering the response must not query for a channel never created.
+            User.phone_number_model.related.set_cached_value(user, None)
         if email:
-            UserEmailModel.objects.create(
-                user=user, email=email
-            ).send_confirmation_code()
+            channels.append(UserEmailModel(user=user, email=email))
+        else:
+            User.email_model.related.set_cached_value(user, None)
+        try:
+            with transaction.atomic():
+                user.save()
+                for channel in channels:
+                    # Kept on the channel for the send, whatever the OTP store.
+                    # The database store writes it with the channel's INSERT.
+                    channel.security_code = generate_security_code()
+                    channel.issue_security_code(channel.security_code)
+                    channel.save()
+                for channel in channels:
+                    # Sent once committed, so a registration rolled back by a
+                    # later channel reserves no resend cooldown.
+                    transaction.on_commit(
+                        lambda channel=channel: channel.send_confirmation_code(
+                            issued=True
+                        ),
+                        robust=True,
+                    )
+        except IntegrityError:
+            errors = self.get_conflicts(user.username, phone_number, email)
+            if errors is None:
+                raise
+            raise serializers.ValidationError(errors)
         return user
 
+    def get_conflicts(self, username, phone_number, email):
+        """
+        Finds the unique constraint a failed registration violated. Archived
+        rows keep their values until the archive job moves them, so they count.
+        """
+        if User._base_manager.filter(username=username).exists():
+            return {
+                "username": [User._meta.get_field("username").error_messages["unique"]]
+            }
+        if (
+            phone_number
+            and UserPhoneNumberModel._base_manager.filter(
+                phone_number=phone_number
+            ).exists()
+        ):
+            return {api_settings.NON_FIELD_ERRORS_KEY: ["Phone number already exists."]}
+        if email and UserEmailModel._base_manager.filter(email=email).exists():
+            return {api_settings.NON_FIELD_ERRORS_KEY: ["Email already exists."]}
+        return None
+
     def validate(self, attrs):
         phone_number = attrs.get("phone_number_model")
         email = attrs.get("email_model")
@@ -48,13 +118,6 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 "Please provide either a phone number or an email."
             )
-        if (
-            phone_number
-            and UserPhoneNumberModel.objects.filter(phone_number=phone_number).exists()
-        ):
-            raise serializers.ValidationError("Phone number already exists.")
-        if email and UserEmailModel.objects.filter(email=email).exists():
-            raise serializers.ValidationError("Email already exists.")
         return attrs
 
 
@@ -81,6 +144,10 @@ class LoginSerializer(serializers.ModelSerializer):
 
 
 class UserSerializer(serializers.ModelSerializer):
+    """
+    Accepts a `fields` argument limiting the rendered fields.
+    """
+
     email = serializers.EmailField(
         required=False, allow_blank=True, source="email_model"
     )
@@ -93,6 +160,12 @@ class UserSerializer(serializers.ModelSerializer):
         fields = "__all__"
         extra_kwargs = {"password": {"write_only": True}}
 
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
 
 class BaseOTP(serializers.Serializer):
     phone_number = PhoneNumberField(allow_null=True, required=False)
@@ -168,15 +241,20 @@ class PasswordChangeSerializer(serializers.Serializer):
     password1 = serializers.CharField(required=True, allow_blank=False, min_length=8)
     password2 = serializers.CharField(required=True, allow_blank=False, min_length=8)
 
+    def get_user(self):
+        if not hasattr(self, "_user"):
+            self._user = get_model_user(self.context["request"].user)
+        return self._user
+
     def create(self, validated_data):
-        user = self.context["request"].user
+        user = self.get_user()
         new_password = validated_data.get("password1")
         user.set_password(new_password)
         user.save()
         return True
 
     def validate_old_password(self, value):
-        user = self.context["request"].user
+        user = self.get_user()
         if not user.check_password(value):
             raise serializers.ValidationError(_("Invalid account password"))
         return value
@@ -285,3 +363,44 @@ class PasswordResetConfirmationSerializer(BasePasswordResetSerializer):
         if pwd1 != pwd2:
             raise serializers.ValidationError(_("Your passwords do not match"))
         return attrs
+
+
+class TokenIntrospectionSerializer(serializers.Serializer):
+    tokens = serializers.ListField(
+        child=serializers.CharField(),
+        allow_empty=False,
+        max_length=settings.TOKEN_INTROSPECTION_MAX_TOKENS,
+    )
+
+
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    """
+    Rotates the refresh token within its family on every refresh.
+    """
+
+    token_class = CustomToken
+
+    def validate(self, attrs):
+        refresh = rotate_refresh_token(self.token_class(attrs["refresh"]))
+        return {"access": str(refresh.access_token), "refresh": str(refresh)}
+
+
+class TokenRevocationSerializer(serializers.Serializer):
+    token = serializers.CharField()
+
+    def validate_token(self, value):
+        try:
+            return UntypedToken(value)
+        except TokenError as e:
+            raise serializers.ValidationError(str(e))
+
+    def validate(self, attrs):
+        user = self.context["request"].user
+        owner = attrs["token"].get(jwt_api_settings.USER_ID_CLAIM)
+        if not user.is_staff and str(owner) != str(user.pk):
+            raise exceptions.PermissionDenied(_("You can only revoke your own tokens."))
+        return attrs
+
+    def create(self, validated_data):
+        revoke_token(validated_data["token"])
+        return True
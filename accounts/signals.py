@@ -1,22 +1,61 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from django.utils import timezone
 
-from accounts.models import UserPhoneNumberModel, UserEmailModel
+from accounts.authentication import invalidate_user_snapshots_on_commit
+from accounts.models import UserPhoneNumberModel, UserEmailModel, User
+from base.managers import rows_archived
 
 
 @receiver(post_save, sender=UserPhoneNumberModel)
-def user_phone_number_model_event(sender, instance, created, **kwargs):
-    if not created:
-        activate_user(instance, **kwargs)
+@receiver(post_save, sender=UserEmailModel)
+def channel_verified_event(sender, instance, update_fields=None, raw=False, **kwargs):
+    # Rows loaded as stored, e.g. restored from the archive, change nothing.
+    if raw or (update_fields is not None and "is_verified" not in update_fields):
+        return
+    if instance.is_newly_verified():
+        activate_user(instance)
+
 
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_snapshot_event(sender, instance, using, **kwargs):
+    invalidate_user_snapshots_on_commit([instance.pk], using=using)
 
+
+@receiver(post_save, sender=UserPhoneNumberModel)
 @receiver(post_save, sender=UserEmailModel)
-def user_email_model_event(sender, instance, created, **kwargs):
-    if not created:
-        activate_user(instance, **kwargs)
+@receiver(post_delete, sender=UserPhoneNumberModel)
+@receiver(post_delete, sender=UserEmailModel)
+def channel_snapshot_event(sender, instance, using, **kwargs):
+    invalidate_user_snapshots_on_commit([instance.user_id], using=using)
+
+
+@receiver(rows_archived, sender=User)
+def users_archived_event(sender, pks, using, **kwargs):
+    invalidate_user_snapshots_on_commit(pks, using=using)
+
+
+@receiver(rows_archived, sender=UserPhoneNumberModel)
+@receiver(rows_archived, sender=UserEmailModel)
+def channels_archived_event(sender, pks, using, **kwargs):
+    user_ids = sender._base_manager.using(using).filter(pk__in=pks)
+    invalidate_user_snapshots_on_commit(
+        user_ids.values_list("user_id", flat=True), using=using
+    )
 
 
-def activate_user(instance, **kwargs):
-    if instance.is_verified and not instance.user.is_active:
+def activate_user(instance):
+    """
+    Activates the channel's user with one conditional UPDATE, without fetching it.
+    """
+    activated = User.objects.filter(pk=instance.user_id, is_active=False).update(
+        is_active=True, updated_at=timezone.now()
+    )
+    if activated:
+        # update() skips the User post_save receivers.
+        invalidate_user_snapshots_on_commit(
+            [instance.user_id], using=instance._state.db
+        )
+    if type(instance).user.is_cached(instance):
         instance.user.is_active = True
-        instance.user.save()
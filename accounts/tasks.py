@@ -1,5 +1,20 @@
+import datetime
 import logging
 
+import redis
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from accounts.notifications import (
+    EMAIL,
+    SENT,
+    SMS,
+    dispatcher,
+    get_notification_provider,
+)
+from accounts.token_families import purge_token_families
+from base.redis import get_redis_client
 from project.celery import app
 
 logger = logging.getLogger(__name__)
@@ -12,11 +27,9 @@ logger = logging.getLogger(__name__)
     name="accounts.tasks.send_sms_task",
 )
 def send_sms_task(self, phone_number, message):
-    payload = {
-        "message": message,
-        "phone_number": str(phone_number),
-    }
-    logger.info(f"Send sms, payload: {payload}")
+    payload = {"id": self.request.id, "to": str(phone_number), "message": message}
+    if send_batch(SMS, [payload]):
+        raise self.retry()
 
 
 @app.task(
@@ -27,9 +40,192 @@ def send_sms_task(self, phone_number, message):
 )
 def send_email_task(self, email_to, subject, message, email_from=None):
     payload = {
-        "message": message,
+        "id": self.request.id,
+        "to": email_to,
         "subject": subject,
+        "message": message,
         "email_from": email_from,
-        "email_to": email_to,
     }
-    logger.info(f"Send email, payload: {payload}")
+    if send_batch(EMAIL, [payload]):
+        raise self.retry()
+
+
+@app.task(
+    bind=True,
+    max_retries=3,
+    default_retry_delay=60,
+    name="accounts.tasks.send_sms_batch_task",
+)
+def send_sms_batch_task(self, messages):
+    failed = send_batch(SMS, messages)
+    if failed:
+        raise self.retry(args=(failed,))
+
+
+@app.task(
+    bind=True,
+    max_retries=3,
+    default_retry_delay=60,
+    name="accounts.tasks.send_email_batch_task",
+)
+def send_email_batch_task(self, messages):
+    failed = send_batch(EMAIL, messages)
+    if failed:
+        raise self.retry(args=(failed,))
+
+
+@app.task(name="accounts.tasks.flush_notifications_task")
+def flush_notifications_task(kind):
+    dispatcher.flush(kind)
+
+
+def send_batch(kind, messages):
+    """
+    Sends `messages` in one provider call and returns the ones that failed.
+    Messages whose `dedupe_key` was already delivered, by any worker, are
+    skipped. Redis errors skip deduplication.
+    """
+    sent_keys = {
+        f"notification-sent:{message['dedupe_key']}": message
+        for message in messages
+        if message.get("dedupe_key")
+    }
+    client = get_redis_client()
+    delivered = set()
+    if sent_keys:
+        try:
+            delivered = {
+                key
+                for key, sent in zip(sent_keys, client.mget(list(sent_keys)))
+                if sent
+            }
+        except redis.RedisError as e:
+            logger.warning(f"Notification dedupe skipped, redis unavailable: {e}")
+    messages = [
+        message
+        for message in messages
+        if f"notification-sent:{message.get('dedupe_key')}" not in delivered
+    ]
+    if not messages:
+        return []
+    results = get_notification_provider().send_bulk(kind, messages)
+    failed = [message for message in messages if results.get(message["id"]) != SENT]
+    if failed:
+        logger.warning(f"{len(failed)} of {len(messages)} {kind} messages failed")
+    newly_sent = [
+        key
+        for key, message in sent_keys.items()
+        if key not in delivered and results.get(message["id"]) == SENT
+    ]
+    if newly_sent:
+        try:
+            pipeline = client.pipeline(transaction=False)
+            for key in newly_sent:
+                pipeline.set(key, 1, ex=settings.NOTIFICATION_DEDUPE_TIMEOUT)
+            pipeline.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Notification dedupe not recorded, redis unavailable: {e}")
+    return failed
+
+
+@app.task(
+    bind=True,
+    max_retries=3,
+    default_retry_delay=60,
+    name="accounts.tasks.update_last_login_task",
+)
+def update_last_login_task(self, user_id, last_login):
+    from accounts.models import User
+
+    User.objects.filter(id=user_id).update(last_login=parse_datetime(last_login))
+
+
+def publish_last_login(user_id, last_login):
+    """
+    Enqueues `update_last_login_task` without holding up the login: the broker
+    gets one publish attempt of at most `LAST_LOGIN_PUBLISH_TIMEOUT` seconds and
+    failures are only logged, `last_login` being informational.
+    """
+    try:
+        update_last_login_task.apply_async(
+            (str(user_id), last_login.isoformat()),
+            retry=False,
+            timeout=settings.LAST_LOGIN_PUBLISH_TIMEOUT,
+        )
+    except Exception as e:
+        logger.warning(f"Last login of {user_id} not recorded: {e}")
+
+
+@app.task(name="accounts.tasks.purge_token_families_task")
+def purge_token_families_task():
+    deleted = purge_token_families(
+        settings.TOKEN_FAMILY_PURGE_BATCH_SIZE, settings.TOKEN_FAMILY_PURGE_MAX_BATCHES
+    )
+    logger.info(f"Purged {deleted} expired refresh token families")
+    return deleted
+
+
+@app.task(name="accounts.tasks.purge_revoked_tokens_task")
+def purge_revoked_tokens_task():
+    from accounts.revocation import purge_revoked_tokens
+
+    deleted = purge_revoked_tokens(
+        settings.TOKEN_REVOCATION_PURGE_BATCH_SIZE,
+        settings.TOKEN_REVOCATION_PURGE_MAX_BATCHES,
+    )
+    logger.info(f"Purged {deleted} revocations of expired tokens")
+    return deleted
+
+
+@app.task(name="accounts.tasks.purge_stale_accounts_task")
+def purge_stale_accounts_task():
+    from accounts.purge import clear_expired_codes, purge_stale_accounts
+
+    cutoff = timezone.now() - datetime.timedelta(days=settings.STALE_ACCOUNT_DAYS)
+    options = {
+        "batch_size": settings.PURGE_BATCH_SIZE,
+        "sleep": settings.PURGE_BATCH_SLEEP_SECONDS,
+        "max_batches": settings.PURGE_MAX_BATCHES,
+    }
+    users = sum(purge_stale_accounts(cutoff, settings.STALE_ACCOUNT_ACTION, **options))
+    codes = sum(clear_expired_codes(**options))
+    logger.info(
+        f"Purged {users} stale accounts ({settings.STALE_ACCOUNT_ACTION}) "
+        f"and {codes} expired security codes"
+    )
+    return {"users": users, "codes": codes}
+
+
+@app.task(name="accounts.tasks.archive_rows_task")
+def archive_rows_task():
+    from base.archiving import archivable_models, archive_pending
+
+    moved = {}
+    for model in archivable_models():
+        moved[model._meta.label] = sum(
+            archive_pending(
+                model,
+                batch_size=settings.ARCHIVE_BATCH_SIZE,
+                sleep=settings.ARCHIVE_BATCH_SLEEP_SECONDS,
+                max_batches=settings.ARCHIVE_MAX_BATCHES,
+            )
+        )
+    logger.info(f"Moved archived rows to the archive tables: {moved}")
+    return moved
+
+
+@app.task(
+    bind=True,
+    max_retries=3,
+    default_retry_delay=60,
+    name="accounts.tasks.refresh_oidc_documents_task",
+)
+def refresh_oidc_documents_task(self):
+    from accounts.oidc import refresh_oidc_documents
+
+    try:
+        refresh_oidc_documents(settings.GOOGLE_OIDC_METADATA_URL)
+    except Exception as exc:
+        # Cached copies stay valid until OIDC_CACHE_TTL, so retrying is enough.
+        logger.warning(f"Failed to refresh OIDC documents: {exc}")
+        raise self.retry(exc=exc)
@@ -1,3 +1,1700 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+import redis
+import sentry_sdk
+from asgiref.sync import iscoroutinefunction
+from authlib.jose import JsonWebKey, jwt
+from django.apps import apps
+from django.contrib.auth import hashers
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import CommandError, call_command
+from django.db import NotSupportedError, connection, connections, models
+from django.db.migrations.state import ProjectState
+from django.db.models import Q
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from jwt import get_unverified_header
+from kombu.exceptions import OperationalError
+from rest_framework_simplejwt import state as token_state
+from rest_framework_simplejwt.exceptions import TokenBackendError
+from rest_framework_simplejwt.tokens import AccessToken
+from sentry_sdk.transport import Transport
+
+from accounts.authentication import (
+    ClaimsUser,
+    get_snapshot_cache,
+    snapshot_cache_key,
+)
+from accounts import signals
+from accounts.custom_jwt import CustomToken
+from accounts.exceptions import HashingUnavailableException, OTPAlreadySentException
+from accounts.exporters import CSV, EXPORT_FIELDS, NDJSON, iter_users, render_users
+from accounts.hashing import HashingExecutor
+from accounts.importers import UserImporter, load_checkpoint, save_checkpoint
+from accounts.introspection import introspect_tokens
+from accounts.jwks import (
+    KeyRing,
+    KeyRingTokenBackend,
+    generate_signing_key,
+    get_publish_delay,
+    retire_signing_keys,
+)
+from accounts.models import (
+    reserve_confirmation_send,
+    RefreshTokenFamily,
+    RevokedToken,
+    SigningKey,
+    User,
+    UserArchive,
+    UserEmailArchive,
+    UserEmailModel,
+    UserPhoneNumberModel,
+)
+from accounts.oidc import CachedOAuth, oidc_documents
+from accounts.notifications import (
+    EMAIL,
+    FAILED,
+    SENT,
+    SMS,
+    NotificationDispatcher,
+    StubProvider,
+)
+from accounts.pagination import UserCursorPagination
+from accounts.purge import (
+    ARCHIVE,
+    DELETE,
+    clear_expired_codes,
+    delete_users,
+    purge_stale_accounts,
+    stale_users,
+)
+from accounts.revocation import (
+    BloomFilter,
+    RevocationList,
+    purge_revoked_tokens,
+    revocation_list,
+)
+from accounts.tasks import send_batch
+from accounts.throttling import SlidingWindowThrottle
+from accounts.token_families import start_token_family
+from base.archiving import ArchiveConflict, archive_pending, restore_from_archive
+from base.otp_store import (
+    RESET,
+    VERIFY,
+    DatabaseOTPStore,
+    RedisOTPStore,
+    acquire_send_slot,
+    get_otp_store,
+)
+from base.redis import get_redis_client
+from base.metrics import REQUEST_DB_QUERIES
+from base.middleware import (
+    PRIMARY_COOKIE,
+    DatabaseMetricsMiddleware,
+    ReplicaPinningMiddleware,
+)
+from base.operations import AddIndexConcurrently
+from base.routers import ReplicaHealth, ReplicaRouter, end_routing, start_routing
+from project.sentry import TraceSampler, init_sentry
+
+FAST_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+
+class FakeRedisMixin:
+    """
+    Points `get_redis_client()` at an in-memory fakeredis server per test.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch("redis.Redis.from_url", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        get_redis_client.cache_clear()
+        self.addCleanup(get_redis_client.cache_clear)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class LoginBenchmarkTests(FakeRedisMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("jane", "secret-pass", is_active=True)
+        UserEmailModel.objects.create(
+            user=cls.user, email="jane@example.com", is_verified=True
+        )
+        UserPhoneNumberModel.objects.create(
+            user=cls.user, phone_number="+254712345678", is_verified=True
+        )
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch("accounts.tasks.update_last_login_task")
+        self.update_last_login_task = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def login(self):
+        return self.client.post(
+            reverse("v1:login"),
+            {"username": "jane", "password": "secret-pass"},
+            content_type="application/json",
+        )
+
+    def test_login_queries(self):
+        # The user with both channels, then the refresh token family INSERT.
+        with self.assertNumQueries(2):
+            response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.update_last_login_task.apply_async.assert_called_once()
+
+    def test_login_returns_one_token_pair_with_claims(self):
+        response = self.login().json()
+        refresh = CustomToken(response["refresh"])
+        access = AccessToken(response["access"])
+        for token in (refresh, access):
+            self.assertEqual(token["user_id"], str(self.user.id))
+            self.assertEqual(token["email"], "jane@example.com")
+            self.assertEqual(token["phone_number"], "+254712345678")
+
+    def test_login_signs_one_token_pair(self):
+        backend = token_state.token_backend
+        with mock.patch.object(backend, "encode", wraps=backend.encode) as encode:
+            with self.assertNumQueries(2):
+                self.assertEqual(self.login().status_code, 200)
+        # The refresh token and its access token, nothing signed twice.
+        self.assertEqual(encode.call_count, 2)
+
+    def test_unreachable_broker_does_not_fail_login(self):
+        self.update_last_login_task.apply_async.side_effect = OperationalError("down")
+        with self.assertLogs("accounts.tasks", "WARNING"):
+            self.assertEqual(self.login().status_code, 200)
+        _, options = self.update_last_login_task.apply_async.call_args
+        self.assertEqual(options, {"retry": False, "timeout": 0.5})
+
+    def test_token_issuance_needs_no_queries(self):
+        user = User.objects.select_related("email_model", "phone_number_model").get(
+            pk=self.user.pk
+        )
+        with self.assertNumQueries(0):
+            for _ in range(20):
+                token = CustomToken.for_user(user)
+                str(token), str(token.access_token)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class RegistrationBenchmarkTests(FakeRedisMixin, TestCase):
+    def register(self, **data):
+        return self.client.post(
+            reverse("v1:register"),
+            {"password": "secret-pass", **data},
+            content_type="application/json",
+        )
+
+    def test_registration_queries(self):
+        # The savepoint pair of the atomic block, the user and both channels.
+        with self.assertNumQueries(5):
+            response = self.register(
+                username="jane", email="jane@example.com", phone_number="+254712345678"
+            )
+        self.assertEqual(response.status_code, 201)
+        channel = UserPhoneNumberModel.objects.get(phone_number="+254712345678")
+        self.assertEqual(len(channel.security_code), 6)
+        self.assertIsNotNone(channel.sent_date)
+
+    def test_duplicates_map_to_validation_errors(self):
+        self.register(
+            username="jane", email="jane@example.com", phone_number="+254712345678"
+        )
+        cases = [
+            ({"username": "jane", "email": "x@example.com"}, "username"),
+            ({"username": "joe", "email": "jane@example.com"}, "non_field_errors"),
+            ({"username": "joe", "phone_number": "+254712345678"}, "non_field_errors"),
+        ]
+        for data, field in cases:
+            response = self.register(**data)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(field, response.json())
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_registration_queries_do_not_grow(self):
+        # The savepoint pair, the user and its email, whatever came before.
+        for i in range(20):
+            with self.assertNumQueries(4):
+                self.register(username=f"user{i}", email=f"user{i}@example.com")
+        self.assertEqual(User.objects.count(), 20)
+
+    def test_registration_throughput(self):
+        rounds = 100
+        started = time.perf_counter()
+        for i in range(rounds):
+            self.register(username=f"user{i}", email=f"user{i}@example.com")
+        per_second = rounds / (time.perf_counter() - started)
+        self.assertEqual(User.objects.count(), rounds)
+        # A floor well below a loaded CI host, catching only gross regressions.
+        self.assertGreater(per_second, 20, f"{per_second:.0f} registrations/s")
+
+    @override_settings(OTP_STORE="base.otp_store.RedisOTPStore")
+    def test_redis_store_sends_the_issued_code(self):
+        get_otp_store.cache_clear()
+        self.addCleanup(get_otp_store.cache_clear)
+        with mock.patch("accounts.models.dispatcher") as dispatcher:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.register(username="jane", phone_number="+254712345678")
+        channel = UserPhoneNumberModel.objects.get(phone_number="+254712345678")
+        code = self.redis.hget(f"otp:userphonenumbermodel:{channel.pk}:verify", "code")
+        self.assertEqual(len(code), 6)
+        _, message = dispatcher.send_sms.call_args.args
+        self.assertIn(f" {code.decode()}. ", message)
+        self.assertTrue(channel.check_verification(code.decode()))
+
+    def test_send_cooldown_does_not_roll_back_registration(self):
+        acquire_send_slot("verify", "jane@example.com")
+        # The cooldown raised by the email's send is logged after the commit.
+        with self.assertLogs(level="ERROR"):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.register(
+                    username="jane",
+                    email="jane@example.com",
+                    phone_number="+254712345678",
+                )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(User.objects.filter(username="jane").exists())
+        self.assertTrue(self.redis.exists("otp-cooldown:verify:+254712345678"))
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class ThrottleTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = 1000.0
+        patcher = mock.patch.object(
+            SlidingWindowThrottle, "timer", new=lambda throttle: self.now
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def login(self):
+        return self.client.post(
+            reverse("v1:login"),
+            {"username": "jane", "password": "wrong"},
+            content_type="application/json",
+        )
+
+    def exhaust_username_window(self):
+        # login_username allows 10 attempts a minute.
+        for _ in range(10):
+            self.assertEqual(self.login().status_code, 401)
+            self.now += 1
+
+    def test_limit_reached_sets_retry_after(self):
+        self.exhaust_username_window()
+        response = self.login()
+        self.assertEqual(response.status_code, 429)
+        # The oldest hit, at 1000, leaves the window at 1060.
+        self.assertEqual(response["Retry-After"], "50")
+
+    def test_window_slides(self):
+        self.exhaust_username_window()
+        self.now = 1059
+        self.assertEqual(self.login().status_code, 429)
+        self.now = 1061
+        self.assertEqual(self.login().status_code, 401)
+
+    def test_rejected_hits_do_not_extend_window(self):
+        self.exhaust_username_window()
+        for _ in range(5):
+            self.assertEqual(self.login().status_code, 429)
+        self.assertEqual(self.redis.zcard("throttle:login_username:jane"), 10)
+
+    def test_credentials_are_not_checked_before_throttling(self):
+        self.exhaust_username_window()
+        with mock.patch("rest_framework.authentication.authenticate") as authenticate:
+            response = self.client.post(
+                reverse("v1:login"),
+                {"username": "jane", "password": "wrong"},
+                content_type="application/json",
+                HTTP_AUTHORIZATION="Basic amFuZTp3cm9uZw==",
+            )
+        self.assertEqual(response.status_code, 429)
+        authenticate.assert_not_called()
+
+    def test_redis_errors_fail_open(self):
+        error = redis.ConnectionError("down")
+        with mock.patch.object(self.redis, "evalsha", side_effect=error):
+            with self.assertLogs("accounts.throttling", "WARNING"):
+                for _ in range(12):
+                    self.assertEqual(self.login().status_code, 401)
+
+
+class OTPSendCoalescingTests(FakeRedisMixin, TestCase):
+    def test_cooldown_is_kept_in_redis(self):
+        self.assertEqual(acquire_send_slot("verify", "jane@example.com"), 0)
+        wait = acquire_send_slot("verify", "jane@example.com")
+        self.assertTrue(0 < wait <= 60)
+        self.assertTrue(0 < self.redis.ttl("otp-cooldown:verify:jane@example.com"))
+        self.assertEqual(acquire_send_slot("reset", "jane@example.com"), 0)
+
+    def test_cooldown_fails_open(self):
+        error = redis.ConnectionError("down")
+        with mock.patch.object(self.redis, "set", side_effect=error):
+            with self.assertLogs("base.otp_store", "WARNING"):
+                self.assertEqual(acquire_send_slot("verify", "a@example.com"), 0)
+
+    def test_dedupe_key_identifies_the_send_window(self):
+        channel = UserEmailModel(email="jane@example.com")
+        with mock.patch("time.time", return_value=6000.0):
+            key = reserve_confirmation_send(channel, "jane@example.com")
+        with mock.patch("time.time", return_value=6001.0):
+            with self.assertRaises(OTPAlreadySentException):
+                reserve_confirmation_send(channel, "jane@example.com")
+        self.assertEqual(key, "otp:verify:jane@example.com:100")
+
+    def test_send_batch_skips_messages_delivered_by_any_worker(self):
+        provider = mock.Mock()
+        provider.send_bulk.side_effect = lambda kind, messages: {
+            message["id"]: SENT for message in messages
+        }
+        message = {"to": "+254712345678", "message": "hi", "dedupe_key": "otp:1"}
+        with mock.patch(
+            "accounts.tasks.get_notification_provider", return_value=provider
+        ):
+            self.assertEqual(send_batch(SMS, [{**message, "id": "a"}]), [])
+            self.assertEqual(send_batch(SMS, [{**message, "id": "b"}]), [])
+        provider.send_bulk.assert_called_once()
+        self.assertTrue(self.redis.exists("notification-sent:otp:1"))
+
+
+class OTPStoreTestsMixin:
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create(username="jane")
+        self.channel = UserEmailModel.objects.create(user=user, email="j@example.com")
+        self.store = self.store_class()
+        self.store.issue(self.channel, VERIFY, "123456")
+
+    def test_code_is_single_use(self):
+        self.assertTrue(self.store.verify(self.channel, VERIFY, "123456"))
+        self.assertFalse(self.store.verify(self.channel, VERIFY, "123456"))
+
+    def test_codes_are_kept_per_purpose(self):
+        self.assertFalse(self.store.verify(self.channel, RESET, "123456"))
+        self.assertTrue(self.store.verify(self.channel, VERIFY, "123456"))
+
+    @override_settings(OTP_MAX_ATTEMPTS=3)
+    def test_wrong_guesses_spend_the_code(self):
+        for _ in range(3):
+            self.assertFalse(self.store.verify(self.channel, VERIFY, "000000"))
+        self.assertFalse(self.store.verify(self.channel, VERIFY, "123456"))
+
+    def test_reissuing_resets_attempts(self):
+        self.assertFalse(self.store.verify(self.channel, VERIFY, "000000"))
+        self.store.issue(self.channel, VERIFY, "654321")
+        self.assertFalse(self.store.verify(self.channel, VERIFY, "123456"))
+        self.assertTrue(self.store.verify(self.channel, VERIFY, "654321"))
+
+    def test_expired_code_is_rejected(self):
+        self.expire_code()
+        self.assertFalse(self.store.verify(self.channel, VERIFY, "123456"))
+
+
+class DatabaseOTPStoreTests(OTPStoreTestsMixin, TestCase):
+    store_class = DatabaseOTPStore
+
+    def expire_code(self):
+        UserEmailModel.objects.filter(pk=self.channel.pk).update(
+            sent_date=timezone.now() - self.store.ttl
+        )
+
+
+class RedisOTPStoreTests(OTPStoreTestsMixin, FakeRedisMixin, TestCase):
+    store_class = RedisOTPStore
+
+    def expire_code(self):
+        key = self.store.get_key(self.channel, VERIFY)
+        self.assertEqual(self.redis.ttl(key), self.store.ttl.total_seconds())
+        self.redis.pexpire(key, 1)
+        time.sleep(0.01)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class AsyncViewTests(FakeRedisMixin, TestCase):
+    async def register(self, **data):
+        return await self.async_client.post(
+            reverse("v1:async-register"),
+            {"password": "secret-pass", **data},
+            content_type="application/json",
+        )
+
+    async def test_registration_uses_the_atomic_serializer(self):
+        response = await self.register(
+            username="jane", email="jane@example.com", phone_number="+254712345678"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            response.json(),
+            {
+                "username": "jane",
+                "email": "jane@example.com",
+                "phone_number": "+254712345678",
+                "id_number": None,
+            },
+        )
+        user = await User.objects.select_related("email_model").aget()
+        self.assertFalse(user.is_active)
+        self.assertEqual(user.email_model.email, "jane@example.com")
+
+    async def test_registration_conflicts_leave_no_partial_user(self):
+        await self.register(username="jane", email="jane@example.com")
+        response = await self.register(username="joe", email="jane@example.com")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(), {"non_field_errors": ["Email already exists."]}
+        )
+        self.assertEqual(await User._base_manager.acount(), 1)
+
+    async def test_login_and_profile(self):
+        await self.register(username="jane", email="jane@example.com")
+        await UserEmailModel.objects.aupdate(is_verified=True)
+        await User.objects.aupdate(is_active=True)
+        with mock.patch("accounts.tasks.update_last_login_task"):
+            response = await self.async_client.post(
+                reverse("v1:async-login"),
+                {"username": "jane", "password": "secret-pass"},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(
+            reverse("v1:async-profile"),
+            headers={"authorization": f"Bearer {response.json()['access']}"},
+        )
+        self.assertEqual(
+            response.json(), {"username": "jane", "email": "jane@example.com"}
+        )
+
+    async def test_generate_otp_for_unknown_channel(self):
+        response = await self.async_client.post(
+            reverse("v1:async-generate-otp"),
+            {"email": "nobody@example.com"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    async def test_database_metrics_count_queries_under_asgi(self):
+        histogram = REQUEST_DB_QUERIES.labels(view="v1:async-register")
+        before = histogram._sum.get()
+        await self.register(username="jane", email="jane@example.com")
+        self.assertGreater(histogram._sum.get(), before)
+
+    def test_project_middleware_is_async_capable(self):
+        async def get_response(request):
+            pass
+
+        self.assertTrue(iscoroutinefunction(DatabaseMetricsMiddleware(get_response)))
+        with override_settings(DATABASE_REPLICA_ALIASES=["replica1"]):
+            self.assertTrue(iscoroutinefunction(ReplicaPinningMiddleware(get_response)))
+
+
+class HashingExecutorTests(TestCase):
+    @override_settings(
+        PASSWORD_HASHERS=FAST_HASHERS
+        + ["django.contrib.auth.hashers.UnsaltedMD5PasswordHasher"]
+    )
+    def test_password_overrides_go_through_executor(self):
+        executor = HashingExecutor(workers=0, max_pending=1, queue_timeout=0)
+        user = User.objects.create_user("jane", "secret-pass")
+        user.password = hashers.make_password("secret-pass", hasher="unsalted_md5")
+        with mock.patch("accounts.models.hashing_executor", executor):
+            with mock.patch.object(executor, "run", wraps=executor.run) as run:
+                self.assertFalse(user.check_password("wrong"))
+                self.assertTrue(user.check_password("secret-pass"))
+        # The outdated hash was upgraded and saved.
+        self.assertEqual(run.call_count, 3)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith("md5$"))
+
+    def test_full_queue_is_rejected(self):
+        executor = HashingExecutor(workers=1, max_pending=1, queue_timeout=0.01)
+        executor._slots.acquire()
+        with self.assertRaises(HashingUnavailableException):
+            executor.make_password("secret-pass")
+        self.assertEqual(executor.metrics.snapshot()["rejected"], 1)
+        self.assertIsNone(executor._pool)
+
+    def test_gevent_workers_use_gevent_threads(self):
+        executor = HashingExecutor(workers=1, max_pending=1, queue_timeout=1)
+        with mock.patch("accounts.hashing.gevent_patched", return_value=True):
+            pool = executor.get_pool()
+        self.addCleanup(executor.reset_pool)
+        self.assertEqual(type(pool).__module__, "gevent.threadpool")
+        with override_settings(PASSWORD_HASHERS=FAST_HASHERS):
+            encoded = executor.make_password("secret-pass")
+            self.assertEqual(
+                executor.verify_password("secret-pass", encoded), (True, False)
+            )
+
+    def test_other_workers_use_processes(self):
+        executor = HashingExecutor(workers=1, max_pending=1, queue_timeout=1)
+        with mock.patch("accounts.hashing.gevent_patched", return_value=False):
+            self.assertIsInstance(executor.get_pool(), ProcessPoolExecutor)
+        executor.reset_pool()
+
+
+class NotificationDispatcherTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.provider = StubProvider()
+        patcher = mock.patch(
+            "accounts.tasks.get_notification_provider", return_value=self.provider
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.enqueued = []
+        self.scheduled = []
+        patcher = mock.patch.object(
+            NotificationDispatcher,
+            "_enqueue",
+            new=lambda dispatcher, kind, batch: self.enqueued.append((kind, batch)),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(
+            NotificationDispatcher,
+            "_schedule_flush",
+            new=lambda dispatcher, kind, countdown: self.scheduled.append(
+                (kind, countdown)
+            ),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_flushes_when_batch_is_full(self):
+        dispatcher = NotificationDispatcher(batch_size=2, batch_window=60)
+        dispatcher.send_sms("+254712345678", "one")
+        self.assertEqual(self.scheduled, [(SMS, 60)])
+        dispatcher.send_sms("+254712345679", "two")
+        self.assertEqual(self.scheduled, [(SMS, 60), (SMS, 0)])
+        self.assertEqual(self.enqueued, [])
+        dispatcher.flush(SMS)
+        self.assertEqual(len(self.enqueued), 1)
+        kind, batch = self.enqueued[0]
+        self.assertEqual(kind, SMS)
+        self.assertEqual([message["message"] for message in batch], ["one", "two"])
+        self.assertEqual(self.redis.llen("notifications:buffer:sms"), 0)
+
+    def test_window_schedules_one_flush(self):
+        dispatcher = NotificationDispatcher(batch_size=100, batch_window=0.2)
+        dispatcher.send_email("jane@example.com", "Hi", "one")
+        dispatcher.send_email("joe@example.com", "Hi", "two")
+        self.assertEqual(self.scheduled, [(EMAIL, 0.2)])
+        dispatcher.flush()
+        self.assertEqual(len(self.enqueued), 1)
+        self.assertEqual(len(self.enqueued[0][1]), 2)
+        # The flush closed the window, the next message opens another.
+        dispatcher.send_email("jane@example.com", "Hi", "three")
+        self.assertEqual(self.scheduled, [(EMAIL, 0.2), (EMAIL, 0.2)])
+
+    def test_buffer_outlives_the_process_that_queued_it(self):
+        NotificationDispatcher(batch_size=2, batch_window=60).send_sms(
+            "+254712345678", "one"
+        )
+        NotificationDispatcher(batch_size=2, batch_window=60).flush(SMS)
+        [(kind, batch)] = self.enqueued
+        self.assertEqual(batch[0]["message"], "one")
+
+    def test_flush_splits_the_buffer_into_batches(self):
+        dispatcher = NotificationDispatcher(batch_size=2, batch_window=60)
+        for i in range(5):
+            dispatcher.send_sms(f"+25471234567{i}", str(i))
+        dispatcher.flush(SMS)
+        self.assertEqual([len(batch) for _, batch in self.enqueued], [2, 2, 1])
+
+    def test_unreachable_redis_sends_unbatched(self):
+        dispatcher = NotificationDispatcher(batch_size=2, batch_window=60)
+        error = redis.ConnectionError("down")
+        with mock.patch.object(self.redis, "pipeline", side_effect=error):
+            with self.assertLogs("accounts.notifications", "WARNING"):
+                dispatcher.send_sms("+254712345678", "one")
+        self.assertEqual(len(self.enqueued[0][1]), 1)
+        self.assertEqual(self.scheduled, [])
+
+    def test_failing_recipient_is_returned_for_retry(self):
+        self.provider.failing_recipients.add("+254712345679")
+        dispatcher = NotificationDispatcher(batch_size=2, batch_window=60)
+        dispatcher.send_sms("+254712345678", "one")
+        dispatcher.send_sms("+254712345679", "two")
+        dispatcher.flush(SMS)
+        failed = send_batch(*self.enqueued[0])
+        self.assertEqual([message["to"] for message in failed], ["+254712345679"])
+        _, sent = self.provider.outbox[0]
+        self.assertEqual(len(sent), 2)
+        self.assertEqual(FAILED, self.provider.send_bulk(SMS, failed)[failed[0]["id"]])
+
+    def test_stub_providers_do_not_share_state(self):
+        self.provider.send_bulk(SMS, [{"id": "a", "to": "+254712345678"}])
+        self.provider.failing_recipients.add("+254712345678")
+        other = StubProvider()
+        self.assertEqual((other.outbox, other.failing_recipients), ([], set()))
+        self.provider.reset()
+        self.assertEqual(self.provider.outbox, [])
+
+
+class ActivationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("jane", "secret-pass")
+        self.email = UserEmailModel.objects.create(
+            user=self.user, email="jane@example.com"
+        )
+        self.phone_number = UserPhoneNumberModel.objects.create(
+            user=self.user, phone_number="+254712345678"
+        )
+        patcher = mock.patch(
+            "accounts.signals.activate_user", wraps=signals.activate_user
+        )
+        self.activate_user = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_first_verified_channel_activates_user_once(self):
+        self.email.issue_security_code("123456")
+        self.email.check_verification("123456")
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_active)
+        self.assertEqual(self.activate_user.call_count, 1)
+
+        # Saving again is no transition.
+        self.email.save()
+        UserEmailModel.objects.get().save()
+        self.assertEqual(self.activate_user.call_count, 1)
+
+        # The second channel's conditional UPDATE finds the user active.
+        self.phone_number.is_verified = True
+        self.phone_number.save()
+        self.assertEqual(User.objects.get().updated_at, self.user.updated_at)
+
+    def test_saving_verified_channel_does_nothing(self):
+        UserEmailModel.objects.update(is_verified=True)
+        email = UserEmailModel.objects.get()
+        email.metadata = {"source": "import"}
+        email.save()
+        email.save(update_fields=["is_verified"])
+        self.activate_user.assert_not_called()
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+
+    def test_unrelated_update_fields_do_not_activate(self):
+        self.email.is_verified = True
+        self.email.save(update_fields=["metadata"])
+        self.activate_user.assert_not_called()
+
+    def test_restoring_verified_channels_does_not_activate(self):
+        UserEmailModel.objects.update(is_verified=True)
+        User.objects.filter(pk=self.user.pk).archive()
+        list(archive_pending(User))
+        restore_from_archive(User, [self.user.pk])
+        self.activate_user.assert_not_called()
+        self.assertFalse(User.objects.get().is_active)
+        self.assertTrue(UserEmailModel.objects.get().is_verified)
+
+
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            "jane", "secret-pass", is_active=True, is_staff=True
+        )
+        UserEmailModel.objects.create(user=self.user, email="jane@example.com")
+        self.access = CustomToken.for_user(self.user).access_token
+
+    def get(self, name, token=None):
+        return self.client.get(
+            reverse(name), HTTP_AUTHORIZATION=f"Bearer {token or self.access}"
+        )
+
+    def introspect(self):
+        return self.client.post(
+            reverse("v1:token_introspect"),
+            {"tokens": [str(self.access)]},
+            content_type="application/json",
+            HTTP_AUTHORIZATION=f"Bearer {self.access}",
+        )
+
+    @override_settings(AUTH_USER_SNAPSHOT_CACHE="")
+    def test_claims_path_needs_no_query(self):
+        self.assertTrue(self.access["is_staff"])
+        self.get("v1:profile")  # Builds the revocation filter.
+        with self.assertNumQueries(0):
+            response = self.get("v1:profile")
+        self.assertEqual(response.json()["email"], "jane@example.com")
+        self.assertEqual(self.introspect().status_code, 200)
+
+    @override_settings(AUTH_USER_SNAPSHOT_CACHE="")
+    def test_claims_path_without_staff_claim(self):
+        User.objects.filter(pk=self.user.pk).update(is_staff=False)
+        self.access = CustomToken.for_user(User.objects.get()).access_token
+        self.assertEqual(self.introspect().status_code, 403)
+
+    def test_snapshot_path_queries_once_then_hits_cache(self):
+        revocation_list.is_revoked(self.access["jti"])
+        with self.assertNumQueries(1):
+            self.get("v1:profile")
+        with self.assertNumQueries(0):
+            response = self.get("v1:profile")
+        self.assertEqual(response.json()["username"], "jane")
+        self.assertEqual(self.introspect().status_code, 200)
+
+    def test_saving_user_invalidates_snapshot(self):
+        self.get("v1:profile")
+        key = snapshot_cache_key(self.user.pk)
+        self.assertIsNotNone(get_snapshot_cache().get(key))
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+            # Readers keep the committed row until the save commits.
+            self.assertIsNotNone(get_snapshot_cache().get(key))
+        self.assertIsNone(get_snapshot_cache().get(key))
+        self.assertEqual(self.get("v1:profile").status_code, 401)
+
+    def test_saving_channel_invalidates_snapshot(self):
+        self.get("v1:profile")
+        email = self.user.email_model
+        email.email = "janet@example.com"
+        with self.captureOnCommitCallbacks(execute=True):
+            email.save()
+        response = self.get("v1:profile")
+        self.assertEqual(response.json()["email"], "janet@example.com")
+
+    def test_archiving_invalidates_snapshot(self):
+        self.get("v1:profile")
+        key = snapshot_cache_key(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            UserEmailModel.objects.all().archive()
+        self.assertIsNone(get_snapshot_cache().get(key))
+        self.get("v1:profile")
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.all().archive()
+        self.assertEqual(self.get("v1:profile").status_code, 401)
+
+    def test_unreachable_cache_falls_back_to_database(self):
+        snapshot_cache = get_snapshot_cache()
+        error = redis.ConnectionError("down")
+        for method in ("get", "set", "delete_many"):
+            patcher = mock.patch.object(snapshot_cache, method, side_effect=error)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        with self.assertLogs("accounts.authentication", "WARNING") as logs:
+            self.assertEqual(self.get("v1:profile").status_code, 200)
+            self.user.first_name = "Janet"
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.save()
+        self.assertIn("not invalidated", logs.output[-1])
+
+    def test_claims_user_reads_staff_flag(self):
+        user = ClaimsUser(self.access, {"is_staff": True})
+        self.assertTrue(user.is_staff)
+
+
+class TokenRefreshTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("jane", "secret-pass", is_active=True)
+        UserEmailModel.objects.create(user=self.user, email="jane@example.com")
+        self.refresh = start_token_family(CustomToken.for_user(self.user))
+
+    def post_refresh(self, refresh):
+        return self.client.post(
+            reverse("v1:token_refresh"),
+            {"refresh": str(refresh)},
+            content_type="application/json",
+        )
+
+    def test_rotation_remints_claims_and_keeps_family_expiry(self):
+        family = RefreshTokenFamily.objects.get()
+        User.objects.filter(pk=self.user.pk).update(first_name="Janet")
+        revocation_list.is_revoked(self.refresh["jti"])
+        # The user with both channels, then the family UPDATE.
+        with self.assertNumQueries(2):
+            response = self.post_refresh(self.refresh)
+        self.assertEqual(response.status_code, 200)
+        rotated = CustomToken(response.json()["refresh"])
+        access = AccessToken(response.json()["access"])
+        self.assertEqual(rotated["first_name"], "Janet")
+        self.assertEqual(access["first_name"], "Janet")
+        self.assertEqual(rotated["family"], str(family.pk))
+        self.assertEqual(rotated["exp"], self.refresh["exp"])
+        family.refresh_from_db()
+        self.assertEqual(family.current_jti, rotated["jti"])
+        self.assertEqual(int(family.expires_at.timestamp()), self.refresh["exp"])
+
+    def test_replaying_rotated_token_deletes_family(self):
+        rotated = self.post_refresh(self.refresh).json()["refresh"]
+        self.assertEqual(self.post_refresh(self.refresh).status_code, 401)
+        self.assertFalse(RefreshTokenFamily.objects.exists())
+        self.assertEqual(self.post_refresh(rotated).status_code, 401)
+
+    def test_replaying_rotated_token_revokes_family_access_tokens(self):
+        access = self.post_refresh(self.refresh).json()["access"]
+        profile = self.client.get(
+            reverse("v1:profile"), HTTP_AUTHORIZATION=f"Bearer {access}"
+        )
+        self.assertEqual(profile.status_code, 200)
+        self.assertEqual(self.post_refresh(self.refresh).status_code, 401)
+        profile = self.client.get(
+            reverse("v1:profile"), HTTP_AUTHORIZATION=f"Bearer {access}"
+        )
+        self.assertEqual(profile.status_code, 401)
+        [result] = introspect_tokens([access])
+        self.assertFalse(result["active"])
+        self.assertEqual(result["error"], "Token is revoked")
+
+    def test_deactivated_user_cannot_refresh(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.post_refresh(self.refresh).status_code, 401)
+        self.assertFalse(RefreshTokenFamily.objects.exists())
+
+    def test_archived_user_cannot_refresh(self):
+        User.objects.filter(pk=self.user.pk).archive()
+        self.assertEqual(self.post_refresh(self.refresh).status_code, 401)
+
+
+class RevocationTests(TestCase):
+    def revoked(self, jti, expires_in):
+        return RevokedToken.objects.create(
+            jti=jti, expires_at=timezone.now() + datetime.timedelta(seconds=expires_in)
+        )
+
+    def test_bloom_filter_sizing(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        # m = -n ln p / (ln 2)^2 bits and k = m / n ln 2 hashes.
+        self.assertEqual(bloom.size, 9586)
+        self.assertEqual(bloom.hash_count, 7)
+        self.assertEqual(len(bloom.bits), 1199)
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        added = [uuid.uuid4().hex for _ in range(1000)]
+        for jti in added:
+            bloom.add(jti)
+        self.assertTrue(all(jti in bloom for jti in added))
+        false_positives = sum(uuid.uuid4().hex in bloom for _ in range(10000))
+        self.assertLess(false_positives, 300)
+
+    @override_settings(TOKEN_REVOCATION_SYNC_SECONDS=0)
+    def test_sync_picks_up_rows_revoked_elsewhere(self):
+        revocations = RevocationList()
+        self.assertFalse(revocations.is_revoked("revoked-elsewhere"))
+        built_at = revocations._built_at
+        self.revoked("revoked-elsewhere", 60)
+        self.assertTrue(revocations.is_revoked("revoked-elsewhere"))
+        self.assertEqual(revocations._built_at, built_at)
+
+    def test_expired_revocations_are_purged_in_batches(self):
+        for i in range(5):
+            self.revoked(f"expired-{i}", -60)
+        self.revoked("live", 60)
+        self.assertEqual(purge_revoked_tokens(batch_size=2, max_batches=2), 4)
+        self.assertEqual(purge_revoked_tokens(batch_size=2), 1)
+        self.assertEqual(
+            list(RevokedToken.objects.values_list("jti", flat=True)), ["live"]
+        )
+
+
+class TokenRevocationViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("jane", "secret-pass", is_active=True)
+        self.other = User.objects.create_user("joe", "secret-pass", is_active=True)
+        self.access = CustomToken.for_user(self.user).access_token
+
+    def revoke(self, token, access=None):
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {access}"} if access else {}
+        return self.client.post(
+            reverse("v1:token_revoke"),
+            {"token": str(token)},
+            content_type="application/json",
+            **headers,
+        )
+
+    def test_requires_authentication(self):
+        self.assertEqual(self.revoke(self.access).status_code, 401)
+        self.assertFalse(RevokedToken.objects.exists())
+
+    def test_owner_revokes_own_token(self):
+        refresh = CustomToken.for_user(self.user)
+        self.assertEqual(self.revoke(refresh, self.access).status_code, 200)
+        self.assertTrue(revocation_list.is_revoked(refresh["jti"]))
+
+    def test_cannot_revoke_another_users_token(self):
+        other = CustomToken.for_user(self.other)
+        self.assertEqual(self.revoke(other, self.access).status_code, 403)
+        self.assertFalse(RevokedToken.objects.exists())
+
+
+class SigningKeyTests(TestCase):
+    def setUp(self):
+        self.ring = KeyRing()
+        patcher = mock.patch("accounts.jwks.key_ring", self.ring)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.backend = KeyRingTokenBackend("ES256")
+        self.old_key = self.create_key(age=datetime.timedelta(days=1))
+
+    def create_key(self, age=datetime.timedelta()):
+        key = generate_signing_key("ES256")
+        SigningKey.objects.filter(pk=key.pk).update(created_at=timezone.now() - age)
+        self.ring.load()
+        return key
+
+    def signing_kid(self):
+        token = self.backend.encode({"user_id": "1"})
+        return get_unverified_header(token)["kid"]
+
+    def test_new_key_is_published_before_it_signs(self):
+        new_key = self.create_key()
+        kids = {key["kid"] for key in self.ring.get_jwks()["keys"]}
+        self.assertEqual(kids, {self.old_key.kid, new_key.kid})
+        self.assertEqual(self.signing_kid(), self.old_key.kid)
+        SigningKey.objects.filter(pk=new_key.pk).update(
+            created_at=timezone.now() - get_publish_delay()
+        )
+        self.ring.load()
+        self.assertEqual(self.signing_kid(), new_key.kid)
+
+    def test_first_key_signs_right_away(self):
+        SigningKey.objects.all().delete()
+        key = self.create_key()
+        self.assertEqual(self.signing_kid(), key.kid)
+
+    def test_superseded_key_verifies_until_retired(self):
+        token = self.backend.encode({"user_id": "1"})
+        self.create_key(age=get_publish_delay())
+        self.assertEqual(self.backend.decode(token)["user_id"], "1")
+        self.assertEqual(retire_signing_keys(datetime.timedelta()), 1)
+        self.ring.load()
+        with self.assertRaises(TokenBackendError):
+            self.backend.decode(token)
+
+    def test_keys_signing_for_less_than_retire_after_are_kept(self):
+        self.create_key(age=get_publish_delay())
+        self.assertEqual(retire_signing_keys(datetime.timedelta(hours=1)), 0)
+
+    def test_rotate_command(self):
+        stdout = io.StringIO()
+        call_command("rotate_signing_keys", "--algorithm", "ES256", stdout=stdout)
+        new_key = SigningKey.objects.latest("created_at")
+        self.assertIn(
+            f"Created ES256 key {new_key.kid}, signing tokens", stdout.getvalue()
+        )
+        self.assertIn("Retired 0 key(s).", stdout.getvalue())
+        self.ring.load()
+        self.assertEqual(self.signing_kid(), self.old_key.kid)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class ImportUsersTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "users.csv")
+        self.checkpoint = os.path.join(directory.name, "users.checkpoint")
+        patcher = mock.patch.object(UserEmailModel, "send_confirmation_code")
+        self.send_confirmation_code = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write_users(self, usernames):
+        with open(self.path, "w", newline="") as stream:
+            writer = csv.writer(stream)
+            writer.writerow(["username", "email", "password"])
+            for username in usernames:
+                writer.writerow([username, f"{username}@example.com", "secret-pass"])
+
+    def import_users(self, *args):
+        stdout = io.StringIO()
+        call_command("import_users", self.path, "--workers", "0", *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_duplicates_are_skipped(self):
+        User.objects.create_user("jane", "secret-pass")
+        self.write_users(["jane", "joe", "joe", "jim"])
+        output = self.import_users("--chunk-size", "2")
+        self.assertIn("Created 2 user(s), skipped 2 existing", output)
+        self.assertEqual(
+            set(UserEmailModel.objects.values_list("email", flat=True)),
+            {"joe@example.com", "jim@example.com"},
+        )
+        self.assertTrue(User.objects.get(username="joe").check_password("secret-pass"))
+        # Re-running over the same input creates nothing.
+        self.assertIn("Created 0 user(s), skipped 4 existing", self.import_users())
+
+    def test_resumes_from_checkpoint(self):
+        self.write_users(["jane", "joe", "jim", "jill", "jack"])
+        save_checkpoint(
+            self.checkpoint,
+            {
+                "source": os.path.abspath(self.path),
+                "position": 2,
+                "created": 2,
+                "skipped": 0,
+                "failed": 0,
+            },
+        )
+        output = self.import_users("--checkpoint", self.checkpoint, "--chunk-size", "2")
+        self.assertIn("Resuming after record 2.", output)
+        self.assertIn("Created 5 user(s)", output)
+        self.assertEqual(
+            set(User.objects.values_list("username", flat=True)),
+            {"jim", "jill", "jack"},
+        )
+        self.assertEqual(load_checkpoint(self.checkpoint)["position"], 5)
+
+    def test_checkpoint_of_another_file_is_refused(self):
+        self.write_users(["jane"])
+        save_checkpoint(self.checkpoint, {"source": "/elsewhere.csv", "position": 1})
+        with self.assertRaises(CommandError):
+            self.import_users("--checkpoint", self.checkpoint)
+
+    def test_confirmation_codes_are_sent_unless_skipped(self):
+        self.write_users(["jane"])
+        self.import_users("--skip-confirmation")
+        self.send_confirmation_code.assert_not_called()
+        self.write_users(["joe"])
+        self.import_users()
+        self.send_confirmation_code.assert_called_once_with()
+
+
+class ExportUsersTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        joined = timezone.now() - datetime.timedelta(days=1)
+        for i in range(7):
+            user = User.objects.create(username=f"user{i}", is_active=True)
+            UserEmailModel.objects.create(user=user, email=f"user{i}@example.com")
+        # Pages must break ties on id, three users share each timestamp.
+        for i, user in enumerate(User.objects.order_by("username")):
+            User.objects.filter(pk=user.pk).update(
+                created_at=joined + datetime.timedelta(seconds=i // 3)
+            )
+
+    def test_keyset_pages_cover_shared_timestamps(self):
+        # Pages of 3, 3 and 1 users, then the empty page ending the export.
+        with self.assertNumQueries(4):
+            rows = list(iter_users(chunk_size=3))
+        expected = list(
+            User.objects.order_by("created_at", "id").values_list("id", flat=True)
+        )
+        self.assertEqual([row["id"] for row in rows], expected)
+        for row in rows:
+            self.assertEqual(row["email"], f"{row['username']}@example.com")
+
+    def test_renders_ndjson_and_csv(self):
+        rows = list(iter_users())
+        lines = list(render_users(rows, NDJSON))
+        self.assertEqual(len(lines), 7)
+        self.assertEqual(json.loads(lines[0])["username"], rows[0]["username"])
+        records = list(csv.DictReader(io.StringIO("".join(render_users(rows, CSV)))))
+        self.assertEqual(list(records[0]), list(EXPORT_FIELDS))
+        self.assertEqual(records[0]["email"], rows[0]["email"])
+        self.assertEqual(records[0]["phone_number"], "")
+
+    def test_endpoint_streams_to_superusers_only(self):
+        admin = User.objects.create(username="admin", is_active=True, is_superuser=True)
+        access = CustomToken.for_user(admin).access_token
+        user_access = CustomToken.for_user(User.objects.get(username="user0"))
+        url = reverse("v1:user-export")
+        response = self.client.get(
+            f"{url}?output=csv", HTTP_AUTHORIZATION=f"Bearer {access}"
+        )
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        # The header row and the 8 users.
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()), 9)
+        response = self.client.get(
+            f"{url}?output=xml", HTTP_AUTHORIZATION=f"Bearer {access}"
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(
+            url, HTTP_AUTHORIZATION=f"Bearer {user_access.access_token}"
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+class UserListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create(
+            username="admin", is_active=True, is_superuser=True
+        )
+        joined = timezone.now() - datetime.timedelta(days=1)
+        for i in range(5):
+            user = User.objects.create(username=f"user{i}", is_active=True)
+            UserEmailModel.objects.create(user=user, email=f"user{i}@example.com")
+            User.objects.filter(pk=user.pk).update(
+                date_joined=joined - datetime.timedelta(minutes=i)
+            )
+        self.access = CustomToken.for_user(self.admin).access_token
+
+    def get(self, url=None, **params):
+        return self.client.get(
+            url or reverse("v1:user-list"),
+            params,
+            HTTP_AUTHORIZATION=f"Bearer {self.access}",
+        )
+
+    def usernames(self, response):
+        return [user["username"] for user in response.json()["results"]]
+
+    def test_cursor_pages_are_stable_under_inserts(self):
+        first = self.get(page_size=3, fields="username")
+        self.assertEqual(self.usernames(first), ["admin", "user0", "user1"])
+        # A user joining meanwhile lands before the cursor, not on the next page.
+        User.objects.create(username="late", is_active=True)
+        second = self.get(first.json()["next"])
+        self.assertEqual(self.usernames(second), ["user2", "user3", "user4"])
+        self.assertIsNone(second.json()["next"])
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(UserCursorPagination, "max_page_size", 2):
+            response = self.get(page_size=100)
+        self.assertEqual(len(response.json()["results"]), 2)
+
+    def test_sparse_fields_skip_unrequested_relations(self):
+        self.get(fields="username")  # Builds the revocation filter.
+        with self.assertNumQueries(1):
+            response = self.get(fields="username,email")
+        self.assertEqual(
+            response.json()["results"][1],
+            {"username": "user0", "email": "user0@example.com"},
+        )
+        with CaptureQueriesContext(connection) as queries:
+            self.get(fields="username")
+        self.assertNotIn("JOIN", queries[0]["sql"])
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.get(fields="username,password_hash")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(), {"fields": ["Unknown fields: password_hash."]}
+        )
+
+
+class StandInIdP:
+    """
+    Local OpenID provider serving its documents to `oidc_documents`.
+    """
+
+    issuer = "https://idp.test"
+    metadata_url = f"{issuer}/.well-known/openid-configuration"
+    jwks_uri = f"{issuer}/certs"
+
+    def __init__(self):
+        self.fetches = []
+        self.rotate()
+
+    def rotate(self):
+        self.key = JsonWebKey.generate_key(
+            "RSA", 2048, options={"kid": uuid.uuid4().hex}, is_private=True
+        )
+
+    def fetch(self, url):
+        self.fetches.append(url)
+        if url == self.jwks_uri:
+            return {"keys": [self.key.as_dict(is_private=False)]}
+        return {"issuer": self.issuer, "jwks_uri": self.jwks_uri}
+
+    def id_token(self, nonce):
+        now = int(time.time())
+        claims = {
+            "iss": self.issuer,
+            "aud": "client",
+            "sub": "42",
+            "iat": now,
+            "exp": now + 300,
+            "nonce": nonce,
+        }
+        header = {"alg": "RS256", "kid": self.key.kid}
+        return {"id_token": jwt.encode(header, claims, self.key).decode()}
+
+
+class OIDCCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.idp = StandInIdP()
+        patcher = mock.patch.object(oidc_documents, "fetch", self.idp.fetch)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        oauth = CachedOAuth()
+        oauth.register(
+            "idp",
+            client_id="client",
+            client_secret="secret",
+            server_metadata_url=self.idp.metadata_url,
+        )
+        self.client_app = oauth.idp
+
+    def parse(self):
+        token = self.idp.id_token("nonce")
+        return self.client_app.parse_id_token(token, nonce="nonce")
+
+    def test_callbacks_read_cached_documents(self):
+        for _ in range(3):
+            self.assertEqual(self.parse()["sub"], "42")
+        self.assertEqual(self.idp.fetches, [self.idp.metadata_url, self.idp.jwks_uri])
+
+    @override_settings(OIDC_CACHE_MIN_RELOAD_SECONDS=0)
+    def test_unknown_kid_reloads_key_set(self):
+        self.parse()
+        self.idp.rotate()
+        self.assertEqual(self.parse()["sub"], "42")
+        self.assertEqual(self.idp.fetches.count(self.idp.jwks_uri), 2)
+
+    def test_unknown_kid_reloads_are_rate_limited(self):
+        self.parse()
+        self.idp.rotate()
+        with self.assertRaises(ValueError):
+            self.parse()
+        self.assertEqual(self.idp.fetches.count(self.idp.jwks_uri), 1)
+
+
+class DummyTransport(Transport):
+    """
+    Keeps the envelopes Sentry would have sent.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.envelopes = []
+
+    def capture_envelope(self, envelope):
+        self.envelopes.append(envelope)
+
+    def transactions(self):
+        return [
+            item.payload.json
+            for envelope in self.envelopes
+            for item in envelope.items
+            if item.type == "transaction"
+        ]
+
+
+@override_settings(
+    SENTRY_DSN="http://public@localhost/1",
+    SENTRY_TRACES_SAMPLE_RATES={"v1:jwks": 0.0},
+)
+class TraceSamplingTests(TestCase):
+    def setUp(self):
+        self.transport = DummyTransport()
+        init_sentry("http://public@localhost/1", transport=self.transport)
+        self.addCleanup(sentry_sdk.init)
+
+    def get_jwks(self):
+        # Served through WSGIHandler, which Sentry instruments.
+        environ = RequestFactory().get(reverse("v1:jwks")).environ
+        statuses = []
+        response = WSGIHandler()(environ, lambda status, _: statuses.append(status))
+        b"".join(response)
+        response.close()
+        sentry_sdk.flush()
+        return int(statuses[0].split()[0])
+
+    def test_unsampled_routes_send_nothing(self):
+        self.assertEqual(self.get_jwks(), 200)
+        self.assertEqual(self.transport.transactions(), [])
+
+    def test_server_errors_are_always_traced(self):
+        with mock.patch("api.views.JWKSView.get", side_effect=RuntimeError):
+            self.assertEqual(self.get_jwks(), 500)
+        (transaction,) = self.transport.transactions()
+        self.assertEqual(transaction["contexts"]["trace"]["status"], "internal_error")
+
+    @override_settings(SENTRY_TRACES_SLOW_SECONDS=0)
+    def test_slow_requests_are_always_traced(self):
+        self.get_jwks()
+        self.assertEqual(len(self.transport.transactions()), 1)
+
+    @override_settings(
+        SENTRY_TRACES_DEFAULT_SAMPLE_RATE=1.0, SENTRY_TRACES_PER_SECOND=10
+    )
+    def test_sampling_adapts_to_budget(self):
+        now = [0.0]
+        sampler = TraceSampler(clock=lambda: now[0], random=lambda: 0.5)
+        for _ in range(1000):
+            self.assertTrue(sampler.should_keep("v1:login", 200, 0.01))
+        now[0] = sampler.window
+        sampler.should_keep("v1:login", 200, 0.01)
+        self.assertAlmostEqual(sampler.scale, 0.1)
+        self.assertFalse(sampler.should_keep("v1:login", 200, 0.01))
+        self.assertTrue(sampler.should_keep("v1:login", 500, 0.01))
+
+
+@override_settings(DATABASE_REPLICA_ALIASES=["replica1"])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.health = ReplicaHealth()
+        patcher = mock.patch("base.routers.replica_health", self.health)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(self.health, "check", return_value=True)
+        self.check = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_go_to_replicas_and_writes_to_primary(self):
+        self.assertEqual(self.router.db_for_read(User), "replica1")
+        self.assertEqual(self.router.db_for_write(User), "default")
+        self.assertFalse(self.router.allow_migrate("replica1", "accounts"))
+
+    def test_reads_follow_writes_to_primary(self):
+        state, token = start_routing()
+        self.addCleanup(end_routing, token)
+        self.assertEqual(self.router.db_for_read(User), "replica1")
+        self.router.db_for_write(User)
+        self.assertEqual(self.router.db_for_read(User), "default")
+
+    def test_unhealthy_replicas_are_skipped_until_checked_again(self):
+        self.check.return_value = False
+        self.assertEqual(self.router.db_for_read(User), "default")
+        self.check.return_value = True
+        self.assertEqual(self.router.db_for_read(User), "default")
+        self.assertEqual(self.check.call_count, 1)
+        with override_settings(DATABASE_REPLICA_HEALTH_CHECK_SECONDS=0):
+            self.assertEqual(self.router.db_for_read(User), "replica1")
+
+    def test_clients_stick_to_primary_after_writing(self):
+        reads = []
+
+        def write(request):
+            self.router.db_for_write(User)
+            return HttpResponse()
+
+        def read(request):
+            reads.append(self.router.db_for_read(User))
+            return HttpResponse()
+
+        response = ReplicaPinningMiddleware(write)(RequestFactory().post("/"))
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+        ReplicaPinningMiddleware(read)(RequestFactory().get("/"))
+        request = RequestFactory().get("/")
+        request.COOKIES[PRIMARY_COOKIE] = response.cookies[PRIMARY_COOKIE].value
+        ReplicaPinningMiddleware(read)(request)
+        self.assertEqual(reads, ["replica1", "default"])
+
+
+@override_settings(DATABASE_REPLICA_ALIASES=["replica"])
+class ReplicaRoutingDatabaseTests(TransactionTestCase):
+    """
+    Routes through real connections, "replica" mirroring the test database.
+    `TestCase` would keep the primary inside a transaction, which the router
+    answers by reading from the primary throughout.
+    """
+
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        patcher = mock.patch("base.routers.replica_health", ReplicaHealth())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create(username="jane")
+
+    def handle(self, view, request):
+        with CaptureQueriesContext(connections["default"]) as primary:
+            with CaptureQueriesContext(connections["replica"]) as replica:
+                response = ReplicaPinningMiddleware(view)(request)
+        return response, len(primary), len(replica)
+
+    def test_clients_read_their_writes_from_primary(self):
+        def rename(request):
+            User.objects.filter(pk=self.user.pk).update(first_name="Janet")
+            self.assertEqual(User.objects.get().first_name, "Janet")
+            return HttpResponse()
+
+        def read(request):
+            return HttpResponse(User.objects.get().first_name)
+
+        response, primary, replica = self.handle(rename, RequestFactory().post("/"))
+        self.assertEqual((primary, replica), (2, 0))
+
+        # Without the cookie reads go to the replica, health check included.
+        replicated, primary, replica = self.handle(read, RequestFactory().get("/"))
+        self.assertEqual((primary, replica), (0, 2))
+        self.assertEqual(replicated.content, b"Janet")
+
+        request = RequestFactory().get("/")
+        request.COOKIES[PRIMARY_COOKIE] = response.cookies[PRIMARY_COOKIE].value
+        pinned, primary, replica = self.handle(read, request)
+        self.assertEqual((primary, replica), (1, 0))
+        self.assertEqual(pinned.content, b"Janet")
+
+
+# Plan lines of a full table scan or of a sort done outside an index, as
+# reported by SQLite and PostgreSQL.
+FULL_SCAN = re.compile(r"\bSCAN \w+$|Seq Scan|TEMP B-TREE|Sort Key", re.MULTILINE)
+
+
+class QueryPlanTests(TestCase):
+    def setUp(self):
+        if connection.vendor == "postgresql":
+            # Empty test tables are cheaper to scan; plan as for real volumes.
+            with connection.cursor() as cursor:
+                cursor.execute("SET enable_seqscan = off")
+                cursor.execute("SET enable_sort = off")
+
+    def assertUsesIndexes(self, queryset):
+        plan = queryset.explain()
+        self.assertIsNone(FULL_SCAN.search(plan), f"{queryset.query}\n{plan}")
+
+    def test_hot_queries_use_indexes(self):
+        now = timezone.now()
+        last_id = uuid.uuid4()
+        queries = {
+            "user list": User.objects.order_by(*UserCursorPagination.ordering)[:51],
+            "user list next page": User.objects.filter(
+                Q(date_joined__lt=now) | Q(date_joined=now, id__gt=last_id)
+            ).order_by(*UserCursorPagination.ordering)[:51],
+            "export page": User.objects.filter(
+                Q(created_at__gt=now) | Q(created_at=now, id__gt=last_id)
+            )
+            .order_by("created_at", "id")
+            .values("id", "email_model__email", "phone_number_model__phone_number")[
+                :2000
+            ],
+            "inactive users": User.objects.filter(
+                is_active=False, date_joined__lt=now
+            ).order_by("date_joined"),
+            "recent emails": UserEmailModel.objects.all()[:50],
+            "recent phone numbers": UserPhoneNumberModel.objects.all()[:50],
+            "unverified emails": UserEmailModel.objects.filter(
+                is_verified=False, sent_date__lt=now
+            ).order_by("sent_date"),
+            "unverified phone numbers": UserPhoneNumberModel.objects.filter(
+                is_verified=False, sent_date__lt=now
+            ).order_by("sent_date"),
+            "revocation sync": RevokedToken.objects.filter(
+                created_at__gte=now
+            ).values_list("jti", flat=True),
+            "users to archive": User.objects.archived()
+            .order_by("pk")
+            .values_list("pk", flat=True)[:500],
+            "emails to archive": UserEmailModel.objects.archived()
+            .order_by("pk")
+            .values_list("pk", flat=True)[:500],
+            "expired email codes": UserEmailModel.objects.filter(sent_date__lt=now)
+            .exclude(security_code="")
+            .order_by("sent_date")
+            .values_list("pk", flat=True)[:500],
+            "token family purge": RefreshTokenFamily.objects.filter(
+                expires_at__lte=now
+            ).values_list("pk", flat=True)[:5000],
+        }
+        for name, queryset in queries.items():
+            with self.subTest(name):
+                self.assertUsesIndexes(queryset)
+
+
+class AddIndexConcurrentlyTests(SimpleTestCase):
+    def setUp(self):
+        self.operation = AddIndexConcurrently(
+            "user", models.Index(fields=["last_login"], name="user_login_idx")
+        )
+        self.state = ProjectState.from_apps(apps)
+        self.schema_editor = mock.Mock()
+        self.schema_editor.connection.alias = "default"
+        self.schema_editor.connection.vendor = "postgresql"
+        self.schema_editor.connection.in_atomic_block = False
+
+    def test_postgresql_builds_concurrently(self):
+        self.operation.database_forwards(
+            "accounts", self.schema_editor, self.state, self.state
+        )
+        self.schema_editor.add_index.assert_called_once_with(
+            mock.ANY, self.operation.index, concurrently=True
+        )
+
+    def test_refuses_to_run_in_a_transaction(self):
+        self.schema_editor.connection.in_atomic_block = True
+        with self.assertRaises(NotSupportedError):
+            self.operation.database_forwards(
+                "accounts", self.schema_editor, self.state, self.state
+            )
+
+    def test_other_databases_build_as_add_index(self):
+        self.schema_editor.connection.vendor = "sqlite"
+        self.operation.database_forwards(
+            "accounts", self.schema_editor, self.state, self.state
+        )
+        self.schema_editor.add_index.assert_called_once_with(
+            mock.ANY, self.operation.index
+        )
+
+
+class PurgeTests(TestCase):
+    def setUp(self):
+        self.cutoff = timezone.now() - datetime.timedelta(days=30)
+        self.joined = self.cutoff - datetime.timedelta(days=1)
+
+    def create_user(self, username, verified=False, **fields):
+        user = User.objects.create_user(
+            username, "secret-pass", date_joined=fields.pop("date_joined", self.joined)
+        )
+        User.objects.filter(pk=user.pk).update(**fields)
+        UserEmailModel.objects.create(
+            user=user,
+            email=f"{username}@example.com",
+            is_verified=verified,
+            security_code="123456",
+        )
+        # sent_date is set on INSERT.
+        UserEmailModel.objects.filter(user=user).update(sent_date=self.joined)
+        return user
+
+    def test_stale_users(self):
+        stale = self.create_user("stale")
+        self.create_user("staff", is_staff=True)
+        self.create_user("verified", verified=True)
+        self.create_user("recent", date_joined=timezone.now())
+        self.create_user("active", is_active=True)
+        self.assertEqual(list(stale_users(self.cutoff)), [stale])
+
+    def test_user_verified_meanwhile_is_kept(self):
+        user = self.create_user("jane")
+        ids = [user.pk]
+        UserEmailModel.objects.filter(user=user).update(is_verified=True)
+        self.assertEqual(delete_users(self.cutoff, ids), 0)
+        self.assertTrue(User.objects.filter(pk=user.pk).exists())
+
+    def test_delete_action(self):
+        self.create_user("stale")
+        kept = self.create_user("verified", verified=True)
+        handled = list(purge_stale_accounts(self.cutoff, DELETE, batch_size=1))
+        self.assertEqual(handled, [1])
+        self.assertEqual(list(User._base_manager.all()), [kept])
+        self.assertEqual(UserEmailModel._base_manager.count(), 1)
+
+    def test_archive_action(self):
+        user = self.create_user("stale")
+        self.create_user("stale2")
+        handled = list(purge_stale_accounts(self.cutoff, ARCHIVE, batch_size=1))
+        self.assertEqual(handled, [1, 1])
+        self.assertFalse(User.objects.exists())
+        self.assertEqual(User.objects.archived().count(), 2)
+        email = UserEmailModel._base_manager.get(user=user)
+        self.assertTrue(email.is_archived)
+        self.assertEqual(email.security_code, "")
+
+    def test_expired_codes_are_cleared_per_table(self):
+        expired = self.create_user("expired", is_active=True)
+        fresh = self.create_user("fresh", is_active=True)
+        UserEmailModel.objects.filter(user=fresh).update(sent_date=timezone.now())
+        UserPhoneNumberModel.objects.create(
+            user=expired, phone_number="+254712345678", security_code="654321"
+        )
+        UserPhoneNumberModel.objects.update(sent_date=self.joined)
+        cleared = list(clear_expired_codes(batch_size=1, max_batches=1))
+        self.assertEqual(cleared, [1, 1])
+        self.assertEqual(UserEmailModel.objects.get(user=expired).security_code, "")
+        self.assertEqual(UserPhoneNumberModel.objects.get().security_code, "")
+        self.assertEqual(UserEmailModel.objects.get(user=fresh).security_code, "123456")
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class ArchivingTests(FakeRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("jane", "secret-pass", is_active=True)
+        self.user.metadata = {"source": "import"}
+        self.user.save()
+        self.email = UserEmailModel.objects.create(
+            user=self.user, email="jane@example.com", is_verified=True
+        )
+        UserPhoneNumberModel.objects.create(
+            user=self.user, phone_number="+254712345678", is_verified=True
+        )
+
+    def test_archived_rows_move_to_archive_tables_and_back(self):
+        User.objects.filter(pk=self.user.pk).archive()
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertEqual(User.objects.archived().count(), 1)
+
+        self.assertEqual(sum(archive_pending(User, batch_size=10)), 3)
+        self.assertFalse(User._base_manager.exists())
+        self.assertFalse(UserEmailModel._base_manager.exists())
+        archived = UserArchive.objects.get(pk=self.user.pk)
+        self.assertEqual(archived.metadata, {"source": "import"})
+        self.assertEqual(archived.data["username"], "jane")
+        self.assertEqual(UserEmailArchive.objects.get().user_id, self.user.pk)
+
+        self.assertEqual(restore_from_archive(User, [self.user.pk]), 3)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.metadata, {"source": "import"})
+        self.assertTrue(user.check_password("secret-pass"))
+        self.assertEqual(user.email_model.email, "jane@example.com")
+        self.assertTrue(user.phone_number_model.is_verified)
+        self.assertFalse(UserArchive.objects.exists())
+        self.assertFalse(UserEmailArchive.objects.exists())
+
+    def register(self, **data):
+        return self.client.post(
+            reverse("v1:register"),
+            {"password": "secret-pass", **data},
+            content_type="application/json",
+        )
+
+    def test_archived_rows_waiting_to_move_still_conflict(self):
+        User.objects.filter(pk=self.user.pk).archive()
+        UserEmailModel.objects.filter(pk=self.email.pk).archive()
+        cases = [
+            ({"username": "jane", "email": "x@example.com"}, "username"),
+            ({"username": "joe", "email": "jane@example.com"}, "non_field_errors"),
+            ({"username": "joe", "phone_number": "+254712345678"}, "non_field_errors"),
+        ]
+        for data, field in cases:
+            with self.subTest(data=data):
+                response = self.register(**data)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(field, response.json())
+
+    def test_import_skips_archived_rows_waiting_to_move(self):
+        for model in (User, UserEmailModel, UserPhoneNumberModel):
+            model.objects.all().archive()
+        records = [
+            {"username": "jane", "email": "x@example.com", "password": "pass"},
+            {"username": "joe", "email": "jane@example.com", "password": "pass"},
+            {"username": "jim", "phone_number": "+254712345678", "password": "pass"},
+        ]
+        importer = UserImporter(send_confirmation=False)
+        [result] = importer.run(records)
+        self.assertEqual((result.created, result.skipped), (0, 3))
+
+    def test_restore_reports_values_taken_since_archiving(self):
+        User.objects.filter(pk=self.user.pk).archive()
+        list(archive_pending(User))
+        self.assertEqual(
+            self.register(username="janet", email="jane@example.com").status_code,
+            201,
+        )
+        with self.assertRaises(ArchiveConflict) as raised:
+            restore_from_archive(User, [self.user.pk])
+        self.assertEqual(
+            raised.exception.conflicts,
+            {"accounts.UserEmailModel": {"email": ["jane@example.com"]}},
+        )
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertTrue(UserArchive.objects.filter(pk=self.user.pk).exists())
+        self.assertEqual(UserEmailArchive.objects.count(), 1)
@@ -0,0 +1,139 @@
+import logging
+import uuid
+
+import redis
+from phonenumber_field.phonenumber import to_python
+from rest_framework.throttling import ScopedRateThrottle
+
+from base.redis import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class SlidingWindowThrottle(ScopedRateThrottle):
+    """
+    Sliding-window rate limit kept in a Redis sorted set.
+
+    The rate is read from `DEFAULT_THROTTLE_RATES["<throttle_scope>_<kind>"]`;
+    views without a configured rate for the kind are not throttled. Runs
+    before the view handler, so rejected requests never reach hashing or the
+    database. Redis errors fail open.
+    """
+
+    kind = None
+    cache_format = "throttle:%(scope)s:%(ident)s"
+
+    # Drops the hits that left the window, then records the hit only while the
+    # window has room, in one atomic step so concurrent requests cannot both
+    # take the last slot. Returns {allowed, score of the oldest hit}, the
+    # score as a string since Lua numbers are returned truncated.
+    WINDOW_SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local duration = tonumber(ARGV[2])
+    redis.call("ZREMRANGEBYSCORE", KEYS[1], 0, now - duration)
+    if redis.call("ZCARD", KEYS[1]) < tonumber(ARGV[3]) then
+        redis.call("ZADD", KEYS[1], now, ARGV[4])
+        redis.call("EXPIRE", KEYS[1], duration)
+        return {1, ARGV[1]}
+    end
+    local oldest = redis.call("ZRANGE", KEYS[1], 0, 0, "WITHSCORES")
+    return {0, oldest[2]}
+    """
+
+    def get_rate(self):
+        return self.THROTTLE_RATES.get(self.scope)
+
+    def get_ident_value(self, request):
+        raise NotImplementedError(".get_ident_value() must be overridden")
+
+    def allow_request(self, request, view):
+        view_scope = getattr(view, self.scope_attr, None)
+        if not view_scope:
+            return True
+        self.scope = f"{view_scope}_{self.kind}"
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        try:
+            return self.hit_window()
+        except redis.RedisError as e:
+            logger.warning(f"Throttle {self.scope} skipped, redis unavailable: {e}")
+            return True
+
+    def hit_window(self):
+        self.now = self.timer()
+        script = get_redis_client().register_script(self.WINDOW_SCRIPT)
+        allowed, oldest_at = script(
+            keys=[self.key],
+            args=[
+                self.now,
+                self.duration,
+                self.num_requests,
+                f"{self.now}:{uuid.uuid4().hex}",
+            ],
+        )
+        if allowed:
+            return True
+        self.retry_after = max(float(oldest_at) + self.duration - self.now, 0)
+        return False
+
+    def wait(self):
+        return getattr(self, "retry_after", None)
+
+    def get_cache_key(self, request, view):
+        ident = self.get_ident_value(request)
+        if not ident:
+            return None
+        return self.cache_format % {"scope": self.scope, "ident": ident}
+
+
+class IPRateThrottle(SlidingWindowThrottle):
+    kind = "ip"
+
+    def get_ident_value(self, request):
+        return self.get_ident(request)
+
+
+class UsernameRateThrottle(SlidingWindowThrottle):
+    kind = "username"
+
+    def get_ident_value(self, request):
+        username = request.data.get("username")
+        if isinstance(username, str):
+            return username.strip().lower()
+
+
+class PhoneNumberRateThrottle(SlidingWindowThrottle):
+    kind = "phone_number"
+
+    def get_ident_value(self, request):
+        phone_number = request.data.get("phone_number")
+        if not isinstance(phone_number, str) or not phone_number:
+            return None
+        # Key on the E.164 form so formatting variants share one window.
+        number = to_python(phone_number)
+        if number and number.is_valid():
+            return number.as_e164
+        return phone_number.strip()
+
+
+class EmailRateThrottle(SlidingWindowThrottle):
+    kind = "email"
+
+    def get_ident_value(self, request):
+        email = request.data.get("email")
+        if isinstance(email, str):
+            return email.strip().lower()
+
+
+CREDENTIAL_THROTTLES = (
+    IPRateThrottle,
+    UsernameRateThrottle,
+    PhoneNumberRateThrottle,
+    EmailRateThrottle,
+)
@@ -0,0 +1,100 @@
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from accounts.revocation import FAMILY_CLAIM, revoke_token, revoke_token_family
+
+
+def start_token_family(token):
+    """
+    Registers a newly minted refresh token as the first of a new family.
+    """
+    from accounts.models import RefreshTokenFamily
+
+    family = RefreshTokenFamily.objects.create(
+        user_id=token[api_settings.USER_ID_CLAIM],
+        current_jti=token[api_settings.JTI_CLAIM],
+        expires_at=datetime_from_epoch(token["exp"]),
+    )
+    token[FAMILY_CLAIM] = str(family.pk)
+    return token
+
+
+def rotate_refresh_token(token):
+    """
+    Rotates a verified refresh token, re-minting its claims from the user row.
+
+    The user is loaded with one primary key query and must still be active; the
+    default manager hides archived users. The family advances with one
+    conditional UPDATE on its primary key and keeps its original `expires_at`,
+    so a session lasts at most `REFRESH_TOKEN_LIFETIME` however often it is
+    refreshed.
+
+    Presenting a token that was already rotated means it leaked; the whole
+    family is deleted and revoked, so every token of the session, access tokens
+    included, stops working.
+    """
+    from accounts.models import RefreshTokenFamily, User
+
+    family_id = token.get(FAMILY_CLAIM)
+    user = (
+        User.objects.select_related("email_model", "phone_number_model")
+        .filter(pk=token[api_settings.USER_ID_CLAIM])
+        .first()
+    )
+    if user is None or not user.is_active:
+        if family_id is not None:
+            end_token_family(token)
+        raise TokenError(_("User is inactive"))
+
+    rotated_token = type(token).for_user(user)
+    if family_id is None:
+        # Tokens minted before families existed are revoked and start one.
+        revoke_token(token)
+        return start_token_family(rotated_token)
+
+    rotated_token["exp"] = token["exp"]
+    rotated = RefreshTokenFamily.objects.filter(
+        pk=family_id,
+        current_jti=token[api_settings.JTI_CLAIM],
+        expires_at__gt=timezone.now(),
+    ).update(current_jti=rotated_token[api_settings.JTI_CLAIM])
+    if not rotated:
+        end_token_family(token)
+        raise TokenError(_("Token is blacklisted"))
+    rotated_token[FAMILY_CLAIM] = family_id
+    return rotated_token
+
+
+def end_token_family(token):
+    """
+    Deletes the family of `token` and revokes the tokens it issued.
+    """
+    from accounts.models import RefreshTokenFamily
+
+    family_id = token[FAMILY_CLAIM]
+    RefreshTokenFamily.objects.filter(pk=family_id).delete()
+    revoke_token_family(family_id, token.get(api_settings.USER_ID_CLAIM))
+
+
+def purge_token_families(batch_size, max_batches=None):
+    """
+    Deletes expired families `batch_size` rows at a time and returns the count.
+    """
+    from accounts.models import RefreshTokenFamily
+
+    now = timezone.now()
+    deleted = batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = list(
+            RefreshTokenFamily.objects.filter(expires_at__lte=now).values_list(
+                "pk", flat=True
+            )[:batch_size]
+        )
+        if not ids:
+            break
+        deleted += RefreshTokenFamily.objects.filter(pk__in=ids).delete()[0]
+        batches += 1
+    return deleted
@@ -1,4 +1,5 @@
 from django.urls import path, include
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework.routers import DefaultRouter
 
 from accounts.views import (
@@ -12,6 +13,14 @@ from accounts.views import (
     auth_callback,
     google_login,
     ProfileView,
+    UserExportView,
+)
+from accounts.async_views import (
+    AsyncUserRegistrationView,
+    AsyncLoginView,
+    AsyncGenerateOTPView,
+    AsyncVerifyOTPView,
+    AsyncProfileView,
 )
 from accounts.viewsets import UserViewSet
 
@@ -34,7 +43,26 @@ api_urlpatterns = [
     path("register/", UserRegistrationView.as_view(), name="register"),
     path("login/", LoginView.as_view(), name="login"),
     path("login/sso/", google_login, name="google_login"),
+    path("user/export/", UserExportView.as_view(), name="user-export"),
     path("", include(router.urls), name="account-home"),
     path("auth/callback/", auth_callback, name="auth_callback"),
     path("profile/", ProfileView.as_view(), name="profile"),
+    # Native async endpoints, served without thread hops under ASGI
+    path(
+        "async/register/",
+        csrf_exempt(AsyncUserRegistrationView.as_view()),
+        name="async-register",
+    ),
+    path("async/login/", csrf_exempt(AsyncLoginView.as_view()), name="async-login"),
+    path(
+        "async/generate/otp/",
+        csrf_exempt(AsyncGenerateOTPView.as_view()),
+        name="async-generate-otp",
+    ),
+    path(
+        "async/verify/otp/",
+        csrf_exempt(AsyncVerifyOTPView.as_view()),
+        name="async-verify-otp",
+    ),
+    path("async/profile/", AsyncProfileView.as_view(), name="async-profile"),
 ]
@@ -1,19 +1,23 @@
-import datetime
+import functools
 import logging
 from django.core import signing
+from django.http import StreamingHttpResponse
 from django.shortcuts import redirect
 from django.contrib.auth import login
-from authlib.integrations.django_client import OAuth
 from django.conf import settings
 from django.contrib.auth import authenticate
+from django.core.cache import cache
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import views, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import GenericAPIView
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
 from accounts.custom_jwt import CustomToken
+from accounts.exporters import CONTENT_TYPES, NDJSON, iter_users, render_users
+from accounts.permissions import IsSuperUser
 from accounts.serializers import (
     UserRegistrationSerializer,
     GenerateOTPSerializer,
@@ -22,23 +26,34 @@ from accounts.serializers import (
     PasswordResetConfirmationSerializer,
     PasswordChangeSerializer,
 )
+from accounts.tasks import publish_last_login
+from accounts.token_families import start_token_family
+from accounts.throttling import CREDENTIAL_THROTTLES
 from django.utils.translation import gettext_lazy as _
 
 logger = logging.getLogger(__name__)
-oauth = OAuth()
-
-oauth.register(
-    name="google",
-    client_id=settings.GOOGLE_CLIENT_ID,
-    client_secret=settings.GOOGLE_CLIENT_SECRET,
-    authorize_url="https://accounts.google.com/o/oauth2/auth",
-    authorize_params=None,
-    access_token_url="https://accounts.google.com/o/oauth2/token",
-    jwks_uri="https://www.googleapis.com/oauth2/v3/certs",
-    access_token_params=None,
-    refresh_token_url=None,
-    client_kwargs={"scope": "openid profile email"},
-)
+
+
+@functools.cache
+def get_google_client():
+    """
+    Builds the Google OAuth client on first use, keeping authlib out of boot.
+    """
+    from accounts.oidc import CachedOAuth
+
+    # Authorization state lives in the cache rather than the database-backed
+    # session.
+    oauth = CachedOAuth(cache=cache)
+    return oauth.register(
+        name="google",
+        client_id=settings.GOOGLE_CLIENT_ID,
+        client_secret=settings.GOOGLE_CLIENT_SECRET,
+        server_metadata_url=settings.GOOGLE_OIDC_METADATA_URL,
+        authorize_params=None,
+        access_token_params=None,
+        refresh_token_url=None,
+        client_kwargs={"scope": "openid profile email"},
+    )
 
 
 def replace_http_with_https(url):
@@ -49,20 +64,39 @@ def replace_http_with_https(url):
     return url
 
 
+OAUTH_STATE_COOKIE = "oauth_state"
+
+
 def google_login(request):
     state = signing.dumps({"some_data": "value"})
-    request.session["state"] = state  # Store in session
     redirect_uri = request.build_absolute_uri(reverse("api:auth_callback"))
     new_redirect_uri = replace_http_with_https(redirect_uri)
-    return oauth.google.authorize_redirect(request, new_redirect_uri, state=state)
+    google = get_google_client()
+    response = google.authorize_redirect(request, new_redirect_uri, state=state)
+    # Binds the flow to this browser without writing to the session.
+    response.set_signed_cookie(
+        OAUTH_STATE_COOKIE,
+        state,
+        salt=OAUTH_STATE_COOKIE,
+        max_age=google.framework.expires_in,
+        secure=request.is_secure(),
+        httponly=True,
+        samesite="Lax",
+    )
+    return response
 
 
 def auth_callback(request):
     state = request.GET.get("state")
-    if state != request.session.get("state"):
+    cookie = request.get_signed_cookie(
+        OAUTH_STATE_COOKIE, default=None, salt=OAUTH_STATE_COOKIE
+    )
+    if state is None or state != cookie:
         raise ValueError("Invalid state parameter")
-    token = oauth.google.authorize_access_token(request)
-    user_info = oauth.google.parse_id_token(request, token)
+    # The ID token is verified against the cached key set while the token is
+    # exchanged; its claims come back as `userinfo`.
+    token = get_google_client().authorize_access_token(request)
+    user_info = token.get("userinfo")
     logger.warning("User Info:", user_info)
     user = authenticate(request, user_info=user_info)
     if user:
@@ -72,6 +106,8 @@ def auth_callback(request):
 
 
 class UserRegistrationView(views.APIView):
+    permission_classes = (AllowAny,)
+
     def post(self, request):
         serializer = UserRegistrationSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -80,10 +116,18 @@ class UserRegistrationView(views.APIView):
 
 
 class LoginView(views.APIView):
+    permission_classes = (AllowAny,)
+    # No credentials are checked, so flooding requests cost nothing before
+    # the throttles reject them.
+    authentication_classes = ()
+    throttle_classes = CREDENTIAL_THROTTLES
+    throttle_scope = "login"
+
     def post(self, request):
         username = request.data.get("username")
         password = request.data.get("password")
-        user = authenticate(username=username, password=password)
+        # AccountBackend selects both channels with the user in a single query
+        user = authenticate(request, username=username, password=password)
         if user:
             # check if registration channel is verified
             is_phone_number_verified = user.is_phone_number_verified()
@@ -96,13 +140,11 @@ class LoginView(views.APIView):
                     message += " phone number."
                 message += " Kindly generate OTP to verify."
                 return Response({"error": message}, status=status.HTTP_400_BAD_REQUEST)
-            user.last_login = datetime.datetime.now()
-            user.save(update_fields=["last_login"])
-            token = CustomToken.for_user(user)
-            refresh = RefreshToken.for_user(user)
+            publish_last_login(user.id, timezone.now())
+            token = start_token_family(CustomToken.for_user(user))
             return Response(
                 {
-                    "refresh": str(refresh),
+                    "refresh": str(token),
                     "access": str(token.access_token),
                     "first_name": user.first_name,
                     "last_name": user.last_name,
@@ -117,6 +159,10 @@ class LoginView(views.APIView):
 
 class GenerateOTPView(GenericAPIView):
     serializer_class = GenerateOTPSerializer
+    permission_classes = (AllowAny,)
+    authentication_classes = ()
+    throttle_classes = CREDENTIAL_THROTTLES
+    throttle_scope = "otp_generate"
 
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -130,6 +176,10 @@ class GenerateOTPView(GenericAPIView):
 
 class VerifyOTPView(GenericAPIView):
     serializer_class = VerifyOTPSerializer
+    permission_classes = (AllowAny,)
+    authentication_classes = ()
+    throttle_classes = CREDENTIAL_THROTTLES
+    throttle_scope = "otp_verify"
 
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -160,6 +210,9 @@ class PasswordChangeView(GenericAPIView):
 class ResetPasswordView(GenericAPIView):
     serializer_class = ResetPasswordSerializer
     permission_classes = (AllowAny,)
+    authentication_classes = ()
+    throttle_classes = CREDENTIAL_THROTTLES
+    throttle_scope = "password_reset"
 
     def post(self, request):
         serializer = self.serializer_class(
@@ -173,6 +226,9 @@ class ResetPasswordView(GenericAPIView):
 class ResetPasswordConfirmationView(GenericAPIView):
     serializer_class = PasswordResetConfirmationSerializer
     permission_classes = (AllowAny,)
+    authentication_classes = ()
+    throttle_classes = CREDENTIAL_THROTTLES
+    throttle_scope = "password_reset_confirm"
 
     def post(self, request):
         serializer = self.serializer_class(
@@ -197,3 +253,21 @@ class ProfileView(APIView):
                 "email": user.email,
             }
         )
+
+
+class UserExportView(APIView):
+    permission_classes = [IsSuperUser]
+
+    def get(self, request):
+        # `format` is taken by DRF content negotiation, hence `output`.
+        file_format = request.query_params.get("output", NDJSON)
+        if file_format not in CONTENT_TYPES:
+            raise ValidationError(
+                {"output": [f"Choose one of {', '.join(CONTENT_TYPES)}."]}
+            )
+        response = StreamingHttpResponse(
+            render_users(iter_users(), file_format),
+            content_type=CONTENT_TYPES[file_format],
+        )
+        response["Content-Disposition"] = f'attachment; filename="users.{file_format}"'
+        return response
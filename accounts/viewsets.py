@@ -1,8 +1,11 @@
+from django.utils.functional import cached_property
 from rest_framework import mixins, viewsets
 from django.contrib.auth import get_user_model
 
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
 
+from accounts.pagination import UserCursorPagination
 from accounts.serializers import UserSerializer
 
 User = get_user_model()
@@ -16,12 +19,59 @@ class UserViewSet(
 ):
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    pagination_class = UserCursorPagination
     permission_classes = [
         IsAuthenticated,
     ]
+    # Relations read by each serializer field, loaded only when it is rendered.
+    select_related_fields = {
+        "email": "email_model",
+        "phone_number": "phone_number_model",
+    }
+    prefetch_related_fields = {
+        "groups": "groups",
+        "user_permissions": "user_permissions",
+    }
+
+    @cached_property
+    def requested_fields(self):
+        """
+        Fields of the `?fields=` sparse fieldset, None renders every field.
+        """
+        value = self.request.query_params.get("fields")
+        if not value or self.request.method not in SAFE_METHODS:
+            return None
+        fields = [name.strip() for name in value.split(",") if name.strip()]
+        unknown = set(fields) - set(self.get_serializer_class()().fields)
+        if unknown:
+            raise ValidationError(
+                {"fields": [f"Unknown fields: {', '.join(sorted(unknown))}."]}
+            )
+        return fields
 
     def get_queryset(self):
         user = self.request.user
         if user.is_superuser:
-            return self.queryset.all()
-        return self.queryset.filter(id=self.request.user.id)
+            queryset = self.queryset.all()
+        else:
+            queryset = self.queryset.filter(id=self.request.user.id)
+
+        fields = self.requested_fields
+        select_related = [
+            relation
+            for name, relation in self.select_related_fields.items()
+            if fields is None or name in fields
+        ]
+        prefetch_related = [
+            relation
+            for name, relation in self.prefetch_related_fields.items()
+            if fields is None or name in fields
+        ]
+        # select_related() without arguments would join every foreign key.
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        return queryset.prefetch_related(*prefetch_related)
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault("fields", self.requested_fields)
+        return super().get_serializer(*args, **kwargs)
@@ -1,3 +1,68 @@
-from django.shortcuts import render
+import functools
 
-# Create your views here.
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from rest_framework.generics import GenericAPIView
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_api_key.permissions import HasAPIKey
+
+from accounts.introspection import introspect_tokens
+from accounts.jwks import key_ring
+from accounts.serializers import (
+    TokenIntrospectionSerializer,
+    TokenRevocationSerializer,
+)
+
+
+class JWKSView(APIView):
+    authentication_classes = ()
+    permission_classes = (AllowAny,)
+
+    def get(self, request):
+        response = Response(key_ring.get_jwks())
+        patch_cache_control(response, public=True, max_age=settings.JWKS_MAX_AGE)
+        return response
+
+
+class TokenIntrospectionView(GenericAPIView):
+    serializer_class = TokenIntrospectionSerializer
+    permission_classes = (HasAPIKey | IsAdminUser,)
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = introspect_tokens(serializer.validated_data["tokens"])
+        return Response({"results": results})
+
+
+class TokenRevocationView(GenericAPIView):
+    """
+    Revokes an access or refresh token of the authenticated user, or of any
+    user for staff.
+    """
+
+    serializer_class = TokenRevocationSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response({"message": "Token revoked."}, status=status.HTTP_200_OK)
+
+
+@functools.cache
+def get_schema_view():
+    from rest_framework_swagger.views import get_swagger_view
+
+    return get_swagger_view(title="API Playground")
+
+
+def schema_view(request, *args, **kwargs):
+    """
+    Serves the swagger playground, building it on the first request.
+    """
+    return get_schema_view()(request, *args, **kwargs)
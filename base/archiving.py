@@ -0,0 +1,202 @@
+import logging
+import time
+
+from django.apps import apps
+from django.core import serializers
+from django.db import transaction
+
+from base.metrics import ARCHIVE_BATCH_SECONDS, ARCHIVED_ROWS, observe
+
+logger = logging.getLogger(__name__)
+
+# Columns every `ArchiveModel` fills from the archived row.
+ARCHIVE_FIELDS = {"id", "data", "metadata", "created_at", "archived_at"}
+
+
+class ArchiveConflict(Exception):
+    """
+    Archived rows cannot be restored because live rows took their unique values.
+    `conflicts` maps model labels to `{field name: [values]}`.
+    """
+
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        super().__init__(
+            "; ".join(
+                f"{label}.{name}: {', '.join(map(str, values))}"
+                for label, fields in conflicts.items()
+                for name, values in fields.items()
+            )
+        )
+
+
+def archivable_models():
+    return [
+        model for model in apps.get_models() if getattr(model, "archive_model", None)
+    ]
+
+
+def get_archive_model(model):
+    return apps.get_model(model.archive_model)
+
+
+def related_archives(model):
+    """
+    Yields `(related model, foreign key attname)` for the model's `archive_related`.
+    """
+    for accessor in model.archive_related:
+        relation = model._meta.get_field(accessor)
+        yield relation.related_model, relation.field.attname
+
+
+def move_to_archive(model, ids):
+    """
+    Copies the rows with `ids` and their `archive_related` rows to their archive
+    tables, then deletes them from the hot tables. Returns the rows moved.
+
+    Must run inside a transaction. Deleting a row cascades as usual to related
+    rows that are not archivable.
+    """
+    moved = 0
+    for related_model, attname in related_archives(model):
+        related_ids = list(
+            related_model._base_manager.filter(**{f"{attname}__in": ids}).values_list(
+                "pk", flat=True
+            )
+        )
+        moved += move_to_archive(related_model, related_ids)
+
+    archive = get_archive_model(model)
+    # Columns an archive adds, e.g. the foreign key its parent is restored by.
+    copied = [
+        field.attname
+        for field in archive._meta.concrete_fields
+        if field.attname not in ARCHIVE_FIELDS
+    ]
+    rows = list(model._base_manager.filter(pk__in=ids))
+    records = []
+    for row, serialized in zip(rows, serializers.serialize("python", rows)):
+        data = serialized["fields"]
+        records.append(
+            archive(
+                id=row.pk,
+                data={
+                    name: value for name, value in data.items() if name != "metadata"
+                },
+                metadata=row.metadata,
+                created_at=row.created_at,
+                **{name: getattr(row, name) for name in copied},
+            )
+        )
+    archive._default_manager.bulk_create(records)
+    model._base_manager.filter(pk__in=[row.pk for row in rows]).delete()
+    return moved + len(rows)
+
+
+def archive_pending(model, batch_size=500, sleep=0.0, max_batches=None):
+    """
+    Moves the rows flagged as archived to the archive table `batch_size` at a
+    time, each batch in its own transaction. Yields the rows moved per batch.
+    """
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with observe(ARCHIVE_BATCH_SECONDS, model=model._meta.label):
+            with transaction.atomic():
+                ids = list(
+                    model._default_manager.archived()
+                    .order_by("pk")
+                    .values_list("pk", flat=True)[:batch_size]
+                )
+                if not ids:
+                    return
+                moved = move_to_archive(model, ids)
+        ARCHIVED_ROWS.labels(model=model._meta.label, action="archive").inc(moved)
+        logger.info(f"Archived {moved} rows from {len(ids)} {model._meta.label}")
+        yield moved
+        batches += 1
+        if sleep:
+            time.sleep(sleep)
+
+
+def archived_related_ids(model, ids):
+    """
+    Yields `(related model, archived ids)` for the archived `archive_related`
+    rows of the archived rows with `ids`.
+    """
+    for related_model, attname in related_archives(model):
+        related_ids = list(
+            get_archive_model(related_model)
+            ._default_manager.filter(**{f"{attname}__in": ids})
+            .values_list("pk", flat=True)
+        )
+        yield related_model, related_ids
+
+
+def restore_conflicts(model, ids):
+    """
+    Returns the unique values of the archived rows with `ids`, and of their
+    `archive_related` rows, that live rows took since they were archived.
+    """
+    records = list(get_archive_model(model)._default_manager.filter(pk__in=ids))
+    conflicts = {}
+    for field in model._meta.concrete_fields:
+        if not field.unique or field.primary_key:
+            continue
+        values = [
+            record.data[field.name]
+            for record in records
+            if record.data.get(field.name) is not None
+        ]
+        taken = {
+            str(value)
+            for value in model._base_manager.filter(
+                **{f"{field.attname}__in": values}
+            ).values_list(field.attname, flat=True)
+        }
+        if taken:
+            conflicts.setdefault(model._meta.label, {})[field.name] = [
+                value for value in values if str(value) in taken
+            ]
+    for related_model, related_ids in archived_related_ids(model, ids):
+        conflicts.update(restore_conflicts(related_model, related_ids))
+    return conflicts
+
+
+def restore_from_archive(model, ids):
+    """
+    Moves archived rows with `ids`, and their `archive_related` rows, back to
+    the hot tables as live rows. Returns the rows restored.
+
+    Raises `ArchiveConflict`, restoring nothing, when live rows took any of
+    their unique values since they were archived.
+    """
+    with transaction.atomic():
+        conflicts = restore_conflicts(model, ids)
+        if conflicts:
+            raise ArchiveConflict(conflicts)
+        return restore_rows(model, ids)
+
+
+def restore_rows(model, ids):
+    archive = get_archive_model(model)
+    records = list(archive._default_manager.filter(pk__in=ids))
+    serialized = [
+        {
+            "model": model._meta.label_lower,
+            "pk": str(record.pk),
+            "fields": {
+                **record.data,
+                "metadata": record.metadata,
+                "is_archived": False,
+            },
+        }
+        for record in records
+    ]
+    for deserialized in serializers.deserialize("python", serialized):
+        deserialized.save()
+    restored = len(records)
+    for related_model, related_ids in archived_related_ids(model, ids):
+        restored += restore_rows(related_model, related_ids)
+    archive._default_manager.filter(pk__in=[record.pk for record in records]).delete()
+    ARCHIVED_ROWS.labels(model=model._meta.label, action="restore").inc(len(records))
+    return restored
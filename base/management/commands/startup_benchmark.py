@@ -0,0 +1,114 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Boots the project the way a gunicorn worker does, up to serving its first
+# request, then reports how long that took and the resident memory it needs.
+BOOT_SCRIPT = """
+import json, resource, sys, time
+started = time.perf_counter()
+from django.utils.module_loading import import_string
+import_string({application!r})
+from django.urls import get_resolver
+get_resolver().url_patterns
+elapsed = time.perf_counter() - started
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform != "darwin":
+    rss *= 1024
+try:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                rss = int(line.split()[1]) * 1024
+except OSError:
+    pass
+print(json.dumps({{"seconds": elapsed, "rss": rss}}))
+"""
+
+
+def parse_import_times(output):
+    """
+    Returns `(module, self_us, cumulative_us)` for each `-X importtime` line.
+    """
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, module = line[len("import time:") :].split("|")
+        if not self_us.strip().isdigit():
+            continue
+        yield module.strip(), int(self_us), int(cumulative_us)
+
+
+class Command(BaseCommand):
+    help = (
+        "Boots the WSGI application in a fresh interpreter and reports import "
+        "time per module and the resident memory after boot."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=25,
+            help="Number of modules to list.",
+        )
+        parser.add_argument(
+            "--sort",
+            choices=["self", "cumulative"],
+            default="cumulative",
+            help="Rank modules by their own import time or including dependencies.",
+        )
+        parser.add_argument(
+            "--packages",
+            action="store_true",
+            help="Sum import time per top-level package instead of per module.",
+        )
+        parser.add_argument(
+            "--application",
+            default=settings.WSGI_APPLICATION,
+            help="Dotted path of the application to boot.",
+        )
+
+    def handle(self, *args, **options):
+        script = BOOT_SCRIPT.format(application=options["application"])
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", script],
+            capture_output=True,
+            text=True,
+            env={**os.environ, "DJANGO_SETTINGS_MODULE": settings.SETTINGS_MODULE},
+        )
+        if result.returncode:
+            raise CommandError(result.stderr.strip().splitlines()[-1])
+        boot = json.loads(result.stdout.strip().splitlines()[-1])
+        times = list(parse_import_times(result.stderr))
+
+        if options["packages"]:
+            totals = defaultdict(int)
+            for module, self_us, _ in times:
+                totals[module.split(".")[0]] += self_us
+            rows = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+            header = f"{'self ms':>10}  package"
+            lines = [f"{us / 1000:>10.1f}  {name}" for name, us in rows]
+        else:
+            column = 1 if options["sort"] == "self" else 2
+            rows = sorted(times, key=lambda row: row[column], reverse=True)
+            header = f"{'self ms':>10}  {'cumul. ms':>10}  module"
+            lines = [
+                f"{self_us / 1000:>10.1f}  {cumulative_us / 1000:>10.1f}  {module}"
+                for module, self_us, cumulative_us in rows
+            ]
+
+        self.stdout.write(header)
+        for line in lines[: options["top"]]:
+            self.stdout.write(line)
+        self.stdout.write(
+            f"\nModules imported: {len(times)}"
+            f"\nImport time: {sum(row[1] for row in times) / 1000:.1f} ms"
+            f"\nBoot time: {boot['seconds'] * 1000:.1f} ms"
+            f"\nRSS after boot: {boot['rss'] / 2**20:.1f} MiB"
+        )
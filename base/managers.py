@@ -1,12 +1,32 @@
 from django.db import models
+from django.dispatch import Signal
+from django.utils import timezone
+
+# Sent for every batch flagged by `archive()`, with the model as `sender`, the
+# flagged primary keys as `pks` and the database alias as `using`. update()
+# sends no `post_save`, so receivers caching the rows listen to this instead.
+rows_archived = Signal()
 
 
 class BaseModelQuerySet(models.query.QuerySet):
-    def archive(self):
-        self.update(is_archived=True)
+    def archive(self, batch_size=1000):
+        """
+        Flags the rows as archived `batch_size` at a time and returns the count.
+        The archive job later moves them out of the hot table.
+        """
+        archived = 0
+        pending = self.filter(is_archived=False).order_by()
+        while True:
+            ids = list(pending.values_list("pk", flat=True)[:batch_size])
+            if not ids:
+                return archived
+            archived += self.model._base_manager.filter(pk__in=ids).update(
+                is_archived=True, updated_at=timezone.now()
+            )
+            rows_archived.send(sender=self.model, pks=ids, using=self.db)
 
     def archived(self):
-        self.update(is_archived=True)
+        return self.filter(is_archived=True)
 
     def active(self):
         return self.filter(is_archived=False)
@@ -14,14 +34,17 @@ class BaseModelQuerySet(models.query.QuerySet):
 
 class BaseManager(models.Manager):
     """
-    Manager to enable archiving.
+    Manager hiding archived rows, which stay reachable through `archived()`.
     """
 
-    def get_queryset(self):
+    def get_all_queryset(self):
         return BaseModelQuerySet(self.model, using=self._db)
 
+    def get_queryset(self):
+        return self.get_all_queryset().active()
+
     def active(self):
-        return self.get_query_set().active()
+        return self.get_queryset()
 
     def archived(self):
-        return self.get_query_set().archived()
+        return self.get_all_queryset().archived()
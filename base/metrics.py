@@ -0,0 +1,104 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from celery.signals import after_task_publish, before_task_publish
+from prometheus_client import Counter, Histogram
+
+# Every series is a counter or histogram, both of which prometheus_client
+# aggregates across gunicorn workers when PROMETHEUS_MULTIPROC_DIR is set.
+
+REQUEST_DB_QUERIES = Histogram(
+    "auth_request_db_queries",
+    "Database queries run per request.",
+    ["view"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+REQUEST_DB_SECONDS = Histogram(
+    "auth_request_db_seconds",
+    "Time spent in database queries per request.",
+    ["view"],
+)
+PASSWORD_HASH_SECONDS = Histogram(
+    "auth_password_hash_seconds",
+    "Duration of password hashing.",
+    ["operation"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+PASSWORD_HASH_QUEUE_SECONDS = Histogram(
+    "auth_password_hash_queue_seconds",
+    "Time password hashing waited for an executor slot.",
+)
+PASSWORD_HASH_REJECTED = Counter(
+    "auth_password_hash_rejected",
+    "Password hashing jobs rejected because the executor was saturated.",
+)
+JWT_SECONDS = Histogram(
+    "auth_jwt_seconds",
+    "Duration of JWT signing and verification.",
+    ["operation", "algorithm"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05),
+)
+OTP_SENDS = Counter(
+    "auth_otp_sends",
+    "Security code send attempts.",
+    ["channel", "purpose", "outcome"],
+)
+OTP_VERIFICATIONS = Counter(
+    "auth_otp_verifications",
+    "Security code verification attempts.",
+    ["channel", "purpose", "outcome"],
+)
+PURGED_ROWS = Counter(
+    "auth_purged_rows",
+    "Rows deleted, archived or cleared by the purge jobs.",
+    ["job", "action"],
+)
+PURGE_BATCH_SECONDS = Histogram(
+    "auth_purge_batch_seconds",
+    "Duration of one purge batch, excluding the sleep between batches.",
+    ["job"],
+)
+ARCHIVED_ROWS = Counter(
+    "auth_archived_rows",
+    "Rows moved to or restored from the archive tables.",
+    ["model", "action"],
+)
+ARCHIVE_BATCH_SECONDS = Histogram(
+    "auth_archive_batch_seconds",
+    "Duration of one archive batch, excluding the sleep between batches.",
+    ["model"],
+)
+CELERY_ENQUEUE_SECONDS = Histogram(
+    "auth_celery_enqueue_seconds",
+    "Time taken to publish a task to the broker.",
+    ["task"],
+)
+
+
+@contextmanager
+def observe(histogram, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metric = histogram.labels(**labels) if labels else histogram
+        metric.observe(time.perf_counter() - started)
+
+
+_publish_started = threading.local()
+
+
+@before_task_publish.connect
+def task_publish_started(sender=None, headers=None, **kwargs):
+    _publish_started.value = time.perf_counter()
+
+
+@after_task_publish.connect
+def task_published(sender=None, headers=None, **kwargs):
+    started = getattr(_publish_started, "value", None)
+    if started is not None:
+        CELERY_ENQUEUE_SECONDS.labels(task=sender).observe(
+            time.perf_counter() - started
+        )
+        _publish_started.value = None
@@ -0,0 +1,174 @@
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.decorators import sync_and_async_middleware
+
+from base.metrics import REQUEST_DB_QUERIES, REQUEST_DB_SECONDS
+from base.routers import end_routing, start_routing
+from project.sentry import trace_sampler
+
+
+_request_queries = ContextVar("request_queries", default=None)
+
+
+class QueryMetrics:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every connection, see `base.signals`. Counts
+    the query towards the current request, if any.
+
+    The request is found through a context variable rather than a wrapper
+    entered per request, because under ASGI queries run on another thread's
+    connection than the one the middleware sees.
+    """
+    metrics = _request_queries.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+@sync_and_async_middleware
+class DatabaseMetricsMiddleware:
+    """
+    Records the number and total duration of queries run by every request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = QueryMetrics()
+        token = _request_queries.set(metrics)
+        try:
+            return self.get_response(request)
+        finally:
+            self.observe(request, metrics, token)
+
+    async def __acall__(self, request):
+        metrics = QueryMetrics()
+        token = _request_queries.set(metrics)
+        try:
+            return await self.get_response(request)
+        finally:
+            self.observe(request, metrics, token)
+
+    def observe(self, request, metrics, token):
+        _request_queries.reset(token)
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "<unresolved>"
+        REQUEST_DB_QUERIES.labels(view=view).observe(metrics.count)
+        REQUEST_DB_SECONDS.labels(view=view).observe(metrics.seconds)
+
+
+@sync_and_async_middleware
+class TraceSamplingMiddleware:
+    """
+    Discards the Sentry transaction of requests `trace_sampler` does not keep.
+
+    A discarded transaction is dropped when it finishes, before it is
+    serialized or sent.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SENTRY_DSN:
+            raise MiddlewareNotUsed
+        import sentry_sdk
+
+        self.get_current_scope = sentry_sdk.Scope.get_current_scope
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.sample(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.sample(request, response, started)
+        return response
+
+    def sample(self, request, response, started):
+        transaction = self.get_current_scope().transaction
+        if transaction is not None and transaction.sampled:
+            match = getattr(request, "resolver_match", None)
+            view = match.view_name if match else "<unresolved>"
+            transaction.sampled = trace_sampler.should_keep(
+                view, response.status_code, time.perf_counter() - started
+            )
+
+
+PRIMARY_COOKIE = "db_primary"
+
+
+@sync_and_async_middleware
+class ReplicaPinningMiddleware:
+    """
+    Routes a client's reads to the primary for a while after it writes.
+
+    A request that writes sets a cookie lasting
+    `DATABASE_PRIMARY_STICKY_SECONDS`, and requests carrying it read from the
+    primary, so clients read their own writes despite replication lag.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICA_ALIASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = start_routing(use_primary=PRIMARY_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            end_routing(token)
+        return self.pin(request, response, state)
+
+    async def __acall__(self, request):
+        state, token = start_routing(use_primary=PRIMARY_COOKIE in request.COOKIES)
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_routing(token)
+        return self.pin(request, response, state)
+
+    def pin(self, request, response, state):
+        if state.wrote:
+            response.set_cookie(
+                PRIMARY_COOKIE,
+                "1",
+                max_age=settings.DATABASE_PRIMARY_STICKY_SECONDS,
+                secure=request.is_secure(),
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
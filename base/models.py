@@ -3,6 +3,7 @@ import logging
 import uuid
 
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.utils import timezone
 from timestampedmodel import TimestampedModel
@@ -10,35 +11,95 @@ from django.utils.translation import gettext_lazy as _
 from rest_framework.exceptions import NotAcceptable
 
 from base.managers import BaseManager
+from base.metrics import OTP_VERIFICATIONS
+from base.otp_store import RESET, VERIFY, get_otp_store
 
 
 logger = logging.getLogger(__name__)
 
 
 class BaseModel(TimestampedModel):
-    id = models.UUIDField(
-        primary_key=True, editable=False, default=uuid.uuid4, db_index=True
-    )
+    id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
     is_archived = models.BooleanField(default=False)
     metadata = models.JSONField(default=dict, null=True, blank=True)
 
     objects = BaseManager()
 
+    # "app_label.Model" of the `ArchiveModel` archived rows are moved to.
+    archive_model = None
+    # Reverse one-to-one accessors whose rows are archived along with the row.
+    archive_related = ()
+
     class Meta:
         abstract = True
         ordering = ("-updated_at", "-created_at")
         get_latest_by = ("updated_at",)
 
 
+class ArchiveModel(models.Model):
+    """
+    Cold-storage copy of an archived `BaseModel` row, keyed by its original id.
+    `data` holds the row's serialized fields and `metadata` its JSON metadata.
+    """
+
+    id = models.UUIDField(primary_key=True, editable=False)
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    metadata = models.JSONField(
+        default=dict, null=True, blank=True, encoder=DjangoJSONEncoder
+    )
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        abstract = True
+        ordering = ("-archived_at",)
+
+
 class VerificationModel(models.Model):
     security_code = models.CharField(max_length=20)
     is_verified = models.BooleanField(default=False)
     is_password_reset = models.BooleanField(default=False)
     sent_date = models.DateTimeField(null=True, blank=True, auto_now_add=True)
+    otp_attempts = models.PositiveSmallIntegerField(default=0)
+
+    # Label of the channel in metrics.
+    channel_type = None
+    # Fields whose database value is remembered to detect transitions.
+    tracked_fields = ("is_verified",)
 
     class Meta:
         abstract = True
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: value
+            for name, value in zip(field_names, values)
+            if name in cls.tracked_fields
+        }
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        self._loaded_values = {
+            **getattr(self, "_loaded_values", {}),
+            **{
+                name: getattr(self, name)
+                for name in self.tracked_fields
+                if update_fields is None or name in update_fields
+            },
+        }
+
+    def is_newly_verified(self):
+        """
+        True when `is_verified` turned on since the row was loaded or saved.
+        Only valid until `save()` returns, e.g. inside post_save receivers.
+        """
+        loaded_values = getattr(self, "_loaded_values", {})
+        return self.is_verified and not loaded_values.get("is_verified", False)
+
     def is_security_code_expired(self):
         try:
             expiration_date = self.sent_date + datetime.timedelta(
@@ -52,16 +113,24 @@ class VerificationModel(models.Model):
     def send_confirmation_code(self):
         ...
 
+    def issue_security_code(self, security_code, reset_password=False):
+        purpose = RESET if reset_password else VERIFY
+        get_otp_store().issue(self, purpose, security_code)
+
     def check_verification(self, security_code, reset_password=False):
-        if (
-            not self.is_security_code_expired()
-            and security_code == self.security_code
-            and (not self.is_verified or all([reset_password, self.is_password_reset]))
-        ):
-            self.is_verified = True
-            if reset_password:
-                self.is_password_reset = False
-            self.save()
+        purpose = RESET if reset_password else VERIFY
+        verified = (not self.is_verified or reset_password) and get_otp_store().verify(
+            self, purpose, security_code
+        )
+        OTP_VERIFICATIONS.labels(
+            channel=self.channel_type,
+            purpose=purpose,
+            outcome="success" if verified else "failure",
+        ).inc()
+        if verified:
+            if not self.is_verified:
+                self.is_verified = True
+                self.save(update_fields=["is_verified", "updated_at"])
         else:
             raise NotAcceptable(
                 _(
@@ -0,0 +1,151 @@
+import datetime
+import logging
+import time
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from base.redis import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+VERIFY = "verify"
+RESET = "reset"
+
+
+class BaseOTPStore:
+    """
+    Keeps the security codes sent to a `VerificationModel` channel.
+    Codes expire after `TOKEN_EXPIRE_MINUTES` and are invalidated after
+    `OTP_MAX_ATTEMPTS` wrong guesses.
+    """
+
+    @property
+    def ttl(self):
+        return datetime.timedelta(minutes=settings.TOKEN_EXPIRE_MINUTES)
+
+    def issue(self, channel, purpose, code):
+        raise NotImplementedError(".issue() must be overridden")
+
+    def verify(self, channel, purpose, code):
+        """
+        Consumes the code and returns True when it matches, False otherwise.
+        """
+        raise NotImplementedError(".verify() must be overridden")
+
+
+class DatabaseOTPStore(BaseOTPStore):
+    """
+    Keeps the code on the channel row with conditional updates instead of full saves.
+    """
+
+    def issue(self, channel, purpose, code):
+        now = timezone.now()
+        values = {
+            "security_code": code,
+            "sent_date": now,
+            "is_password_reset": purpose == RESET,
+            "otp_attempts": 0,
+        }
+        # A channel not saved yet gets the code written by its own INSERT.
+        if not channel._state.adding:
+            type(channel).objects.filter(pk=channel.pk).update(**values)
+        for field, value in values.items():
+            setattr(channel, field, value)
+
+    def verify(self, channel, purpose, code):
+        if not code:
+            return False
+        queryset = type(channel).objects.filter(pk=channel.pk)
+        matched = queryset.filter(
+            security_code=code,
+            sent_date__gt=timezone.now() - self.ttl,
+            otp_attempts__lt=settings.OTP_MAX_ATTEMPTS,
+            is_password_reset=purpose == RESET,
+        ).update(security_code="", is_password_reset=False)
+        if not matched:
+            queryset.update(otp_attempts=F("otp_attempts") + 1)
+        return bool(matched)
+
+
+class RedisOTPStore(BaseOTPStore):
+    """
+    Keeps codes in Redis hashes that expire through the key TTL, so sending
+    and verifying codes never writes to the channel tables.
+    """
+
+    # Returns 1 and deletes the key on a match, deletes it once the attempt
+    # budget is spent and returns 0 otherwise.
+    VERIFY_SCRIPT = """
+    local code = redis.call("HGET", KEYS[1], "code")
+    if not code then
+        return 0
+    end
+    if code == ARGV[1] then
+        redis.call("DEL", KEYS[1])
+        return 1
+    end
+    if redis.call("HINCRBY", KEYS[1], "attempts", 1) >= tonumber(ARGV[2]) then
+        redis.call("DEL", KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self):
+        self.client = get_redis_client()
+        self.verify_script = self.client.register_script(self.VERIFY_SCRIPT)
+
+    def get_key(self, channel, purpose):
+        return f"otp:{channel._meta.model_name}:{channel.pk}:{purpose}"
+
+    def issue(self, channel, purpose, code):
+        key = self.get_key(channel, purpose)
+        pipeline = self.client.pipeline(transaction=True)
+        pipeline.delete(key)
+        pipeline.hset(key, mapping={"code": code, "attempts": 0})
+        pipeline.expire(key, self.ttl)
+        pipeline.execute()
+
+    def verify(self, channel, purpose, code):
+        if not code:
+            return False
+        result = self.verify_script(
+            keys=[self.get_key(channel, purpose)],
+            args=[code, settings.OTP_MAX_ATTEMPTS],
+        )
+        return result == 1
+
+
+@lru_cache(maxsize=None)
+def get_otp_store():
+    return import_string(settings.OTP_STORE)()
+
+
+def acquire_send_slot(purpose, address):
+    """
+    Reserves the one code send allowed per address and purpose every
+    `OTP_RESEND_COOLDOWN` seconds, in Redis so every web and Celery worker
+    shares it. Returns 0 when reserved, otherwise the seconds left until the
+    next send is allowed. Redis errors fail open.
+    """
+    key = f"otp-cooldown:{purpose}:{address}"
+    client = get_redis_client()
+    try:
+        if client.set(key, 1, nx=True, ex=settings.OTP_RESEND_COOLDOWN):
+            return 0
+        return max(client.ttl(key), 1)
+    except redis.RedisError as e:
+        logger.warning(f"OTP cooldown skipped, redis unavailable: {e}")
+        return 0
+
+
+def get_send_window():
+    """
+    Index of the current `OTP_RESEND_COOLDOWN` window. At most one send per
+    address and purpose is reserved in a window, so it identifies the send.
+    """
+    return int(time.time()) // max(settings.OTP_RESEND_COOLDOWN, 1)
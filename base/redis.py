@@ -0,0 +1,16 @@
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+
+
+@lru_cache(maxsize=None)
+def get_redis_client(url=None):
+    """
+    Returns a process-wide Redis client for `url`, defaulting to `REDIS_URL`.
+    """
+    return redis.Redis.from_url(
+        url or settings.REDIS_URL,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+    )
@@ -0,0 +1,115 @@
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+
+class RoutingState:
+    """
+    Whether the current request reads from the primary, and whether it wrote.
+    """
+
+    def __init__(self, use_primary=False):
+        self.use_primary = use_primary
+        self.wrote = False
+
+
+_routing_state = ContextVar("routing_state", default=None)
+
+
+def start_routing(use_primary=False):
+    """
+    Starts a routing scope, returning its state and a token to end it with.
+    """
+    state = RoutingState(use_primary)
+    return state, _routing_state.set(state)
+
+
+def end_routing(token):
+    _routing_state.reset(token)
+
+
+class ReplicaHealth:
+    """
+    Per-process record of which replicas answered their last health check.
+
+    Each replica is checked with `SELECT 1` at most once every
+    `DATABASE_REPLICA_HEALTH_CHECK_SECONDS`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checks = {}
+
+    def check(self, alias):
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute("SELECT 1")
+        except DatabaseError as exc:
+            logger.warning(f"Replica {alias} failed its health check: {exc}")
+            return False
+        return True
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        with self._lock:
+            checked_at, healthy = self._checks.get(alias, (None, True))
+            if (
+                checked_at is not None
+                and now - checked_at < settings.DATABASE_REPLICA_HEALTH_CHECK_SECONDS
+            ):
+                return healthy
+            # Marked as checked first so concurrent callers do not check too.
+            self._checks[alias] = (now, healthy)
+        healthy = self.check(alias)
+        with self._lock:
+            self._checks[alias] = (now, healthy)
+        return healthy
+
+
+replica_health = ReplicaHealth()
+
+
+class ReplicaRouter:
+    """
+    Sends reads to a healthy replica and writes to the primary.
+
+    Reads go to the primary instead once the current request or task has
+    written, while the primary is inside a transaction, when the request
+    arrived pinned by `ReplicaPinningMiddleware`, or when no replica is
+    healthy.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _routing_state.get()
+        if state is not None and (state.use_primary or state.wrote):
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = [
+            alias
+            for alias in settings.DATABASE_REPLICA_ALIASES
+            if replica_health.is_healthy(alias)
+        ]
+        if not replicas:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _routing_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICA_ALIASES
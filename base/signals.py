@@ -0,0 +1,28 @@
+from celery.signals import task_postrun, task_prerun
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from base.middleware import record_query
+from base.routers import end_routing, start_routing
+
+_routing_tokens = {}
+
+
+@task_prerun.connect
+def task_routing_started(task_id=None, **kwargs):
+    # Tasks read their own writes the same way requests do.
+    _routing_tokens[task_id] = start_routing()[1]
+
+
+@task_postrun.connect
+def task_routing_ended(task_id=None, **kwargs):
+    token = _routing_tokens.pop(task_id, None)
+    if token is not None:
+        end_routing(token)
+
+
+@receiver(connection_created)
+def query_metrics_installed(sender, connection, **kwargs):
+    # Connections are reopened on the same wrapper, keep a single wrapper.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
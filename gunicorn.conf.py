@@ -0,0 +1,24 @@
+"""
+Gunicorn hooks, loaded automatically from the working directory.
+
+With PROMETHEUS_MULTIPROC_DIR set every worker writes its metrics to that
+directory and /metrics aggregates them across workers.
+"""
+
+import os
+import shutil
+
+
+def on_starting(server):
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        # Samples left by a previous run would be aggregated otherwise.
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
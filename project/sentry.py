@@ -0,0 +1,88 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+
+
+def init_sentry(dsn, **options):
+    """
+    Starts Sentry with the integrations this service uses.
+
+    Nothing is imported when no DSN is configured. Integrations are listed
+    explicitly instead of auto-enabled, so boot does not import every library
+    Sentry knows how to instrument just to probe for it.
+
+    Every request is recorded; `TraceSamplingMiddleware` then discards the
+    transactions `trace_sampler` does not keep before they are serialized.
+    """
+    if not dsn:
+        return
+    import sentry_sdk
+    from sentry_sdk.integrations.celery import CeleryIntegration
+    from sentry_sdk.integrations.django import DjangoIntegration
+    from sentry_sdk.integrations.redis import RedisIntegration
+
+    sentry_sdk.init(
+        dsn=dsn,
+        integrations=[DjangoIntegration(), CeleryIntegration(), RedisIntegration()],
+        auto_enabling_integrations=False,
+        traces_sample_rate=1.0,
+        send_default_pii=True,
+        **options,
+    )
+
+
+class TraceSampler:
+    """
+    Decides, once a request has finished, whether its trace is sent.
+
+    Server errors and requests slower than `SENTRY_TRACES_SLOW_SECONDS` are
+    always kept. Other requests are kept at the rate configured for their URL
+    name in `SENTRY_TRACES_SAMPLE_RATES`, scaled down so this process sends at
+    most `SENTRY_TRACES_PER_SECOND` traces. The scale is recomputed every
+    `window` seconds from the traffic seen during the previous window.
+    """
+
+    window = 10
+
+    def __init__(self, clock=time.monotonic, random=random.random):
+        self.clock = clock
+        self.random = random
+        self.scale = 1.0
+        self._lock = threading.Lock()
+        self._window_started = clock()
+        self._forced = 0
+        self._expected = 0.0
+
+    def rate(self, view_name):
+        return settings.SENTRY_TRACES_SAMPLE_RATES.get(
+            view_name, settings.SENTRY_TRACES_DEFAULT_SAMPLE_RATE
+        )
+
+    def adjust(self):
+        elapsed = self.clock() - self._window_started
+        if elapsed < self.window:
+            return
+        budget = settings.SENTRY_TRACES_PER_SECOND * elapsed - self._forced
+        if self._expected:
+            self.scale = min(1.0, max(0.0, budget) / self._expected)
+        else:
+            self.scale = 1.0
+        self._window_started += elapsed
+        self._forced = 0
+        self._expected = 0.0
+
+    def should_keep(self, view_name, status_code, duration):
+        with self._lock:
+            self.adjust()
+            if status_code >= 500 or duration >= settings.SENTRY_TRACES_SLOW_SECONDS:
+                self._forced += 1
+                return True
+            rate = self.rate(view_name)
+            # Traces this request would have sent at full scale.
+            self._expected += rate
+            return self.random() < rate * self.scale
+
+
+trace_sampler = TraceSampler()
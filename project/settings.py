@@ -12,14 +12,15 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 import datetime
 import os
+import sys
 from pathlib import Path
 import django
-import sentry_sdk
-from decouple import config
-from sentry_sdk.integrations.django import DjangoIntegration
+from decouple import Csv, config
 
 from django.utils.translation import gettext
 
+from project.sentry import init_sentry
+
 django.utils.translation.ugettext = gettext
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -54,6 +55,7 @@ INSTALLED_APPS = [
     "rest_framework",
     "rest_framework_api_key",
     "oauth2_provider",
+    "django_prometheus",
     # Custom Apps
     "api",
     "base",
@@ -61,6 +63,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "django_prometheus.middleware.PrometheusBeforeMiddleware",
+    "base.middleware.TraceSamplingMiddleware",
+    "base.middleware.ReplicaPinningMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -69,6 +74,8 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     # "simple_history.middleware.HistoryRequestMiddleware",
+    "base.middleware.DatabaseMetricsMiddleware",
+    "django_prometheus.middleware.PrometheusAfterMiddleware",
 ]
 
 ROOT_URLCONF = "project.urls"
@@ -96,15 +103,50 @@ WSGI_APPLICATION = "project.wsgi.application"
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "ENGINE": config("DATABASE_ENGINE", default="django.db.backends.sqlite3"),
+        "NAME": config("DATABASE_NAME", default=str(BASE_DIR / "db.sqlite3")),
+        "USER": config("DATABASE_USER", default=""),
+        "PASSWORD": config("DATABASE_PASSWORD", default=""),
+        "HOST": config("DATABASE_HOST", default=""),
+        "PORT": config("DATABASE_PORT", default=""),
+        # Persistent connections, checked before reuse by each request. Leave
+        # at 0 under gevent workers, where every greenlet opens its own.
+        "CONN_MAX_AGE": config("DATABASE_CONN_MAX_AGE", default=0, cast=int),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# Read replicas of the primary, given as hosts or, for SQLite, as database
+# files. Each becomes a `replicaN` alias served reads by base.routers.
+DATABASE_REPLICA_ALIASES = []
+for index, replica in enumerate(config("DATABASE_REPLICAS", default="", cast=Csv())):
+    alias = f"replica{index + 1}"
+    location = "NAME" if "sqlite" in DATABASES["default"]["ENGINE"] else "HOST"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        location: replica,
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICA_ALIASES.append(alias)
+# Routing tests read through a real second connection to the test database.
+# Reads only reach it when a test lists it in DATABASE_REPLICA_ALIASES.
+if sys.argv[1:2] == ["test"]:
+    DATABASES["replica"] = {**DATABASES["default"], "TEST": {"MIRROR": "default"}}
+
+DATABASE_ROUTERS = ["base.routers.ReplicaRouter"]
+# Reads stay on the primary this long after a client writes.
+DATABASE_PRIMARY_STICKY_SECONDS = config(
+    "DATABASE_PRIMARY_STICKY_SECONDS", default=5, cast=int
+)
+# Replicas failing `SELECT 1` are skipped until checked again this much later.
+DATABASE_REPLICA_HEALTH_CHECK_SECONDS = config(
+    "DATABASE_REPLICA_HEALTH_CHECK_SECONDS", default=10, cast=int
+)
+
 # Rest Framework
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "accounts.authentication.ClaimsJWTAuthentication",
         # "rest_framework_jwt.authentication.JSONWebTokenAuthentication",
         "rest_framework.authentication.SessionAuthentication",
         "rest_framework.authentication.BasicAuthentication",
@@ -119,8 +161,47 @@ REST_FRAMEWORK = {
     ],
     "DEFAULT_VERSIONING_CLASS": "rest_framework.versioning.AcceptHeaderVersioning",
     "DEFAULT_VERSION": "v1",
+    # Sliding windows of accounts.throttling, keyed "<throttle_scope>_<kind>".
+    "DEFAULT_THROTTLE_RATES": {
+        "login_ip": config("THROTTLE_LOGIN_IP", default="30/min"),
+        "login_username": config("THROTTLE_LOGIN_USERNAME", default="10/min"),
+        "otp_generate_ip": config("THROTTLE_OTP_GENERATE_IP", default="20/hour"),
+        "otp_generate_phone_number": "5/hour",
+        "otp_generate_email": "5/hour",
+        "otp_verify_ip": config("THROTTLE_OTP_VERIFY_IP", default="30/min"),
+        "otp_verify_phone_number": "10/min",
+        "otp_verify_email": "10/min",
+        "password_reset_ip": "10/hour",
+        "password_reset_phone_number": "5/hour",
+        "password_reset_email": "5/hour",
+        "password_reset_confirm_ip": "30/min",
+        "password_reset_confirm_phone_number": "10/min",
+        "password_reset_confirm_email": "10/min",
+    },
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+# Redis used for caching, throttling and other shared counters
+REDIS_URL = config("REDIS_URL", default="redis://localhost:6379/0")
+REDIS_SOCKET_TIMEOUT = config("REDIS_SOCKET_TIMEOUT", default=0.5, cast=float)
+
+# The default cache holds OAuth state, OIDC documents and user snapshots, so it
+# must be shared by every web and Celery worker; a per-process cache such as
+# LocMemCache only fits a single-process development server.
+CACHES = {
+    "default": {
+        "BACKEND": config(
+            "CACHE_BACKEND", default="django.core.cache.backends.redis.RedisCache"
+        ),
+        "LOCATION": config("CACHE_LOCATION", default=REDIS_URL),
+    }
+}
+# The test suite runs without a Redis server, Redis itself is faked per test.
+if sys.argv[1:2] == ["test"]:
+    CACHES["default"] = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -139,6 +220,15 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing process pool, 0 workers hashes inline in the web worker.
+PASSWORD_HASHING_WORKERS = config("PASSWORD_HASHING_WORKERS", default=0, cast=int)
+PASSWORD_HASHING_MAX_PENDING = config(
+    "PASSWORD_HASHING_MAX_PENDING", default=32, cast=int
+)
+PASSWORD_HASHING_QUEUE_TIMEOUT = config(
+    "PASSWORD_HASHING_QUEUE_TIMEOUT", default=5.0, cast=float
+)
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
 
@@ -169,17 +259,57 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": datetime.timedelta(days=1),
     "REFRESH_TOKEN_LIFETIME": datetime.timedelta(days=2),
-    "ROTATE_REFRESH_TOKENS": False,
-    "BLACKLIST_AFTER_ROTATION": True,
-    "ALGORITHM": "HS256",
+    # Rotated within refresh token families, see accounts.token_families. A reused
+    # token revokes its family, so rotated tokens need no blacklist entry. Families
+    # keep their first expiry, so REFRESH_TOKEN_LIFETIME caps a whole session.
+    "ROTATE_REFRESH_TOKENS": True,
+    "BLACKLIST_AFTER_ROTATION": False,
+    # RS256/ES256 sign with the rotating `SigningKey` ring, see accounts.jwks.
+    "ALGORITHM": config("JWT_ALGORITHM", default="HS256"),
     "SIGNING_KEY": SECRET_KEY,
     "VERIFYING_KEY": None,
     "AUTH_HEADER_TYPES": ("Bearer",),
     "USER_ID_FIELD": "id",
     "USER_ID_CLAIM": "user_id",
-    "AUTH_TOKEN_CLASSES": ("rest_framework_simplejwt.tokens.AccessToken",),
+    "AUTH_TOKEN_CLASSES": ("accounts.custom_jwt.CustomAccessToken",),
+    # Revocation replaces the token_blacklist app, see accounts.revocation.
+    "TOKEN_REFRESH_SERIALIZER": "accounts.serializers.TokenRefreshSerializer",
 }
 
+# Seconds between signing key reloads and the JWKS document Cache-Control max-age.
+# A rotated key signs tokens only once both have passed since its creation.
+JWT_KEY_RING_REFRESH_SECONDS = config(
+    "JWT_KEY_RING_REFRESH_SECONDS", default=60, cast=int
+)
+JWKS_MAX_AGE = config("JWKS_MAX_AGE", default=300, cast=int)
+
+# Revoked token ids are synced into each worker's Bloom filter every
+# TOKEN_REVOCATION_SYNC_SECONDS, bounding how long a revoked token stays usable.
+TOKEN_REVOCATION_SYNC_SECONDS = config(
+    "TOKEN_REVOCATION_SYNC_SECONDS", default=5, cast=int
+)
+TOKEN_REVOCATION_REBUILD_SECONDS = config(
+    "TOKEN_REVOCATION_REBUILD_SECONDS", default=3600, cast=int
+)
+TOKEN_REVOCATION_BLOOM_CAPACITY = config(
+    "TOKEN_REVOCATION_BLOOM_CAPACITY", default=100000, cast=int
+)
+TOKEN_REVOCATION_BLOOM_ERROR_RATE = config(
+    "TOKEN_REVOCATION_BLOOM_ERROR_RATE", default=0.001, cast=float
+)
+
+# Maximum number of tokens accepted by one bulk introspection request.
+TOKEN_INTROSPECTION_MAX_TOKENS = config(
+    "TOKEN_INTROSPECTION_MAX_TOKENS", default=500, cast=int
+)
+
+# Cache alias holding user snapshots for ClaimsJWTAuthentication. It must be shared
+# by every worker so saves invalidate it everywhere. When empty, requests trust
+# the token claims and a deactivated user keeps access until the access token
+# expires, so keep ACCESS_TOKEN_LIFETIME short in that case.
+AUTH_USER_SNAPSHOT_CACHE = config("AUTH_USER_SNAPSHOT_CACHE", default="default")
+AUTH_USER_SNAPSHOT_TIMEOUT = config("AUTH_USER_SNAPSHOT_TIMEOUT", default=300, cast=int)
+
 
 # Logger settings
 LOGGING = {
@@ -214,6 +344,8 @@ LOGGING = {
 
 AUTH_USER_MODEL = "accounts.User"
 
+AUTHENTICATION_BACKENDS = ["accounts.backends.AccountBackend"]
+
 # Cors settings
 CORS_ORIGIN_ALLOW_ALL = True
 
@@ -221,6 +353,12 @@ TOKEN_EXPIRE_MINUTES = config("TOKEN_EXPIRE_MINUTES", default=3, cast=int)
 
 TOKEN_LENGTH = 6
 
+# Where security codes live: base.otp_store.RedisOTPStore or DatabaseOTPStore
+OTP_STORE = config("OTP_STORE", default="base.otp_store.DatabaseOTPStore")
+OTP_MAX_ATTEMPTS = config("OTP_MAX_ATTEMPTS", default=5, cast=int)
+# Seconds before another code can be sent to the same phone number or email
+OTP_RESEND_COOLDOWN = config("OTP_RESEND_COOLDOWN", default=60, cast=int)
+
 # Celery Settings
 CELERY_BROKER_URL = config("CELERY_BROKER_URL")
 CELERY_RESULT_BACKEND = config("CELERY_RESULT_BACKEND")
@@ -228,15 +366,110 @@ CELERY_TIMEZONE = "Africa/Nairobi"
 CELERY_ACCEPT_CONTENT = ["application/json"]
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TASK_SERIALIZER = "json"
+# Seconds a login waits on the broker to enqueue its last_login update.
+LAST_LOGIN_PUBLISH_TIMEOUT = config(
+    "LAST_LOGIN_PUBLISH_TIMEOUT", default=0.5, cast=float
+)
+CELERY_BEAT_SCHEDULE = {
+    "purge-token-families": {
+        "task": "accounts.tasks.purge_token_families_task",
+        "schedule": datetime.timedelta(hours=1),
+    },
+    "purge-revoked-tokens": {
+        "task": "accounts.tasks.purge_revoked_tokens_task",
+        "schedule": datetime.timedelta(hours=1),
+    },
+    "purge-stale-accounts": {
+        "task": "accounts.tasks.purge_stale_accounts_task",
+        "schedule": datetime.timedelta(days=1),
+    },
+    "archive-rows": {
+        "task": "accounts.tasks.archive_rows_task",
+        "schedule": datetime.timedelta(hours=1),
+    },
+    "refresh-oidc-documents": {
+        "task": "accounts.tasks.refresh_oidc_documents_task",
+        "schedule": datetime.timedelta(
+            seconds=config("OIDC_CACHE_REFRESH_SECONDS", default=3600, cast=int)
+        ),
+    },
+}
+
+# Expired refresh token families are deleted in batches of this size.
+TOKEN_FAMILY_PURGE_BATCH_SIZE = config(
+    "TOKEN_FAMILY_PURGE_BATCH_SIZE", default=5000, cast=int
+)
+TOKEN_FAMILY_PURGE_MAX_BATCHES = config(
+    "TOKEN_FAMILY_PURGE_MAX_BATCHES", default=200, cast=int
+)
+
+# Revocations of expired tokens are deleted in batches of this size.
+TOKEN_REVOCATION_PURGE_BATCH_SIZE = config(
+    "TOKEN_REVOCATION_PURGE_BATCH_SIZE", default=5000, cast=int
+)
+TOKEN_REVOCATION_PURGE_MAX_BATCHES = config(
+    "TOKEN_REVOCATION_PURGE_MAX_BATCHES", default=200, cast=int
+)
+
+# Accounts never activated nor verified are purged STALE_ACCOUNT_DAYS after
+# joining, either deleted or archived per STALE_ACCOUNT_ACTION. The job also
+# blanks expired security codes. Each batch of PURGE_BATCH_SIZE rows commits on
+# its own and is followed by PURGE_BATCH_SLEEP_SECONDS of sleep.
+STALE_ACCOUNT_DAYS = config("STALE_ACCOUNT_DAYS", default=30, cast=int)
+STALE_ACCOUNT_ACTION = config("STALE_ACCOUNT_ACTION", default="archive")
+PURGE_BATCH_SIZE = config("PURGE_BATCH_SIZE", default=500, cast=int)
+PURGE_BATCH_SLEEP_SECONDS = config("PURGE_BATCH_SLEEP_SECONDS", default=0.5, cast=float)
+PURGE_MAX_BATCHES = config("PURGE_MAX_BATCHES", default=200, cast=int)
+
+# Rows flagged as archived are moved to their model's archive table by an hourly
+# job, ARCHIVE_BATCH_SIZE rows per transaction, up to ARCHIVE_MAX_BATCHES per
+# model and run.
+ARCHIVE_BATCH_SIZE = config("ARCHIVE_BATCH_SIZE", default=500, cast=int)
+ARCHIVE_BATCH_SLEEP_SECONDS = config(
+    "ARCHIVE_BATCH_SLEEP_SECONDS", default=0.5, cast=float
+)
+ARCHIVE_MAX_BATCHES = config("ARCHIVE_MAX_BATCHES", default=200, cast=int)
+
+# Notifications are buffered in Redis for NOTIFICATION_BATCH_WINDOW seconds or
+# up to NOTIFICATION_BATCH_SIZE messages, then sent in one provider bulk call.
+NOTIFICATION_PROVIDER = config(
+    "NOTIFICATION_PROVIDER", default="accounts.notifications.LoggingProvider"
+)
+NOTIFICATION_BATCH_SIZE = config("NOTIFICATION_BATCH_SIZE", default=100, cast=int)
+NOTIFICATION_BATCH_WINDOW = config("NOTIFICATION_BATCH_WINDOW", default=0.2, cast=float)
+# Seconds a delivered dedupe key is remembered to drop duplicate sends
+NOTIFICATION_DEDUPE_TIMEOUT = config(
+    "NOTIFICATION_DEDUPE_TIMEOUT", default=3600, cast=int
+)
 
 # Sentry Settings
-sentry_sdk.init(
-    dsn=config("SENTRY_DSN", default=""),
-    integrations=[DjangoIntegration()],
-    traces_sample_rate=1.0,
-    send_default_pii=True,
+SENTRY_DSN = config("SENTRY_DSN", default="")
+
+# Share of requests traced per URL name, before scaling to the budget below.
+SENTRY_TRACES_SAMPLE_RATES = {
+    "v1:login": 0.01,
+    "v1:async-login": 0.01,
+    "v1:generate-otp": 0.01,
+    "v1:async-generate-otp": 0.01,
+    "v1:verify-otp": 0.01,
+    "v1:async-verify-otp": 0.01,
+    "v1:profile": 0.01,
+    "v1:async-profile": 0.01,
+    "v1:jwks": 0.0,
+    "prometheus-django-metrics": 0.0,
+}
+SENTRY_TRACES_DEFAULT_SAMPLE_RATE = config(
+    "SENTRY_TRACES_DEFAULT_SAMPLE_RATE", default=0.1, cast=float
+)
+# Traces sent per second by each worker process, at most.
+SENTRY_TRACES_PER_SECOND = config("SENTRY_TRACES_PER_SECOND", default=1.0, cast=float)
+# Requests slower than this, like server errors, are always traced.
+SENTRY_TRACES_SLOW_SECONDS = config(
+    "SENTRY_TRACES_SLOW_SECONDS", default=1.0, cast=float
 )
 
+init_sentry(SENTRY_DSN)
+
 PHONENUMBER_DEFAULT_REGION = "KE"
 
 
@@ -252,4 +485,18 @@ OAUTH2_PROVIDER = {
 
 GOOGLE_CLIENT_ID = config("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = config("GOOGLE_CLIENT_SECRET")
+# Point this at a local stand-in IdP to exercise the SSO flow offline.
+GOOGLE_OIDC_METADATA_URL = config(
+    "GOOGLE_OIDC_METADATA_URL",
+    default="https://accounts.google.com/.well-known/openid-configuration",
+)
+
+# OIDC metadata and key sets are cached for OIDC_CACHE_TTL seconds and reloaded
+# by Celery beat every OIDC_CACHE_REFRESH_SECONDS. An unknown `kid` forces a
+# reload at most once per OIDC_CACHE_MIN_RELOAD_SECONDS.
+OIDC_CACHE_TTL = config("OIDC_CACHE_TTL", default=86400, cast=int)
+OIDC_CACHE_MIN_RELOAD_SECONDS = config(
+    "OIDC_CACHE_MIN_RELOAD_SECONDS", default=60, cast=int
+)
+OIDC_FETCH_TIMEOUT = config("OIDC_FETCH_TIMEOUT", default=5, cast=float)
 SITE_URL = config("SITE_URL")
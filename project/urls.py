@@ -23,6 +23,8 @@ from django.urls import path, include
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include(("api.urls", "api"), namespace="v1")),
+    # Prometheus scrape endpoint at /metrics
+    path("", include("django_prometheus.urls")),
 ]
 
 # Media Assets